@@ -22,12 +22,13 @@ def main():
     end_date = (2017, 12, 31)
 
     gdelt_raw_data = "./data/gdelt"  # Specify the download directory
+    metrics_path = "./data/metrics"  # Time, rows and bytes per stage as JSON lines and Prometheus text files.
     # Create the downloader object
     # Parse the download page and extract all the links
     # Download the individual files and extract the content from the zip archives
 
     _ = input(f"Press 'Enter' to start the integration process ...")
-    integrator1 = GdeltIntegrator(start_date, end_date)
+    integrator1 = GdeltIntegrator(start_date, end_date, metrics_path=metrics_path)
     table_names_1 = ["data_management_fields", "event_geo", "actor1", "actor2",
                      "event_action", "eventid_and_date"]  # Smaller table list to fill.
     # Actually insert the data.
@@ -37,17 +38,12 @@ def main():
     #    integrator1.data, headers=integrator1.headers, seperator="\t", table_names=table_names_1)
     # results = integrator1.download_and_integrate(table_names=table_names_1)
 
-    # integrator2 = IncomeIntegrator()
-    # table_names_2 = ["income"]  # Smaller table list to fill.
+    # The Eurostat exports are loaded as downloaded, the countries are extracted along the way.
+    integrator2 = IncomeIntegrator(metrics_path=metrics_path)
+    integrator2.integrate()
 
-    # integrator2.insert_wrapper(
-    # integrator2.data, headers = integrator2.headers, table_names = table_names_2)
-
-    integrator3 = TourismIntegrator()
-    table_names_3 = ["tourist"]  # Smaller table list to fill.
-
-    integrator3.insert_wrapper(
-        integrator3.data, headers=integrator3.headers, table_names=table_names_3)
+    integrator3 = TourismIntegrator(metrics_path=metrics_path)
+    integrator3.integrate()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+
+import logging
+import pandas as pd
+
+from src.utils import memory_usage, peak_memory_usage, reset_peak_memory_usage
+
+from typing import Iterator, Optional
+
+
+class AdaptiveChunker(object):
+    """
+    Reads a file in chunks whose row count is adjusted to a memory budget, so a worker can load files of any size
+    without being OOM-killed while its COPY batches stay as large as possible.
+
+    For every chunk the bytes of the parsed DataFrame and the peak resident memory while it is processed are measured.
+    Their ratio (the amplification: copies made by the projections, the encoding and the COPY buffers) predicts the
+    peak of the next chunk, whose row count is chosen so this peak stays below {headroom} of the budget. The
+    amplification grows at once when a chunk needs more memory than expected and shrinks slowly, so the chunks don't
+    oscillate. The learned amplification is kept for the next files.
+    """
+
+    headroom = 0.85  # Share of the budget the predicted peak may use.
+    max_growth = 2.0  # Factor by which the chunk may grow from one chunk to the next.
+
+    def __init__(self, memory_budget: int, initial_rows: int = 100000, min_rows: int = 1000, max_rows: int = 2000000):
+        super().__init__()
+        self.memory_budget = memory_budget  # Bytes of resident memory the process may use.
+        self.min_rows = min_rows
+        self.max_rows = max_rows
+        self.rows = max(min_rows, min(initial_rows, max_rows))  # Rows of the next chunk.
+        self.amplification: Optional[float] = None  # Peak memory of a chunk per byte of its DataFrame.
+        self.file_peak = 0  # Peak resident memory while the last file was read, in bytes.
+
+    def chunks(self, reader) -> Iterator[pd.DataFrame]:
+        """
+        Generator that yields the chunks of a pandas reader (as returned by 'read_csv' with 'iterator=True'). The
+        size of each chunk is chosen after the previous one has been processed by the consumer.
+        """
+        self.file_peak = 0
+        while True:
+            baseline = memory_usage()
+            can_reset = reset_peak_memory_usage()
+            try:
+                df = reader.get_chunk(self.rows)
+            except StopIteration:
+                return
+            num_rows, chunk_bytes = len(df), int(df.memory_usage(deep=True).sum())
+
+            yield df
+            del df  # The consumer is done with the chunk.
+
+            # Without a resettable peak the memory after the chunk is the best guess.
+            peak = peak_memory_usage() if can_reset else memory_usage()
+            if baseline is None or peak is None:
+                continue  # Memory can't be measured here, the chunks keep their size.
+            self.file_peak = max(self.file_peak, peak)
+            self.adjust(num_rows, chunk_bytes, baseline, peak)
+
+    def adjust(self, num_rows: int, chunk_bytes: int, baseline: int, peak: int) -> None:
+        """
+        Learns the amplification from the last chunk and sets the rows of the next one.
+        """
+        if not num_rows or not chunk_bytes:
+            return
+
+        amplification = max(1.0, (peak - baseline) / chunk_bytes)
+        if self.amplification is None or amplification > self.amplification:
+            self.amplification = amplification
+        else:
+            self.amplification = 0.7 * self.amplification + 0.3 * amplification
+
+        available = self.memory_budget * self.headroom - (memory_usage() or baseline)
+        if available <= 0:
+            logging.warning(
+                f"The process uses more than {self.headroom:.0%} of its memory budget of {self.memory_budget / 2 ** 20:.0f} MB "
+                f"without a chunk, reading {self.min_rows} rows at a time.")
+            self.rows = self.min_rows
+            return
+
+        rows = int(available / (self.amplification * chunk_bytes / num_rows))
+        self.rows = max(self.min_rows, min(rows, int(self.rows * self.max_growth), self.max_rows))
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+
+import os
+import asyncio
+import logging
+import aiohttp
+from hashlib import md5
+
+from src.GdeltDownloader import GdeltDownloader
+
+from typing import Dict, List, Tuple, Optional, AsyncIterator
+
+
+class AsyncGdeltDownloader(GdeltDownloader):
+    """
+    Downloads the GDELT archives concurrently with asyncio. All requests share one session, so connections are reused,
+    and partially downloaded archives are resumed with HTTP range requests instead of being downloaded again.
+    """
+
+    def __init__(self, start_date: Tuple[int, int, int], end_date: Tuple[int, int, int], url: str = "http://data.gdeltproject.org/events/", dl_path: str = "./data/gdelt", max_concurrency: int = 8):
+        super().__init__(start_date, end_date, url, dl_path)
+        self.max_concurrency = max_concurrency
+
+    async def download_files(self, files: List[Dict], dl_path: str, retries: int = 5) -> AsyncIterator[Tuple[Dict, Optional[str], bool]]:
+        """Downloads the files concurrently and yields each one as soon as it is done, so a slow file doesn't hold up the rest.
+
+        Parameters
+        ----------
+        files : List[Dict]
+            Files to download, as returned by 'get_file_links'.
+        dl_path : str
+            Path to download files to.
+        retries : int, optional
+            Number of additional attempts per file, by default 5.
+
+        Yields
+        -------
+        Tuple[Dict, Optional[str], bool]
+            The file info, the local path of the archive (None if the download failed) and whether the md5 sum matches.
+        """
+        os.makedirs(dl_path, exist_ok=True)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        connector = aiohttp.TCPConnector(limit=self.max_concurrency)
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=60)
+
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            tasks = [asyncio.ensure_future(self.download_file_async(session, semaphore, file_obj, dl_path, retries))
+                     for file_obj in files]
+            try:
+                for task in asyncio.as_completed(tasks):
+                    yield await task
+            finally:
+                # Only has an effect if the consumer stops early.
+                for task in tasks:
+                    task.cancel()
+
+    def download_all(self, files: List[Dict], dl_path: str, retries: int = 5) -> List[Tuple[Dict, Optional[str], bool]]:
+        """
+        Blocking wrapper around 'download_files' that returns the results once all files are done.
+        """
+        async def collect():
+            return [result async for result in self.download_files(files, dl_path, retries)]
+
+        return asyncio.run(collect())
+
+    async def download_file_async(self, session: aiohttp.ClientSession, semaphore: asyncio.Semaphore, file_obj: Dict, dl_path: str, retries: int = 5) -> Tuple[Dict, Optional[str], bool]:
+        """
+        Downloads a single archive. The data is written to a '.part' file which is renamed once the md5 sum has been
+        checked. A broken connection keeps the '.part' file, so the next attempt resumes where the last one stopped.
+        """
+        filename = file_obj['file'].split('/')[-1]
+        zip_local_path = os.path.join(dl_path, filename)
+        part_local_path = zip_local_path + ".part"
+        uri = os.path.join(self.base_url, filename)
+        loop = asyncio.get_running_loop()
+
+        if os.path.isfile(zip_local_path):
+            if not file_obj['md5']:
+                return file_obj, zip_local_path, False  # Nothing to compare with, the archive is a complete download.
+            # Usually answered by the manifest. Otherwise the file is hashed, which is moved off the event loop.
+            if await loop.run_in_executor(None, self.is_verified, zip_local_path, file_obj):
+                logging.debug(f"Skipping download for: {zip_local_path}.")
+                return file_obj, zip_local_path, True
+            logging.info(f"'{zip_local_path}' doesn't match its md5 sum. Downloading it again.")
+            os.remove(zip_local_path)
+
+        async with semaphore:
+            for attempt in range(retries + 1):
+                try:
+                    md5_hash = await self.fetch(session, uri, part_local_path)
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    logging.info(
+                        f"Download of '{filename}' interrupted ({e!r}). {retries - attempt} attempts left.")
+                    continue
+
+                if md5_hash == file_obj['md5'] or not file_obj['md5']:
+                    os.replace(part_local_path, zip_local_path)
+                    if file_obj['md5']:
+                        self.record_checksum(zip_local_path, md5_hash)
+                    return file_obj, zip_local_path, bool(file_obj['md5'])
+
+                logging.info(
+                    f"MD5 mismatch. Retrying download for file '{filename}'. {retries - attempt} attempts left.")
+                os.remove(part_local_path)  # The data is corrupt, resuming it makes no sense.
+
+        # Out of attempts. A '.part' file of an interrupted download is kept, so the next run resumes it.
+        logging.error(f"Giving up on '{filename}'.")
+        return file_obj, None, False
+
+    async def fetch(self, session: aiohttp.ClientSession, uri: str, part_local_path: str) -> str:
+        """
+        Downloads {uri} to {part_local_path}, continuing an existing partial file with a range request.
+        Falls back to a full download if the server ignores the range, and starts over if it answers with a range that
+        doesn't start at the end of the partial file. Returns the md5 hexdigest of the complete file,
+        which is computed on the bytes as they arrive. Only the part that is resumed has to be read from disk again,
+        in a thread of the default executor so the other downloads keep running.
+        """
+        offset = os.path.getsize(part_local_path) if os.path.isfile(
+            part_local_path) else 0
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        loop = asyncio.get_running_loop()
+
+        async with session.get(uri, headers=headers) as response:
+            if response.status == 416:  # Range not satisfiable: The partial file is already complete.
+                return await loop.run_in_executor(None, self.md5sum, part_local_path)
+            response.raise_for_status()
+
+            if response.status == 206 and self.range_start(response.headers.get("Content-Range")) != offset:
+                # Appending the bytes would corrupt the file, so it is downloaded from the start.
+                logging.info(f"Server answered the range request for '{uri}' with "
+                             f"'{response.headers.get('Content-Range')}'. Starting over.")
+                response.release()
+                os.remove(part_local_path)
+                return await self.fetch(session, uri, part_local_path)
+
+            if response.status == 206:
+                mode = "ab"
+                file_hash = await loop.run_in_executor(None, self.hash_file, part_local_path)
+            else:
+                mode = "wb"
+                file_hash = md5()
+                if offset:
+                    logging.debug(
+                        f"Server ignored the range request for '{uri}'. Starting over.")
+
+            with open(part_local_path, mode) as f:
+                async for chunk in response.content.iter_chunked(self.chunk_size):
+                    f.write(chunk)
+                    file_hash.update(chunk)
+
+        return file_hash.hexdigest()
+
+    @staticmethod
+    def range_start(content_range: Optional[str]) -> Optional[int]:
+        """
+        Returns the first byte of a 'Content-Range' header ('bytes <start>-<end>/<size>'), or None if it has none.
+        """
+        try:
+            unit, byte_range = content_range.split(" ", 1)
+            return int(byte_range.split("-", 1)[0]) if unit == "bytes" else None
+        except (AttributeError, ValueError):
+            return None
+
+    def hash_file(self, file_path: str):
+        """
+        Returns the md5 object of the bytes in {file_path}, to be continued with the bytes that are appended.
+        """
+        file_hash = md5()
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(self.chunk_size), b""):
+                file_hash.update(chunk)
+        return file_hash
+
+
+if __name__ == "__main__":
+    start_date = (2015, 1, 1)
+    end_date = (2015, 1, 31)
+    downloader = AsyncGdeltDownloader(start_date, end_date)
+
+    for file_obj, local_path, is_md5_equal in downloader.download_all(downloader.get_file_links(), downloader.dl_path):
+        print(f"{'✔️' if is_md5_equal else '❌'} {local_path}")
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+
+import io
+import struct
+import numpy as np
+import pandas as pd
+
+from typing import List, Dict, Tuple
+
+
+class BinaryCopyWriter(object):
+    """
+    Encodes DataFrames into the PostgreSQL binary COPY format ('COPY ... FROM STDIN WITH (FORMAT binary)').
+    The values are sent in their binary representation, so the server does not have to parse any text.
+    """
+
+    signature = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+    trailer = struct.pack(">h", -1)
+
+    # Maps the column types from the schema to the numpy format and the byte width of the value.
+    formats: Dict[str, Tuple[str, int]] = {
+        "smallint": (">i2", 2),
+        "integer": (">i4", 4),
+        "bigint": (">i8", 8),
+        "real": (">f4", 4),
+        "float": (">f8", 8),
+        "double precision": (">f8", 8),
+    }
+
+    def __init__(self, types: List[str]):
+        super().__init__()
+        for pg_type in types:
+            if pg_type != "text" and pg_type not in self.formats:
+                raise ValueError(
+                    f"Type '{pg_type}' is not supported by the binary COPY writer.")
+        self.types = types
+
+    def encode(self, df: pd.DataFrame) -> io.BytesIO:
+        """
+        Returns a buffer with the complete COPY stream (header, tuples and trailer) for the DataFrame.
+        The columns of {df} have to be in the same order as the types given to the constructor.
+        """
+        if len(df.columns) != len(self.types):
+            raise ValueError(
+                f"Got {len(df.columns)} columns but {len(self.types)} types.")
+
+        buf = io.BytesIO()
+        buf.write(self.signature)
+        if len(df):
+            buf.write(self._encode_tuples(df).tobytes())
+        buf.write(self.trailer)
+        buf.seek(0)  # Reset read head to start of buffer
+        return buf
+
+    def _encode_tuples(self, df: pd.DataFrame) -> np.ndarray:
+        """
+        Encodes all tuples into one byte array without looping over the rows in Python. Each tuple is the field count
+        followed by the fields, each field is the length of the value (-1 for NULL) followed by the value itself.
+        """
+        rows = len(df)
+        fields = [self._encode_column(df.iloc[:, i], pg_type)
+                  for i, pg_type in enumerate(self.types)]
+
+        # Byte offset of every tuple and of every field inside the output.
+        tuple_sizes = 2 + sum(4 + lengths for _, lengths in fields)
+        tuple_starts = np.zeros(rows, dtype=np.int64)
+        np.cumsum(tuple_sizes[:-1], out=tuple_starts[1:])
+
+        out = np.empty(int(tuple_sizes.sum()), dtype=np.uint8)
+        self._scatter(out, tuple_starts, np.full(rows, len(self.types), dtype=">i2"))
+
+        field_starts = tuple_starts + 2
+        for payload, lengths in fields:
+            prefixes = np.where(lengths > 0, lengths, -1).astype(">i4")
+            self._scatter(out, field_starts, prefixes)
+
+            # Copy the variable length values to their fields: every byte of the payload gets the start of its field
+            # plus its position inside the value as destination.
+            value_starts = np.repeat(field_starts + 4, lengths)
+            payload_starts = np.repeat(np.cumsum(lengths) - lengths, lengths)
+            out[value_starts + np.arange(len(payload)) - payload_starts] = payload
+
+            field_starts = field_starts + 4 + lengths
+
+        return out
+
+    def _scatter(self, out: np.ndarray, starts: np.ndarray, values: np.ndarray) -> None:
+        """
+        Writes the bytes of the fixed width {values} to the positions {starts} of {out}.
+        """
+        width = values.dtype.itemsize
+        out[starts[:, None] + np.arange(width)] = values.view(
+            np.uint8).reshape(-1, width)
+
+    def _encode_column(self, series: pd.Series, pg_type: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Encodes a single column. Returns the concatenated values as bytes and the length of every value in bytes,
+        where NULL has a length of 0 (An empty string is NULL as well, just like in the text format). Values the server
+        would reject in the text format (no number, not an integer or out of range) raise a ValueError.
+        """
+        if pg_type == "text":
+            values = series.astype(str).where(series.notna(), "").to_numpy()
+            # Encode the whole column in one go and use the separators to find the length of each value.
+            # The NUL character can't appear in a text column of PostgreSQL, so it is safe to use as a separator.
+            encoded = np.frombuffer(
+                "\x00".join(values).encode("utf8"), dtype=np.uint8)
+            separators = np.flatnonzero(encoded == 0)
+            ends = np.append(separators, len(encoded))
+            lengths = ends - np.append(0, separators + 1)
+            return encoded[encoded != 0], lengths
+
+        fmt, width = self.formats[pg_type]
+        dtype = np.dtype(fmt)
+        if pd.api.types.is_numeric_dtype(series.dtype):
+            numbers = series
+        else:
+            # Empty strings become NaN, which is written as NULL.
+            values = series.astype(object)
+            numbers = pd.to_numeric(values.where(values != "", None), errors="coerce")
+            invalid = numbers.isna() & values.notna() & (values != "")
+            if invalid.any():
+                raise ValueError(f"Column {series.name} has the value {values[invalid].iloc[0]!r}, which is not a "
+                                 f"number of type {pg_type}.")
+        valid = numbers.notna().to_numpy()
+        present = numbers[valid]
+
+        # The cast would silently truncate and wrap the values, where the text format is rejected by the server.
+        if dtype.kind == "i" and len(present):
+            info = np.iinfo(dtype)
+            if present.min() < info.min or present.max() > info.max:
+                raise ValueError(f"Column {series.name} has values out of the range of type {pg_type}.")
+            if present.dtype.kind == "f" and (present % 1 != 0).any():
+                raise ValueError(f"Column {series.name} has values that are not integers, as type {pg_type} needs.")
+
+        with np.errstate(over="ignore"):  # Overflows are found below.
+            payload = present.to_numpy(dtype=dtype)
+        if dtype.kind == "f" and (np.isinf(payload) & np.isfinite(present.to_numpy(dtype=np.float64))).any():
+            raise ValueError(f"Column {series.name} has values out of the range of type {pg_type}.")
+        lengths = np.where(valid, width, 0)
+        return payload.view(np.uint8), lengths
+
+
+if __name__ == "__main__":
+    from time import perf_counter
+    from argparse import ArgumentParser
+    from src.GdeltIntegrator import GdeltIntegrator
+
+    parser = ArgumentParser(
+        description="Compare the text and the binary COPY path on a GDELT export. All inserts are rolled back.")
+    parser.add_argument("file", help="Extracted GDELT export (tab separated).")
+    args = parser.parse_args()
+
+    integrator = GdeltIntegrator((2015, 1, 1), (2015, 1, 1))
+    table_names = ["data_management_fields", "event_geo", "actor1", "actor2",
+                   "event_action", "eventid_and_date"]
+    df = integrator.read_csv(args.file, headers=integrator.headers, seperator="\t",
+                             columns=integrator.projection(table_names, integrator.headers), dtypes=integrator.dtypes)
+    conn, cur = integrator.connect_database(autocommit=False)
+
+    for table_name in table_names:
+        for copy_format in ["text", "binary"]:
+            integrator.tables[table_name]["copy_format"] = copy_format
+            start = perf_counter()
+            integrator.insert_data2(conn, cur, df, table_name)
+            duration = perf_counter() - start
+            conn.rollback()
+            print(
+                f"{table_name:>24} {copy_format:>6}: {len(df) / duration:12,.0f} rows/s")
+
+    integrator.release_connection(conn, cur)
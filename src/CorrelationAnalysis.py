@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+
+import numpy as np
+import pandas as pd
+
+from src.DataIntegrator import DataIntegrator
+
+from typing import List, Dict, Tuple, Iterable, Optional
+
+
+class CorrelationAnalysis(object):
+    """
+    Correlates the tourist nights with the GDELT events and the income of every country over a range of lags. The data
+    is loaded once from the integrated schema into arrays of countries x time, all countries and lags are then
+    computed in one go with NumPy. Results are cached per set of arguments.
+    """
+
+    # Maps the country names of the Eurostat exports to the FIPS 10-4 codes GDELT uses for the event locations.
+    fips_codes: Dict[str, str] = {
+        "Albania": "AL", "Austria": "AU", "Belgium": "BE", "Bulgaria": "BU", "Croatia": "HR", "Cyprus": "CY",
+        "Czechia": "EZ", "Denmark": "DA", "Estonia": "EN", "Finland": "FI", "France": "FR",
+        "Germany (until 1990 former territory of the FRG)": "GM", "Greece": "GR", "Hungary": "HU", "Iceland": "IC",
+        "Ireland": "EI", "Italy": "IT", "Latvia": "LG", "Liechtenstein": "LS", "Lithuania": "LH", "Luxembourg": "LU",
+        "Malta": "MT", "Montenegro": "MJ", "Netherlands": "NL", "North Macedonia": "MK", "Norway": "NO",
+        "Poland": "PL", "Portugal": "PO", "Romania": "RO", "Serbia": "RI", "Slovakia": "LO", "Slovenia": "SI",
+        "Spain": "SP", "Sweden": "SW", "Switzerland": "SZ", "Turkey": "TU", "United Kingdom": "UK",
+    }
+
+    # Event measures that can be correlated, computed from the sums of 'event_rollup_monthly'.
+    metrics = ["events", "articles", "tone", "goldstein"]
+
+    # The exports hold one row per country and month (or year) for every combination of these attributes, which can't
+    # be added up. By default the total nights in all accommodations and the mean income in Euro of all adults are used.
+    # The income export has no total over the citizenships, so the citizens of the country itself are taken.
+    tourist_defaults: Dict[str, str] = {
+        "RESID": "Total", "Unit": "Number",
+        "Accommodation": "Hotels; holiday and other short-stay accommodation; camping grounds, recreational vehicle parks and trailer parks",
+    }
+    income_defaults: Dict[str, str] = {
+        "Unit": "Euro", "Type": "Mean equivalised net income", "Sex": "Total", "AgeGroup": "18 years or over",
+        "Citizens": "Reporting country",
+    }
+
+    def __init__(self, integrator: DataIntegrator, tourist_filters: Dict[str, str] = None, income_filters: Dict[str, str] = None):
+        """
+        The filters select the rows of the 'tourist' and 'income' tables by attribute (e.g. {"Unit": "Euro"}), the
+        remaining rows are summed up (tourist) or averaged (income) per country and month or year. Filters that are
+        given replace the defaults ('tourist_defaults' and 'income_defaults') of their table.
+        """
+        super().__init__()
+        self.integrator = integrator
+        self.tourist_filters = tourist_filters if tourist_filters is not None else dict(self.tourist_defaults)
+        self.income_filters = income_filters if income_filters is not None else dict(self.income_defaults)
+        self.results: Dict[Tuple, pd.DataFrame] = {}
+        self.loaded = False
+
+    def load(self) -> None:
+        """
+        Loads the tourist nights, the income and the monthly event rollups and aligns them on the same countries and
+        months (or years). Missing values are NaN. Clears the cached results.
+        """
+        conn, cur = self.integrator.connect_database(autocommit=True)
+        try:
+            tourism = self.query(cur, "SELECT CID, Time, SUM(Value)::float8 FROM tourist WHERE Value IS NOT NULL",
+                                 self.tourist_filters, "GROUP BY CID, Time", ["country", "time", "value"])
+            income = self.query(cur, "SELECT CID, Year, AVG(Value)::float8 FROM income WHERE Value IS NOT NULL",
+                                self.income_filters, "GROUP BY CID, Year", ["country", "year", "value"])
+            cur.execute("SELECT r.MonthYear, r.CountryCode, e.Code, SUM(r.NumEvents)::float8, SUM(r.NumArticles)::float8, "
+                        "SUM(r.SumAvgTone), SUM(r.SumGoldsteinScale) "
+                        "FROM event_rollup_monthly r JOIN cameo_eventcode e ON e.ID = r.EventRootCode "
+                        "GROUP BY 1, 2, 3")
+            events = pd.DataFrame(cur.fetchall(), columns=[
+                "month", "fips", "root", "events", "articles", "tone", "goldstein"])
+        finally:
+            self.integrator.release_connection(conn, cur)
+
+        # Eurostat months look like '2015M01'.
+        tourism["month"] = pd.to_numeric(tourism["time"].str.replace("M", ""), errors="coerce")
+        tourism = tourism[tourism["country"].isin(self.fips_codes.keys()) & tourism["month"].notna()]
+
+        self.countries = sorted(set(tourism["country"]))
+        fips = [self.fips_codes[country] for country in self.countries]
+        # Every month and year in between, so a lag of one step is always one month (or year).
+        self.months = self.month_range(set(tourism["month"].astype(int)) | set(events["month"]))
+        years = set(self.months // 100) | set(income["year"])
+        self.years = np.arange(min(years), max(years) + 1) if years else np.array([], dtype=int)
+
+        self.tourism = self.align(tourism, "country", self.countries, "month", self.months, "value")
+        self.income = self.align(income, "country", self.countries, "year", self.years, "value")
+        # Yearly nights, NaN unless all twelve months are known.
+        self.tourism_yearly = np.full((len(self.countries), len(self.years)), np.nan)
+        for i, year in enumerate(self.years):
+            in_year = self.months // 100 == year
+            if in_year.sum() == 12:
+                self.tourism_yearly[:, i] = self.tourism[:, in_year].sum(axis=1)
+
+        # Events as countries x root codes x months, so a selection of root codes is just a sum over an axis.
+        self.root_codes = sorted(set(events["root"]))
+        events = events[events["fips"].isin(fips)]
+        self.events = {}
+        for metric in self.metrics:
+            frame = events.assign(key=events["fips"] + "|" + events["root"])
+            keys = [f"{f}|{root}" for f in fips for root in self.root_codes]
+            self.events[metric] = self.align(frame, "key", keys, "month", self.months, metric).reshape(
+                len(fips), len(self.root_codes), len(self.months))
+
+        self.results = {}
+        self.loaded = True
+
+    @staticmethod
+    def month_range(months: Iterable[int]) -> np.ndarray:
+        """
+        Returns all months (as YYYYMM) from the first to the last of {months}.
+        """
+        months = sorted(months)
+        if not months:
+            return np.array([], dtype=int)
+        first, last = months[0], months[-1]
+        index = np.arange((first // 100) * 12 + first % 100 - 1, (last // 100) * 12 + last % 100)
+        return (index // 12) * 100 + index % 12 + 1
+
+    def query(self, cur, select: str, filters: Dict[str, str], group_by: str, columns: List[str]) -> pd.DataFrame:
+        """
+        Runs the SELECT with a condition for every filter and returns the result with the given {columns}.
+        """
+        conditions = "".join(f" AND {attribute} = %s" for attribute in filters)
+        cur.execute(f"{select}{conditions} {group_by}", list(filters.values()))
+        return pd.DataFrame(cur.fetchall(), columns=columns)
+
+    def align(self, df: pd.DataFrame, row: str, rows: List, column: str, columns: Iterable, value: str) -> np.ndarray:
+        """
+        Pivots the long DataFrame into an array with one row per entry of {rows} and one column per entry of {columns}.
+        """
+        if df.empty:
+            return np.full((len(rows), len(columns)), np.nan)
+        pivot = df.pivot_table(index=row, columns=column, values=value, aggfunc="sum")
+        return pivot.reindex(index=rows, columns=columns).to_numpy(dtype=float)
+
+    def event_series(self, metric: str, root_codes: Optional[List[str]] = None) -> np.ndarray:
+        """
+        Returns the event measure as countries x months for the given root codes (e.g. ['14'] for protests, all if None).
+        Tone and Goldstein scale are averages per event.
+        """
+        if metric not in self.metrics:
+            raise ValueError(f"Unknown metric '{metric}', use one of {self.metrics}.")
+
+        selected = [self.root_codes.index(code) for code in root_codes if code in self.root_codes] if root_codes else slice(None)
+        values = np.nansum(self.events[metric][:, selected, :], axis=1)
+        if metric in ("tone", "goldstein"):
+            counts = np.nansum(self.events["events"][:, selected, :], axis=1)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                values = values / counts
+        # Months without any event are unknown rather than zero, GDELT covers every month it has data for.
+        values[np.isnan(self.events["events"][:, selected, :]).all(axis=1)] = np.nan
+        return values
+
+    def events_vs_tourism(self, metric: str = "events", lags: Iterable[int] = range(13), method: str = "pearson", root_codes: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        Correlates the event measure of every month with the tourist nights {lag} months later, for all countries and
+        lags. Returns one row per country and lag with the correlation 'r' and the number of months 'n' it is based on.
+        """
+        key = ("events", metric, tuple(lags), method, tuple(root_codes) if root_codes else None)
+        if key not in self.results:
+            self.ensure_loaded()
+            r, n = self.correlate(self.event_series(metric, root_codes), self.tourism, list(lags), method)
+            self.results[key] = self.to_frame(r, n, list(lags))
+        return self.results[key]
+
+    def income_vs_tourism(self, lags: Iterable[int] = range(4), method: str = "pearson") -> pd.DataFrame:
+        """
+        Correlates the income of every year with the tourist nights {lag} years later. See 'events_vs_tourism'.
+        """
+        key = ("income", tuple(lags), method)
+        if key not in self.results:
+            self.ensure_loaded()
+            r, n = self.correlate(self.income, self.tourism_yearly, list(lags), method)
+            self.results[key] = self.to_frame(r, n, list(lags))
+        return self.results[key]
+
+    def ensure_loaded(self) -> None:
+        if not self.loaded:
+            self.load()
+
+    def to_frame(self, r: np.ndarray, n: np.ndarray, lags: List[int]) -> pd.DataFrame:
+        return pd.DataFrame({
+            "country": np.tile(self.countries, len(lags)),
+            "lag": np.repeat(lags, len(self.countries)),
+            "r": r.ravel(),
+            "n": n.ravel(),
+        })
+
+    @staticmethod
+    def correlate(x: np.ndarray, y: np.ndarray, lags: List[int], method: str = "pearson", min_periods: int = 3) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Correlates x (shifted by every lag) with y along the last axis. Both are countries x time with NaN for missing
+        values, only the time steps where both are known count. Returns r and the number of time steps, both as
+        lags x countries. Spearman is Pearson on the ranks of the values.
+        """
+        length = x.shape[-1]
+        shifted = np.full((len(lags),) + x.shape, np.nan)
+        for i, lag in enumerate(lags):
+            if lag < length:
+                shifted[i, ..., lag:] = x[..., :length - lag]
+        target = np.broadcast_to(y, shifted.shape)
+
+        valid = ~np.isnan(shifted) & ~np.isnan(target)
+        a = np.where(valid, shifted, np.nan)
+        b = np.where(valid, target, np.nan)
+        if method == "spearman":
+            a = pd.DataFrame(a.reshape(-1, length)).rank(axis=1).to_numpy().reshape(a.shape)
+            b = pd.DataFrame(b.reshape(-1, length)).rank(axis=1).to_numpy().reshape(b.shape)
+        elif method != "pearson":
+            raise ValueError(f"Unknown method '{method}', use 'pearson' or 'spearman'.")
+
+        n = valid.sum(axis=-1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            a = a - np.nansum(a, axis=-1, keepdims=True) / n[..., None]
+            b = b - np.nansum(b, axis=-1, keepdims=True) / n[..., None]
+            cov = np.nansum(a * b, axis=-1)
+            r = cov / np.sqrt(np.nansum(a * a, axis=-1) * np.nansum(b * b, axis=-1))
+        r[n < min_periods] = np.nan
+        return r, n
+
+
+if __name__ == "__main__":
+    from time import perf_counter
+    from src.GdeltIntegrator import GdeltIntegrator
+
+    analysis = CorrelationAnalysis(GdeltIntegrator((2015, 1, 1), (2015, 1, 1)))
+    analysis.load()
+
+    start = perf_counter()
+    results = {(metric, method): analysis.events_vs_tourism(metric, method=method)
+               for metric in CorrelationAnalysis.metrics for method in ["pearson", "spearman"]}
+    print(f"{len(results)} sweeps over {len(analysis.countries)} countries in {perf_counter() - start:.3f} s")
+
+    for (metric, method), result in results.items():
+        best = result.dropna().sort_values("r", key=abs, ascending=False).head(3)
+        print(f"--- {metric} ({method})")
+        print(best.to_string(index=False))
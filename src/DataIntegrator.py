@@ -7,15 +7,48 @@ from tqdm import tqdm
 import logging
 import psycopg2
 import pandas as pd
+from zipfile import ZipFile
+from contextlib import contextmanager
 from getpass import getpass
 from dotenv import load_dotenv
-from psycopg2.errors import UniqueViolation, InFailedSqlTransaction
+from time import monotonic
+from psycopg2.pool import ThreadedConnectionPool, PoolError
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+from psycopg2.errors import UniqueViolation, InFailedSqlTransaction, DeadlockDetected
 
 from src.utils import *
+from src.BinaryCopyWriter import BinaryCopyWriter
+from src.KeyCache import KeyCache
+from src.PipelineMetrics import PipelineMetrics
+from src.AdaptiveChunker import AdaptiveChunker
+from src.FanoutWriter import FanoutWriter
 
-from typing import Tuple, Generator, List
-logging.basicConfig(filename='./data/gdelt.log',
-                    filemode='w', level=logging.ERROR)
+from typing import Tuple, Generator, List, Dict, Optional, Iterable
+
+
+class _TrackingConnectionPool(ThreadedConnectionPool):
+    """
+    Connection pool that opens connections lazily, keeps up to {maxconn} of them open when they are returned, and
+    remembers which pool every connection it hands out belongs to.
+    """
+
+    def __init__(self, minconn: int, maxconn: int, *args, **kwargs):
+        super().__init__(minconn, maxconn, *args, **kwargs)
+        # The base class closes returned connections beyond 'minconn', but only opens 'minconn' at the start.
+        self.minconn = maxconn
+
+    def getconn(self, key=None):
+        conn = super().getconn(key)
+        _pool_of_connection[id(conn)] = self
+        return conn
+
+
+# Connection pools of this process by (host, port, dbname, user), shared by all integrators.
+_pools: Dict[Tuple, ThreadedConnectionPool] = {}
+_pools_pid = os.getpid()
+_inherited_pools: List[ThreadedConnectionPool] = []
+_pool_of_connection: Dict[int, ThreadedConnectionPool] = {}
+_last_used: Dict[int, float] = {}
 
 
 class DataIntegrator(object):
@@ -23,71 +56,237 @@ class DataIntegrator(object):
     Base class for data integrator classes. Provides database connection and file reader functionality.
     """
 
-    def __init__(self, table_names, tables):
+    # Maps the column headers to the types used for parsing. Without it every column is parsed as string.
+    dtypes: Dict[str, str] = None
+    header_rows = 0  # Lines at the start of every file that aren't data (e.g. a header line).
+
+    # Settings of every database session, tuned for bulk loading. A crash can lose the last few commits with
+    # 'synchronous_commit' off, which the ingestion ledger handles by loading those files again.
+    session_settings: Dict[str, str] = {
+        "synchronous_commit": "off",
+        "work_mem": "64MB",
+        "maintenance_work_mem": "512MB",
+    }
+    pool_size = 32  # Maximum number of connections per database and process, 'fanout' takes one per table and load.
+    key_cache_size = 250000  # Maximum number of keys remembered per dimension table.
+    merge_retries = 3  # Additional attempts of a merge into a dimension table that deadlocked, see 'merge_dimension'.
+    health_check_interval = 60.0  # Seconds a pooled connection may be idle before it is pinged on checkout.
+    # Lookup tables for the 'encodings' of the table specs, mapped to a tab separated file with their codes and labels.
+    dictionaries: Dict[str, str] = {}
+
+    def __init__(self, table_names, tables, metrics_path: str = None):
         super().__init__()
         self.table_script = "./schema/prepare_database.psql"
         self.table_names = table_names
         self.tables = tables
+        self.key_caches: Dict[str, KeyCache] = {}  # Loaded keys of the dimension tables, see 'key_cache'.
+        self.partitions: Dict[str, set] = {}  # Months that have a partition, per partitioned table.
+        self.code_ids: Dict[str, Dict[str, int]] = {}  # Code -> ID of every lookup table, see 'dictionary_ids'.
+        self.rollup_partials: Dict[str, List[pd.DataFrame]] = {}  # Aggregates of the current file, see 'accumulate_rollup'.
+        # Time, rows and bytes of every stage, written to {metrics_path} if given. See 'PipelineMetrics'.
+        self.metrics = PipelineMetrics(metrics_path, name=type(self).__name__)
+        # Sizes the streamed chunks to a memory budget instead of a fixed row count, see 'read_csv_chunks'.
+        self.chunker: Optional[AdaptiveChunker] = None
+        # Writes the tables of a file in parallel over one connection each, see 'FanoutWriter'.
+        self.fanout = False
+
+    def read_csv(self, file_path: str, headers: List[str] = None, limit: int = None, seperator: str = ",", columns: List[str] = None, dtypes: Dict[str, str] = None) -> pd.DataFrame:
+        """
+        Reads the whole file into a DataFrame. See 'csv_options' for {columns} and {dtypes}.
+        """
+        with self.open_file(file_path) as f:
+            return pd.read_csv(f, nrows=limit, sep=seperator, names=headers, encoding="utf8", low_memory=False,
+                               skiprows=self.header_rows, **self.csv_options(columns, dtypes))
 
-    def read_csv(self, file_path: str, headers: List[str] = None, limit: int = None, seperator: str = ",") -> pd.DataFrame:
+    def read_csv_chunks(self, file_path: str, headers: List[str] = None, chunksize: int = 100000, seperator: str = ",", columns: List[str] = None, dtypes: Dict[str, str] = None) -> Generator[pd.DataFrame, None, None]:
         """
-        Generator that yields lines of a file.
+        Generator that yields the file in DataFrames of at most {chunksize} rows, so only one chunk is held in memory at a time.
+        With a {chunker} the rows of every chunk are chosen to fit its memory budget instead, starting at {chunksize}.
         """
-        with open(file_path, mode="r", encoding="utf8") as f:
-            if limit:
-                data = pd.read_csv(f, nrows=limit, sep=seperator,
-                                   names=headers, encoding="utf8", na_filter=False, na_values=":", thousands=" ", low_memory=False)
-            else:
-                data = pd.read_csv(
-                    f, sep=seperator, names=headers, encoding="utf8", na_filter=False, na_values=":", thousands=" ", low_memory=False)
+        with self.open_file(file_path) as f:
+            # 'low_memory' would parse every chunk in smaller pieces, whose categoricals can't be joined if a column is
+            # empty in one of them.
+            reader = pd.read_csv(f, sep=seperator, names=headers, encoding="utf8", chunksize=chunksize, low_memory=False,
+                                 skiprows=self.header_rows, **self.csv_options(columns, dtypes))
+            for chunk in (self.chunker.chunks(reader) if self.chunker else reader):
+                yield chunk
+
+    @contextmanager
+    def open_file(self, file_path: str) -> Generator[io.TextIOBase, None, None]:
+        """
+        Opens the file for reading. A '.zip' archive isn't extracted, instead its first member is decompressed on the fly.
+        """
+        if not file_path.lower().endswith(".zip"):
+            with open(file_path, mode="r", encoding="utf8") as f:
+                yield f
+            return
 
-            return data
+        with ZipFile(file_path, mode="r") as archive:
+            with archive.open(archive.namelist()[0], mode="r") as member:
+                yield io.TextIOWrapper(member, encoding="utf8")
+
+    def csv_options(self, columns: List[str] = None, dtypes: Dict[str, str] = None) -> Dict:
+        """
+        Returns the parser options for 'pandas.read_csv'. Only the {columns} are parsed (all if None).
+        Without {dtypes} every value is kept as a string, empty values included. With {dtypes} the columns are parsed
+        to the given types and only empty values become NaN ('NA' is a valid country code, so the default NaN markers are off).
+        """
+        if not dtypes:
+            return {"usecols": columns, "na_filter": False, "na_values": ":", "thousands": " "}
+
+        if columns:
+            dtypes = {column: dtypes[column]
+                      for column in columns if column in dtypes}
+        return {"usecols": columns, "dtype": dtypes, "keep_default_na": False, "na_values": [""]}
+
+    def projection(self, table_names: List[str], headers: List[str]) -> List[str]:
+        """
+        Returns the columns of the file that are needed to fill the given tables, in the order of {headers}.
+        """
+        needed = set()
+        for table_name in table_names:
+            columns = self.tables[table_name].get("headers", [])
+            if columns and isinstance(columns[0], list):
+                columns = [column for more_columns in columns for column in more_columns]
+            needed.update(columns)
+
+        return [header for header in headers if header in needed]
 
     def connect_database(self, host: str = "localhost", port: int = 5432, dbname: str = None, user: str = None, passwd: str = None, autocommit: bool = False) -> Tuple:
+        """
+        Takes a connection from the connection pool of the database (the pool is created on first use) and returns it
+        together with a new cursor. Hand it back with 'release_connection' instead of closing it.
+        Raises a PoolError if all {pool_size} connections of the pool are in use, and a psycopg2.OperationalError if the
+        server can't be reached or rejects the login.
+        """
+        pool = self.connection_pool(host, port, dbname, user, passwd)
+        try:
+            conn = pool.getconn()
+
+            # Replace connections that died while they were idle in the pool.
+            while not self.connection_is_healthy(conn):
+                logging.info("Replacing a broken database connection.")
+                _pool_of_connection.pop(id(conn), None)
+                pool.putconn(conn, close=True)
+                conn = pool.getconn()
+        except PoolError as e:
+            logging.error(f"All {self.pool_size} connections to the database are in use: {e}")
+            raise e
+        except psycopg2.Error as e:
+            logging.error(f"Could not connect to database: {e}")
+            raise e
+
+        conn.autocommit = autocommit
+        return conn, conn.cursor()
+
+    def release_connection(self, conn, cur=None) -> None:
+        """
+        Hands a connection from 'connect_database' back to its pool. An open transaction is rolled back first.
+        """
+        if cur is not None and not cur.closed:
+            cur.close()
+
+        pool = _pool_of_connection.pop(id(conn), None)
+        if pool is None:  # Not from a pool (or the pool is gone), just close it.
+            conn.close()
+            return
+
+        broken = bool(conn.closed)
+        if not broken and conn.info.transaction_status != TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                broken = True
+
+        _last_used[id(conn)] = monotonic()
+        pool.putconn(conn, close=broken)
+
+    def connection_pool(self, host: str = "localhost", port: int = 5432, dbname: str = None, user: str = None, passwd: str = None) -> ThreadedConnectionPool:
+        """
+        Returns the connection pool for the database, shared by all integrators of the process.
+        New connections get the {session_settings} as startup options, so configuring them costs no extra round trip.
+        """
+        global _pools, _pools_pid
+
+        # A forked child must not use the connections of its parent. They are kept referenced, because closing
+        # (or garbage collecting) them would also end the session of the parent.
+        if _pools_pid != os.getpid():
+            _inherited_pools.extend(_pools.values())
+            _pools, _pools_pid = {}, os.getpid()
+
+        key = (host, port, dbname, user)
+        if key in _pools:
+            return _pools[key]
+
         load_dotenv()
         try:
             dbname = dbname if dbname else os.environ["POSTGRES_DB"]
             user = user if user else os.environ["POSTGRES_USER"]
             passwd = passwd if passwd else os.environ["POSTGRES_PASSWORD"]
         except KeyError as e:
-            print(e)
             logging.error(
-                "Couldn't load database credentials from environment. Using defaults.")
+                f"Couldn't load database credentials from environment (missing {e}). Using defaults.")
             dbname = "db-proj-hs19"
             user = "db-proj"
             passwd = getpass(
                 f"Enter password for database {dbname.upper()} and user {user.upper()}:")
 
-        try:
-            conn = psycopg2.connect(
-                host=host, port=port, dbname=dbname, user=user, password=passwd)
-            if autocommit:
-                conn.set_session(autocommit=True)
-            cur = conn.cursor()
+        options = " ".join(
+            f"-c {name}={value}" for name, value in self.session_settings.items())
+        pool = _TrackingConnectionPool(0, self.pool_size, host=host, port=port, dbname=dbname, user=user,
+                                       password=passwd, options=options)
+        _pools[key] = pool
+        logging.info(
+            f"Created connection pool for {user}@{host}:{port}/{dbname} with settings '{options}'.")
 
-            cur.execute("SELECT version()")
-            logging.info(f"Connected to: {cur.fetchone()}")
+        return pool
 
-            return conn, cur
+    def connection_is_healthy(self, conn) -> bool:
+        """
+        Checks a pooled connection. Connections that were idle for longer than {health_check_interval} seconds are
+        pinged, recently used ones are trusted, so the check usually costs no round trip.
+        """
+        if conn.closed:
+            return False
 
-        except Exception as e:
-            print(e)
-            logging.error("Could not connect to database!")
-            return None, None
+        last_used = _last_used.get(id(conn))
+        if last_used is None or monotonic() - last_used < self.health_check_interval:
+            return True
+
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    @staticmethod
+    def close_pools() -> None:
+        """
+        Closes all connections of the pools of this process.
+        """
+        global _pools
+        if _pools_pid == os.getpid():
+            for pool in _pools.values():
+                pool.closeall()
+        _pools = {}
 
     def execute_script(self, script_path: str) -> None:
         logging.info(f"Executing script '{script_path}' ...")
         conn, cur = self.connect_database(autocommit=True)
 
-        with open(script_path, "r") as script_handle:
-            cur.execute(script_handle.read())
-
-        cur.close()
-        conn.close()
+        try:
+            with open(script_path, "r") as script_handle:
+                cur.execute(script_handle.read())
+        finally:
+            self.release_connection(conn, cur)
 
     def insert_data(self, conn, cur, row: pd.DataFrame, table_name: str) -> None:
         """
         Inserts the row into the database specified by conn, cur. The {table_name} specifies the table to be inserted into.
+        The codes of the 'encodings' are replaced with their IDs and the partition of the month is created if missing,
+        just like 'insert_data2' does. Tables with a 'rollup' are only filled by 'insert_wrapper2'.
         """
         try:
             columns = self.tables[table_name]["headers"]
@@ -95,91 +294,52 @@ class DataIntegrator(object):
             logging.error(
                 f"You forgot to specify the 'headers' on table {table_name}.")
             raise e
+        if self.tables[table_name].get("rollup"):
+            raise ValueError(
+                f"Table {table_name} is a rollup, which is only filled by 'insert_wrapper2'.")
 
-        # Check if the element is a nested list and extract it.
-        if isinstance(columns[0], list):
-            for more_columns in columns:
-                # Generate enough parameters for query string.
-                parameter_string = ','.join(['%s']*len(more_columns))
-
-                # Extract relevant columns from dataframe and cast it to a list.
-                row_list = row[more_columns].values.tolist()
-
-                # Do not perform insert if the first value is empty (which is always the primary key).
-                if not row_list[0]:
-                    continue
-
-                # Cast empty values to None for DB adapter to work.
-                row_list = [None if not x else x for x in row_list]
-                # print(f"--- {row_list}")
-
-                try:
-                    attribute_string = ','.join(
-                        self.tables[table_name]["attributes"])
-                    unique_string = ','.join(
-                        self.tables[table_name]["uniques"])
-                except KeyError as e:
-                    logging.error(
-                        f"Your forgot to specify either the 'attributes' or the 'uniques' ont the table {table_name}")
-                    raise e
-
-                # Catch uniqueness constraint with "UPSERT" method
-                if not unique_string:
-                    insert_string = f"INSERT INTO {table_name} ({attribute_string}) VALUES ({parameter_string})"
-                else:
-                    insert_string = f"INSERT INTO {table_name} ({attribute_string}) VALUES ({parameter_string}) ON CONFLICT ({unique_string}) DO NOTHING"
-
-                try:
-                    cur.execute(insert_string, row_list)
-                except UniqueViolation as e:
-                    logging.error(
-                        f"Something went wrong during inserting into: {table_name}")
-                    logging.info(e)
-                except InFailedSqlTransaction as e:
-                    logging.error(
-                        f"Transaction stopped. Rolling back...: {table_name}")
-                    logging.info(e)
-                    # conn.rollback()
-                    pass
-
-        else:
-            # Generate enough parameters for query string.
-            parameter_string = ','.join(['%s']*len(columns))
-
+        try:
+            attributes = self.tables[table_name]["attributes"]
+            uniques = self.tables[table_name]["uniques"]
+        except KeyError as e:
+            logging.error(
+                f"Your forgot to specify either the 'attributes' or the 'uniques' ont the table {table_name}")
+            raise e
+        attribute_string = ','.join(attributes)
+        # Generate enough parameters for query string.
+        parameter_string = ','.join(['%s']*len(attributes))
+        encodings = self.tables[table_name].get("encodings", {})
+        partition_by = self.tables[table_name].get("partition_by")
+
+        # A nested list fills the table several times from the same row (e.g. the three locations of 'event_geo').
+        for i, more_columns in enumerate(columns if isinstance(columns[0], list) else [columns]):
             # Extract relevant columns from dataframe and cast it to a list.
-            # print(row)
-            # _ = input("Pause...")
-            row_list = row[columns].values.tolist()
-
-            # Do not perform insert if the first value is empty (which is always the primary key).
-            if not row_list[0]:
-                return
-
             # Cast empty values to None for DB adapter to work.
-            row_list = [None if not x else x for x in row_list]
-            # print(f"--- {row_list}")
+            row_list = [None if pd.isna(x) or x == "" else x for x in row[more_columns].values.tolist()]
 
-            try:
-                attribute_string = ','.join(
-                    self.tables[table_name]["attributes"])
-                unique_string = ','.join(
-                    self.tables[table_name]["uniques"])
-            except KeyError as e:
-                logging.error(
-                    f"Your forgot to specify either the 'attributes' or the 'uniques' ont the table {table_name}")
-                raise e
-
-            # Catch uniqueness constraint with "UPSERT" method
-            if not unique_string:
+            # Do not perform insert if the first value is empty (which is always the primary key).
+            if row_list[0] is None:
+                continue
+
+            for attribute, dictionary in encodings.items():
+                j = attributes.index(attribute)
+                if row_list[j] is not None:
+                    row_list[j] = self.dictionary_ids(dictionary, [row_list[j]])[row_list[j]]
+            if partition_by and row_list[attributes.index(partition_by)] is not None:
+                self.ensure_partitions(table_name, [row_list[attributes.index(partition_by)]])
+
+            # Catch uniqueness constraint with "UPSERT" method. The key of a partitioned table is its 'conflict'.
+            if not uniques:
                 insert_string = f"INSERT INTO {table_name} ({attribute_string}) VALUES ({parameter_string})"
             else:
+                unique_string = ','.join(self.tables[table_name].get("conflict", [self.unique_attribute(table_name, i)]))
                 insert_string = f"INSERT INTO {table_name} ({attribute_string}) VALUES ({parameter_string}) ON CONFLICT ({unique_string}) DO NOTHING"
 
             try:
                 cur.execute(insert_string, row_list)
             except UniqueViolation as e:
                 logging.error(
-                    f"Something went wrong during inserting data into: {table_name}")
+                    f"Something went wrong during inserting into: {table_name}")
                 logging.info(e)
             except InFailedSqlTransaction as e:
                 logging.error(
@@ -187,9 +347,11 @@ class DataIntegrator(object):
                 logging.info(e)
                 pass
 
-    def insert_data2(self, conn, cur, df: pd.DataFrame, table_name: str) -> None:
+    def insert_data2(self, conn, cur, df: pd.DataFrame, table_name: str) -> int:
         """
-        Inserts the row into the database specified by conn, cur. The {table_name} specifies the table to be inserted into.
+        Inserts the rows into the database specified by conn, cur. The {table_name} specifies the table to be inserted into.
+        The rows are sent with COPY in the format given by the 'copy_format' of the table ('text' or 'binary'). Tables with
+        the 'merge' flag go through a staging table, see 'merge_data'. Returns the number of rows inserted.
         """
         try:
             columns = self.tables[table_name]["headers"]
@@ -198,63 +360,228 @@ class DataIntegrator(object):
                 f"You forgot to specify the 'headers' on table {table_name}.")
             raise e
 
-        # Check if the element is a nested list and extract it.
-        if isinstance(columns[0], list):
-            for i, more_columns in enumerate(columns):
-                #print("These are the headers:", more_columns)
+        # Rollup tables are written once per file, see 'flush_rollup'.
+        if self.tables[table_name].get("rollup"):
+            with self.metrics.stage("projection", table_name):
+                self.accumulate_rollup(df, table_name)
+            return 0
+
+        # Check if the element is a nested list, otherwise wrap it so both cases are handled the same way.
+        projections = columns if isinstance(columns[0], list) else [columns]
+        num_rows = 0
+
+        for i, more_columns in enumerate(projections):
+            with self.metrics.stage("projection", table_name):
                 new_df = df[more_columns]
 
+                cache = None
                 if self.tables[table_name]["uniques"]:
                     uniq = self.tables[table_name]["uniques"][i]
-                    #print("The unique value is:", uniq)
-
-                    # new_df = new_df[new_df[self.tables[table_name]
-                    #               ["uniques"][i]].notnull()]
-                    new_df = new_df[new_df[self.tables[table_name]
-                                           ["uniques"][i]] != ""]
-                    new_df = new_df.drop_duplicates(subset=[self.tables[table_name]
-                                                            ["uniques"][i]])
-                    # print("This is the new data:\n", new_df[self.tables[table_name]
-                    #               ["uniques"][i]])
-
-                s_buf = io.StringIO()  # Create string buffer
-                # Export data to csv
-                new_df.to_csv(s_buf, header=False, index=False,
-                              sep="\t", quoting=csv.QUOTE_MINIMAL)
-                s_buf.seek(0)  # Reset read head to start of buffer
+
+                    new_df = new_df[new_df[uniq].notna() & (new_df[uniq] != "")]
+                    new_df = new_df.drop_duplicates(subset=[uniq])
+
+                    # Dimension tables only get the keys that weren't loaded by an earlier file.
+                    cache = self.key_cache(table_name)
+                    if cache is not None:
+                        new_df = new_df[pd.Series(cache.filter_new(
+                            new_df[uniq]), index=new_df.index, dtype=bool)]
+
+                new_df = self.encode_codes(new_df, table_name)
+                self.metrics.count(rows=len(new_df))
+
+            with self.metrics.stage("copy", table_name):
+                partition_by = self.tables[table_name].get("partition_by")
+                if partition_by:
+                    self.ensure_partitions(table_name, new_df.iloc[:, self.tables[table_name]["attributes"].index(
+                        partition_by)].unique())
+
                 try:
-                    cur.copy_from(s_buf, table_name, sep="\t", null="",
-                                  columns=self.tables[table_name]["attributes"])
+                    if self.tables[table_name].get("merge"):
+                        copied = self.merge_data(cur, new_df, table_name, i)
+                    else:
+                        self.copy_data(cur, new_df, table_name)
+                        copied = len(new_df)
                 except Exception as e:
-                    logging.error(e)
-                    return
+                    logging.error(
+                        f"Something went wrong during copying data into: {table_name}")
+                    raise e
+                self.metrics.count(rows=copied)
+                num_rows += copied
+
+            if cache is not None:
+                cache.stage(new_df[uniq])
+
+        return num_rows
+
+    def merge_data(self, cur, df: pd.DataFrame, table_name: str, i: int = 0) -> int:
+        """
+        COPYs the rows into a staging table and moves them into the table with one INSERT ... ON CONFLICT DO NOTHING on
+        the attribute of the i-th entry of its 'uniques'. Used for tables with the 'merge' flag, so rows whose key is
+        already stored are skipped instead of failing the COPY. Returns the number of rows actually inserted.
+
+        The rows of a 'dimension' table are merged in a short transaction of their own, which is committed right away
+        instead of with the file (see 'merge_dimension'). Other tables are merged in the transaction of {cur}.
+        """
+        if not self.tables[table_name]["uniques"]:
+            raise ValueError(
+                f"Table {table_name} can only be merged if it specifies its 'uniques'.")
+        if self.tables[table_name].get("dimension"):
+            return self.merge_dimension(df, table_name, i)
+
+        staging = self.stage_data(cur, df, table_name)
+        inserted = self.move_staged(cur, staging, table_name, i)
+        self.clear_staging(cur, staging)
+        return inserted
+
+    def merge_dimension(self, df: pd.DataFrame, table_name: str, i: int = 0) -> int:
+        """
+        Merges the rows into a dimension table on a separate connection and commits them right away. Concurrent loads
+        share many keys of the dimension tables. In the transaction of the file every load would hold its new keys
+        until the whole file is committed, while it waits for the keys of another load in the next chunk, which
+        deadlocks. Here a merge only waits for the merges running at the same time, which insert their keys in the same
+        (sorted) order. A merge that is chosen as the victim of a deadlock anyway is tried again.
 
-        # Columns isn't a nested list, just use it.
+        Keys merged for a file that fails later stay in the table, they are merged again when the file is loaded.
+        """
+        conn, cur = self.connect_database(autocommit=False)
+        try:
+            for attempt in range(self.merge_retries + 1):
+                try:
+                    staging = self.stage_data(cur, df, table_name)
+                    inserted = self.move_staged(cur, staging, table_name, i)
+                    self.clear_staging(cur, staging)
+                    conn.commit()
+                    return inserted
+                except DeadlockDetected as e:
+                    conn.rollback()
+                    if attempt == self.merge_retries:
+                        raise e
+                    logging.warning(f"Merging into {table_name} deadlocked, trying again "
+                                    f"({self.merge_retries - attempt} attempts left): {e}")
+        finally:
+            self.release_connection(conn, cur)
+
+    def move_staged(self, cur, staging: str, table_name: str, i: int = 0) -> int:
+        """
+        Inserts the rows of the staging table whose key isn't stored yet, in the order of the key. Returns their number.
+        """
+        attribute_string = ','.join(self.tables[table_name]["attributes"])
+        key = self.unique_attribute(table_name, i)
+        # The unique key of a partitioned table has to include the partition column, given as 'conflict' in the spec.
+        conflict_string = ','.join(self.tables[table_name].get("conflict", [key]))
+        cur.execute(f"INSERT INTO {table_name} ({attribute_string}) "
+                    f"SELECT DISTINCT ON ({key}) {attribute_string} FROM {staging} ORDER BY {key} "
+                    f"ON CONFLICT ({conflict_string}) DO NOTHING")
+        return cur.rowcount
+
+    def stage_data(self, cur, df: pd.DataFrame, table_name: str) -> str:
+        """
+        COPYs the rows into the staging table of the table and returns its name. Clear it with 'clear_staging' once the
+        rows are moved.
+        """
+        if getattr(cur, "two_phase", False):
+            # A prepared transaction can't touch temporary tables, so the branches of a 'FanoutWriter' stage the rows
+            # in an unlogged table of their session instead, which is dropped in the same transaction.
+            staging = f"{table_name}_staging_{cur.connection.info.backend_pid}"
+            cur.execute(
+                f"CREATE UNLOGGED TABLE IF NOT EXISTS {staging} (LIKE {table_name} INCLUDING DEFAULTS)")
         else:
-            new_df = df[columns]
+            # Temporary tables are not WAL-logged either and belong to the session, so workers never share a staging table.
+            staging = f"{table_name}_staging"
+            cur.execute(
+                f"CREATE TEMPORARY TABLE IF NOT EXISTS {staging} (LIKE {table_name} INCLUDING DEFAULTS)")
+        self.copy_data(cur, df, table_name, target=staging)
+        return staging
+
+    def clear_staging(self, cur, staging: str) -> None:
+        cur.execute(f"DROP TABLE {staging}" if getattr(cur, "two_phase", False) else f"TRUNCATE {staging}")
 
-            if self.tables[table_name]["uniques"]:
-                uniq = self.tables[table_name]["uniques"][0]
-                # print(uniq)
+    def accumulate_rollup(self, df: pd.DataFrame, table_name: str) -> None:
+        """
+        Aggregates the chunk for a table with a 'rollup' spec and keeps the partial result until 'flush_rollup'. The
+        'headers' of the table are the 'keys' followed by the measures, which are summed up. The last attribute is the
+        number of rows per group.
+        """
+        table = self.tables[table_name]
+        keys = table["rollup"]["keys"]
+
+        part = self.encode_codes(df[table["headers"]], table_name)
+        part.columns = table["attributes"][:len(table["headers"])]
+        part = part.dropna(subset=keys)  # Rows without a key can't be assigned to a group.
+        # Sums of float32 values lose precision quickly.
+        part = part.astype({column: "float64" for column in part.select_dtypes("float32").columns})
+
+        grouped = part.groupby(keys, observed=True, sort=False)
+        partial = grouped.sum()
+        partial[table["attributes"][-1]] = grouped.size()
+        self.rollup_partials.setdefault(table_name, []).append(partial.reset_index())
 
-                new_df = new_df[new_df[self.tables[table_name]
-                                       ["uniques"][0]] != ""]
-                new_df = new_df.drop_duplicates(subset=[self.tables[table_name]
-                                                        ["uniques"][0]])
-                # print(new_df[self.tables[table_name]
-                #               ["uniques"][0]])
+    def flush_rollup(self, cur, table_name: str) -> int:
+        """
+        Adds the partial results of the file to the rollup table with one upsert, so the table is updated in the same
+        transaction as the data of the file. Returns the number of groups.
+        """
+        partials = self.rollup_partials.pop(table_name, [])
+        if not partials:
+            return 0
+
+        table = self.tables[table_name]
+        keys = table["rollup"]["keys"]
+        # Sorted by the keys, so concurrent files lock the rows of the rollup table in the same order.
+        totals = pd.concat(partials).groupby(keys, observed=True).sum().reset_index()
+        totals = totals[table["attributes"]]
+
+        staging = self.stage_data(cur, totals, table_name)
+        attribute_string = ','.join(table["attributes"])
+        key_string = ','.join(keys)
+        update_string = ', '.join(f"{attribute} = {table_name}.{attribute} + EXCLUDED.{attribute}"
+                                  for attribute in table["attributes"] if attribute not in keys)
+        cur.execute(f"INSERT INTO {table_name} ({attribute_string}) "
+                    f"SELECT {attribute_string} FROM {staging} ORDER BY {key_string} "
+                    f"ON CONFLICT ({key_string}) DO UPDATE SET {update_string}")
+        self.clear_staging(cur, staging)
+        return len(totals)
+
+    def copy_data(self, cur, df: pd.DataFrame, table_name: str, target: str = None) -> None:
+        """
+        Sends the projected DataFrame to the table with COPY. The columns of {df} have to match the 'attributes' of the table.
+        The rows are written to {target} instead if given, which needs the same columns as the table (e.g. a staging table).
+        """
+        table = self.tables[table_name]
+        # Partitioned tables get the rows of every month copied straight into its partition.
+        if table.get("partition_by") and not target:
+            column = df.columns[table["attributes"].index(table["partition_by"])]
+            for month, month_df in df.groupby(column, sort=False):
+                self.copy_data(cur, month_df, table_name,
+                               target=self.partition_name(table_name, month))
+            return
+
+        target = target if target else table_name
+        # Column names are left unquoted, so they are folded to lower case just like in the schema.
+        attribute_string = ','.join(table["attributes"])
+
+        if table.get("copy_format", "text") == "binary":
+            try:
+                types = table["types"]
+            except KeyError as e:
+                logging.error(
+                    f"You forgot to specify the 'types' on table {table_name}, which the binary COPY needs.")
+                raise e
 
+            buf = BinaryCopyWriter(types).encode(df)
+            self.metrics.count(bytes=buf.getbuffer().nbytes)
+            cur.copy_expert(
+                f"COPY {target} ({attribute_string}) FROM STDIN WITH (FORMAT binary)", buf)
+        else:
             s_buf = io.StringIO()  # Create string buffer
             # Export data to csv
-            new_df.to_csv(s_buf, header=False, index=False,
-                          sep="\t", quoting=csv.QUOTE_MINIMAL)
+            df.to_csv(s_buf, header=False, index=False,
+                      sep="\t", quoting=csv.QUOTE_MINIMAL)
+            self.metrics.count(bytes=s_buf.tell())
             s_buf.seek(0)  # Reset read head to start of buffer
-            try:
-                cur.copy_from(s_buf, table_name, sep="\t", null="",
-                              columns=self.tables[table_name]["attributes"])
-            except Exception as e:
-                logging.error(e)
-                return
+            cur.copy_expert(
+                f"COPY {target} ({attribute_string}) FROM STDIN WITH (FORMAT text, NULL '')", s_buf)
 
     def insert_wrapper(self, file_path, headers: List[str], seperator: str = ",", table_names: List[str] = None) -> None:
         table_names = table_names if table_names else self.table_names
@@ -262,29 +589,406 @@ class DataIntegrator(object):
         num_rows = bufcount(file_path)
         conn, cur = self.connect_database(autocommit=False)
 
-        for index, row in tqdm(self.read_csv(file_path, seperator=seperator, headers=headers, limit=None).iterrows(), desc=f"Inserting {file_path} ...", total=num_rows, mininterval=5.0, miniters=1000):
-            for table_name in table_names:
-                self.insert_data(conn, cur, row, table_name)
+        # Every value is read as a string, the server converts it to the type of its column.
+        df = self.read_csv(file_path, seperator=seperator, headers=headers, limit=None,
+                           dtypes={header: "str" for header in headers})
+        try:
+            for index, row in tqdm(df.iterrows(), desc=f"Inserting {file_path} ...", total=num_rows, mininterval=5.0, miniters=1000):
+                for table_name in table_names:
+                    self.insert_data(conn, cur, row, table_name)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            raise e
+        finally:
+            self.release_connection(conn, cur)
 
-        cur.close()
-        conn.commit()
-        conn.close()
+    def insert_wrapper2(self, file_path, headers: List[str], seperator: str = ",", table_names: List[str] = None, chunksize: int = None, ledger_key: str = None, md5_hash: str = None, frames: Iterable[pd.DataFrame] = None) -> Dict[str, int]:
+        """
+        Bulk loads the file with COPY. If {chunksize} is set, the file is streamed in chunks of that many rows and every chunk is
+        copied into all tables before the next one is read, which keeps the memory usage independent of the file size.
+        The whole file is committed in a single transaction. If anything fails, the file is rolled back and the error raised.
+        The only exception are the keys of 'dimension' tables, which are committed on their own (see 'merge_dimension').
+
+        With a {ledger_key} every loaded table is recorded in the 'ingest_ledger' within the same transaction, and tables
+        the ledger already lists for this key are skipped. Returns the number of rows copied per table.
+
+        If {frames} is given, these DataFrames are inserted instead of reading {file_path} (e.g. from a cache).
+        The stages are measured in {metrics}, charged to the {ledger_key} (or the name of the file).
+
+        With {fanout} every table is written over its own connection at the same time, all of them are prepared before
+        the ledger entries commit on this connection and committed afterwards (see 'FanoutWriter').
+        """
+        with self.metrics.file(ledger_key if ledger_key else os.path.basename(file_path)):
+            reset_peak_memory_usage()
+            if self.chunker:
+                self.chunker.file_peak = 0
+            table_names = table_names if table_names else self.table_names
+            conn, cur = self.connect_database(autocommit=False)
+            row_counts = {}
+            writer = None
+
+            try:
+                if ledger_key:
+                    done = self.completed_tables(cur, ledger_key)
+                    table_names = [
+                        table_name for table_name in table_names if table_name not in done]
+                    if not table_names:
+                        logging.info(
+                            f"Skipping '{file_path}', the ledger lists it as completed.")
+                        return row_counts
+
+                # Only parse the columns the tables actually need, typed if the integrator specifies 'dtypes'.
+                columns = self.projection(
+                    table_names, headers) if self.dtypes else None
+
+                if frames is not None:
+                    chunks = frames
+                elif chunksize:
+                    chunks = self.read_csv_chunks(file_path, seperator=seperator, headers=headers, chunksize=chunksize,
+                                                  columns=columns, dtypes=self.dtypes)
+                else:
+                    chunks = iter([self.read_csv(file_path, seperator=seperator, headers=headers, limit=None,
+                                                 columns=columns, dtypes=self.dtypes)])
+
+                if frames is None and os.path.isfile(file_path):
+                    self.metrics.add("parse", bytes=os.path.getsize(file_path))
+
+                if self.fanout and len(table_names) > 1:
+                    writer = FanoutWriter(self, table_names)
+
+                row_counts = {table_name: 0 for table_name in table_names}
+                for df in self.metrics.iterate("parse", chunks):
+                    with self.metrics.stage("parse"):
+                        df = self.transform(df)
+                    if writer:
+                        for table_name, num_rows in writer.insert(df).items():
+                            row_counts[table_name] += num_rows
+                    else:
+                        for table_name in table_names:
+                            logging.info(f"The current table is: {table_name}")
+                            row_counts[table_name] += self.insert_data2(
+                                conn, cur, df, table_name)
+                    del df  # Drop the reference before the next chunk is parsed.
+
+                def flush(conn, cur, table_name: str) -> int:
+                    with self.metrics.stage("copy", table_name):
+                        flushed = self.flush_rollup(cur, table_name)
+                        self.metrics.count(rows=flushed)
+                    return flushed
+
+                rollups = [table_name for table_name in table_names if self.tables[table_name].get("rollup")]
+                flushed = writer.run(flush, rollups) if writer else {
+                    table_name: flush(conn, cur, table_name) for table_name in rollups}
+                for table_name, num_rows in flushed.items():
+                    row_counts[table_name] += num_rows
+
+                with self.metrics.stage("commit"):
+                    if writer:
+                        writer.prepare()
+                    if ledger_key:
+                        self.record_ledger(cur, ledger_key, row_counts, md5_hash, writer.gtrid if writer else None)
+                    conn.commit()  # Decides the outcome of the prepared tables.
+                    if writer:
+                        writer.commit()
+
+                # The chunker resets the peak for every chunk and keeps the maximum itself.
+                peak = max(peak_memory_usage(), self.chunker.file_peak if self.chunker else 0)
+                self.metrics.add("parse", peak_rss=peak)
+                logging.info(f"Loaded '{file_path}' with a peak memory usage of {peak / 2 ** 20:.0f} MB.")
+                for cache in self.key_caches.values():
+                    cache.commit()
+            except Exception as e:
+                logging.error(
+                    f"Loading '{file_path}' failed. Rolling back the whole file: {e}")
+                conn.rollback()
+                if writer:
+                    writer.rollback()
+                for cache in self.key_caches.values():
+                    cache.rollback()
+                self.rollup_partials.clear()
+                raise e
+            finally:
+                if writer:
+                    writer.close()
+                self.release_connection(conn, cur)
+
+            return row_counts
+
+    def transform(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Hook to clean every chunk of a file before it is inserted by 'insert_wrapper2'. Returns the chunk unchanged.
+        """
+        return df
+
+    def encode_codes(self, df: pd.DataFrame, table_name: str) -> pd.DataFrame:
+        """
+        Replaces the codes of the attributes listed in the 'encodings' of the table with the IDs of their lookup table.
+        Empty codes become NULL.
+        """
+        encodings = self.tables[table_name].get("encodings")
+        if not encodings:
+            return df
+
+        df = df.copy()
+        attributes = self.tables[table_name]["attributes"]
+        for attribute, dictionary in encodings.items():
+            column = df.columns[attributes.index(attribute)]
+            df[column] = self.encode_series(df[column], dictionary)
+        return df
+
+    def encode_series(self, series: pd.Series, dictionary: str) -> pd.Series:
+        """
+        Maps the codes to the IDs of the lookup table. Only the distinct codes (the categories) are looked up.
+        """
+        codes = series if isinstance(
+            series.dtype, pd.CategoricalDtype) else series.astype("category")
+        categories = list(codes.cat.categories)
+        ids = self.dictionary_ids(dictionary, categories)
+
+        category_ids = pd.array([ids.get(code) if code != "" else None for code in categories], dtype="Int16")
+        return pd.Series(category_ids.take(codes.cat.codes.to_numpy(), allow_fill=True), index=series.index, name=series.name)
+
+    def dictionary_ids(self, dictionary: str, codes: List[str]) -> Dict[str, int]:
+        """
+        Returns the map from code to ID of the lookup table, which is loaded on first use. Codes that are missing in the
+        lookup table are added to it.
+        """
+        if dictionary not in self.code_ids:
+            self.code_ids[dictionary] = self.update_dictionary(
+                dictionary, seed=True)
+
+        known = self.code_ids[dictionary]
+        missing = [code for code in codes if code and code not in known]
+        if missing:
+            logging.info(
+                f"Adding {len(missing)} unknown code(s) to {dictionary}: {missing}")
+            known.update(self.update_dictionary(dictionary, missing))
+        return known
+
+    def update_dictionary(self, dictionary: str, codes: List[str] = None, seed: bool = False) -> Dict[str, int]:
+        """
+        Inserts the codes that aren't stored yet into the lookup table and returns the IDs of {codes}, or of all codes if
+        {seed} is set. Seeding fills the lookup table from its file in 'dictionaries' first.
+        The codes are committed right away on a separate connection, so all workers share the same IDs. The lock makes
+        sure that no IDs are wasted on codes another worker inserts at the same time.
+        """
+        codes = codes if codes else []
+        labels = [None] * len(codes)
+        if seed and self.dictionaries.get(dictionary):
+            lookup = pd.read_csv(self.dictionaries[dictionary], sep="\t", dtype=str, keep_default_na=False)
+            lookup = lookup.drop_duplicates(subset=lookup.columns[0])
+            codes, labels = lookup.iloc[:, 0].tolist(), lookup.iloc[:, 1].tolist()
 
-    def insert_wrapper2(self, file_path, headers: List[str], seperator: str = ",", table_names: List[str] = None) -> None:
-        table_names = table_names if table_names else self.table_names
-        num_rows = bufcount(file_path)
         conn, cur = self.connect_database(autocommit=False)
+        try:
+            cur.execute(
+                "SELECT pg_advisory_xact_lock(hashtext(%s))", (dictionary,))
+            cur.execute(f"INSERT INTO {dictionary} (Code, Label) SELECT c, l FROM unnest(%s::text[], %s::text[]) AS f(c, l) "
+                        f"WHERE NOT EXISTS (SELECT 1 FROM {dictionary} d WHERE d.Code = f.c)", (codes, labels))
+            if seed:
+                cur.execute(f"SELECT Code, ID FROM {dictionary}")
+            else:
+                cur.execute(
+                    f"SELECT Code, ID FROM {dictionary} WHERE Code = ANY(%s)", (codes,))
+            ids = dict(cur.fetchall())
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logging.error(f"Could not update the lookup table {dictionary}: {e}")
+            raise e
+        finally:
+            self.release_connection(conn, cur)
 
-        df = self.read_csv(file_path, seperator=seperator,
-                           headers=headers, limit=None)
+        return ids
 
-        for table_name in table_names:
-            logging.info("The current table is:", table_name)
-            self.insert_data2(conn, cur, df, table_name)
+    def partition_name(self, table_name: str, month: int) -> str:
+        """
+        Returns the name of the partition of {table_name} that holds the month (as YYYYMM like 'MonthYear').
+        """
+        return f"{table_name}_{int(month)}"
 
-        cur.close()
-        conn.commit()
-        conn.close()
+    def ensure_partitions(self, table_name: str, months: List[int]) -> None:
+        """
+        Creates the missing monthly partitions of the table. The partitions are created on a separate connection and
+        committed right away, so they don't wait for (or block) the transaction that loads the data. Each one is
+        created as a plain table and attached afterwards, which doesn't conflict with other workers writing to the table.
+        """
+        if table_name not in self.partitions:
+            self.partitions[table_name] = set(self.list_partitions(table_name))
+        missing = {int(month) for month in months} - self.partitions[table_name]
+        if not missing:
+            return
+
+        conn, cur = self.connect_database(autocommit=False)
+        try:
+            for month in sorted(missing):
+                partition = self.partition_name(table_name, month)
+                upper = month + 1 if month % 100 < 12 else (month // 100 + 1) * 100 + 1
+                # Another worker may create the same partition at the same time.
+                cur.execute(
+                    "SELECT pg_advisory_xact_lock(hashtext(%s))", (partition,))
+                cur.execute(
+                    "SELECT 1 FROM pg_inherits WHERE inhrelid = to_regclass(%s)", (partition,))
+                if not cur.fetchone():
+                    cur.execute(
+                        f"CREATE TABLE IF NOT EXISTS {partition} (LIKE {table_name} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+                    cur.execute(
+                        f"ALTER TABLE {table_name} ATTACH PARTITION {partition} FOR VALUES FROM ({month}) TO ({upper})")
+                    logging.info(f"Created partition {partition}.")
+                conn.commit()
+                self.partitions[table_name].add(month)
+        except Exception as e:
+            conn.rollback()
+            logging.error(
+                f"Could not create the partitions of {table_name}: {e}")
+            raise e
+        finally:
+            self.release_connection(conn, cur)
+
+    def list_partitions(self, table_name: str) -> List[int]:
+        """
+        Returns the months of the partitions that are attached to the table.
+        """
+        conn, cur = self.connect_database(autocommit=True)
+        try:
+            cur.execute("SELECT c.relname FROM pg_inherits h JOIN pg_class c ON c.oid = h.inhrelid "
+                        "WHERE h.inhparent = %s::regclass", (table_name,))
+            return sorted(int(name.rsplit("_", 1)[1]) for name, in cur.fetchall())
+        finally:
+            self.release_connection(conn, cur)
+
+    def detach_partitions(self, table_name: str, before: int) -> List[str]:
+        """
+        Detaches the partitions of all months before {before} (as YYYYMM) from the table and returns their names.
+        The detached tables keep their data, so they can be dumped and dropped or moved to another tablespace,
+        while queries on the table don't see them anymore. Every partition is detached in its own transaction, which
+        locks the table exclusively only for a moment (DETACH ... CONCURRENTLY would need PostgreSQL 14).
+        """
+        detached = []
+        conn, cur = self.connect_database(autocommit=True)
+        try:
+            for month in self.list_partitions(table_name):
+                if month >= before:
+                    continue
+                partition = self.partition_name(table_name, month)
+                cur.execute(
+                    f"ALTER TABLE {table_name} DETACH PARTITION {partition}")
+                self.partitions.get(table_name, set()).discard(month)
+                detached.append(partition)
+                logging.info(f"Detached partition {partition}.")
+        finally:
+            self.release_connection(conn, cur)
+
+        return detached
+
+    def key_cache(self, table_name: str) -> Optional[KeyCache]:
+        """
+        Returns the key cache of the table, if the table spec marks it as a 'dimension'. Otherwise None.
+        """
+        if not self.tables[table_name].get("dimension"):
+            return None
+
+        if table_name not in self.key_caches:
+            self.key_caches[table_name] = KeyCache(self.key_cache_size)
+        return self.key_caches[table_name]
+
+    def unique_attribute(self, table_name: str, i: int = 0) -> str:
+        """
+        Returns the attribute of the table that is filled from the i-th entry of its 'uniques'.
+        """
+        table = self.tables[table_name]
+        columns = table["headers"]
+        columns = columns[i] if isinstance(columns[0], list) else columns
+        return table["attributes"][columns.index(table["uniques"][i])]
+
+    def warm_key_caches(self, table_names: List[str] = None) -> None:
+        """
+        Fills the key caches of the dimension tables with the keys already stored in the database (up to the capacity).
+        """
+        table_names = table_names if table_names else self.table_names
+        conn, cur = self.connect_database(autocommit=True)
+        try:
+            for table_name in table_names:
+                cache = self.key_cache(table_name)
+                if cache is None:
+                    continue
+                key = self.unique_attribute(table_name)
+                cur.execute(
+                    f"SELECT DISTINCT {key} FROM {table_name} WHERE {key} IS NOT NULL LIMIT %s", (cache.capacity,))
+                cache.add(key for key, in cur.fetchall())
+                logging.info(
+                    f"Warmed up the key cache of {table_name} with {len(cache)} keys.")
+        finally:
+            self.release_connection(conn, cur)
+
+    def completed_tables(self, cur, ledger_key: str) -> set:
+        """
+        Returns the tables the ledger lists as completed for {ledger_key}. A lookup on the primary key of the ledger.
+        """
+        cur.execute(
+            "SELECT TableName FROM ingest_ledger WHERE File = %s", (ledger_key,))
+        return {table_name for table_name, in cur.fetchall()}
+
+    def record_ledger(self, cur, ledger_key: str, row_counts: Dict[str, int], md5_hash: str = None, gtrid: str = None) -> None:
+        """
+        Records the loaded tables of {ledger_key} in the ledger. Has to run in the transaction that loaded the data,
+        so the data and its ledger entries are committed together or not at all. With a 'FanoutWriter' the data is in
+        its prepared branches, whose {gtrid} is recorded, so 'recover_prepared' knows which ones to commit.
+
+        This doesn't hold for the 'dimension' tables: their new keys are committed while the file is loaded (see
+        'merge_dimension'), so a file that fails leaves them behind without ledger entries. They are complete rows and
+        skipped when the file is loaded again, but the dimension tables may hold keys that no loaded file refers to.
+        """
+        for table_name, num_rows in row_counts.items():
+            cur.execute("INSERT INTO ingest_ledger (File, TableName, NumRows, MD5, Gtrid) VALUES (%s, %s, %s, %s, %s)",
+                        (ledger_key, table_name, num_rows, md5_hash, gtrid))
+
+    def recover_prepared(self, min_age: float = 60.0) -> Dict[str, int]:
+        """
+        Finishes the prepared transactions a crashed 'FanoutWriter' left behind: the branches whose global transaction
+        ID and table the ledger lists are committed, all others rolled back. Only transactions prepared at least
+        {min_age} seconds ago are touched, younger ones may belong to a load that is still running. Returns the number
+        of committed and rolled back ones.
+        """
+        conn, cur = self.connect_database(autocommit=True)
+        recovered = {"committed": 0, "rolled_back": 0}
+        try:
+            cur.execute("SELECT now()")
+            now, = cur.fetchone()
+            for xid in conn.tpc_recover():
+                if not xid.gtrid or not xid.gtrid.startswith(FanoutWriter.xid_prefix + "|") \
+                        or xid.database != conn.info.dbname or (now - xid.prepared).total_seconds() < min_age:
+                    continue
+
+                cur.execute("SELECT File FROM ingest_ledger WHERE Gtrid = %s AND TableName = %s", (xid.gtrid, xid.bqual))
+                row = cur.fetchone()
+                if row:
+                    conn.tpc_commit(xid)
+                    recovered["committed"] += 1
+                    logging.warning(f"Committed the prepared transaction of {xid.bqual} for '{row[0]}'.")
+                else:
+                    conn.tpc_rollback(xid)
+                    recovered["rolled_back"] += 1
+                    logging.warning(f"Rolled back the prepared transaction of {xid.bqual} ({xid.gtrid}).")
+        finally:
+            self.release_connection(conn, cur)
+
+        return recovered
+
+    def load_ledger(self, files: List[str]) -> Dict[str, set]:
+        """
+        Returns the completed tables of the {files} in the ledger, read with a single lookup of the primary key.
+        """
+        conn, cur = self.connect_database(autocommit=True)
+        try:
+            cur.execute("SELECT File, TableName FROM ingest_ledger WHERE File = ANY(%s)", (list(files),))
+            ledger = {}
+            for file, table_name in cur.fetchall():
+                ledger.setdefault(file, set()).add(table_name)
+            return ledger
+        finally:
+            self.release_connection(conn, cur)
 
 
 if __name__ == "__main__":
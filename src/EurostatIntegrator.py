@@ -1,13 +1,65 @@
 #!/usr/bin/env python3
 
+import os
+import logging
+import pandas as pd
+
 from src.DataIntegrator import DataIntegrator
 
+from typing import List, Dict
+
 
 class EurostatIntegrator(DataIntegrator):
-    def __init(self):
-        # super().__init__()
-        self.data: str = None
+    """
+    Base class for the Eurostat datasets. Loads the raw CSV exports as they are downloaded from Eurostat: the values are
+    cleaned in bulk (see 'transform') and inserted with COPY, the countries are extracted into the 'country' table.
+    """
+
+    data: str = None
+    header_rows = 1  # The exports start with a header line.
+    value_column = "Value"
+    flags_column = "Flags"
+
+    def __init__(self, table_names, tables, metrics_path: str = None):
+        # Every column is read as string, the values are converted by 'transform'.
+        self.dtypes = {header: "str" for header in self.headers}
+        super().__init__(table_names, tables, metrics_path)
+
+    def transform(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Cleans the values of the export: Spaces used as thousands separator are removed and ':' (not available) becomes
+        NULL. Flags attached to a value (like '2 127 u') are moved to the flags column, separated by a space from the
+        flags and footnotes Eurostat already puts there (e.g. 'b u').
+        """
+        values = df[self.value_column].astype("string").str.strip()
+
+        value_flags = values.str.extract(r"([a-z]+)$", expand=False).fillna("")
+        flags = (df[self.flags_column].astype("string").fillna("").str.strip() + " " + value_flags).str.strip()
+
+        numbers = values.str.replace(r"[^0-9.\-]", "", regex=True)
+        df[self.value_column] = pd.to_numeric(numbers.where(numbers != ""), errors="coerce")
+        df[self.flags_column] = flags.where(flags != "")
+        return df
+
+    def integrate(self, file_path: str = None, table_names: List[str] = None) -> Dict[str, int]:
+        """
+        Loads the export into the tables (all by default) in one transaction and returns the number of rows per table.
+        The file is recorded in the ingestion ledger, so loading it again doesn't duplicate any rows. A missing export
+        is skipped with a warning, so the other datasets can still be loaded.
+        """
+        file_path = file_path if file_path else self.data
+        if not os.path.isfile(file_path):
+            logging.warning(f"Skipping {type(self).__name__}, the export '{file_path}' is missing. Download it from "
+                            f"Eurostat to load it.")
+            return {}
+        try:
+            return self.insert_wrapper2(file_path, headers=self.headers, table_names=table_names,
+                                        ledger_key=os.path.basename(file_path))
+        finally:
+            self.metrics.flush()
 
-    def extract_countries(self) -> None:
-        # TODO: Extract countries from data and fill the table.
-        pass
+    def extract_countries(self, file_path: str = None) -> int:
+        """
+        Fills the 'country' table with the countries of the export and returns the number of new countries.
+        """
+        return self.integrate(file_path, table_names=["country"]).get("country", 0)
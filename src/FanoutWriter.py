@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+import uuid
+import logging
+import psycopg2
+from psycopg2.extensions import STATUS_BEGIN, STATUS_PREPARED, cursor
+from concurrent.futures import ThreadPoolExecutor
+
+from typing import List, Dict, Tuple, Callable, Any
+
+
+class BranchCursor(cursor):
+    """
+    Cursor of a branch of a two-phase commit, which can't use temporary tables (see 'DataIntegrator.stage_data').
+    """
+    two_phase = True
+
+
+class FanoutWriter(object):
+    """
+    Writes the tables of a file at the same time, each over its own database connection and in its own thread, so the
+    load of a file takes about as long as its largest table instead of the sum of all tables.
+
+    The connections run as branches of one two-phase commit: every branch is prepared ('PREPARE TRANSACTION') before
+    the loading transaction of the file commits its ledger entries, which decides the outcome. The ledger entries
+    record the {gtrid}, only then the branches are committed. A crash in between leaves prepared branches behind,
+    'DataIntegrator.recover_prepared' commits those whose {gtrid} the ledger lists and rolls back the others. The
+    server needs 'max_prepared_transactions' of at least the number of tables per running load.
+    """
+
+    xid_prefix = "batadase"  # Start of the global transaction IDs, 'batadase|<uuid>' (at most 64 characters).
+
+    def __init__(self, integrator, table_names: List[str]):
+        super().__init__()
+        self.integrator = integrator
+        self.table_names = table_names
+        self.gtrid = f"{self.xid_prefix}|{uuid.uuid4().hex}"
+        self.connections: Dict[str, Tuple] = {}
+        self.unresolved: set = set()  # Prepared branches that failed to commit, left for 'recover_prepared'.
+        self.executor = ThreadPoolExecutor(max_workers=len(table_names), thread_name_prefix="fanout")
+        try:
+            for table_name in table_names:
+                conn, cur = integrator.connect_database(autocommit=False)
+                cur.close()
+                self.connections[table_name] = (conn, conn.cursor(cursor_factory=BranchCursor))
+                conn.tpc_begin(conn.xid(0, self.gtrid, table_name))
+        except Exception:
+            self.close()
+            raise
+
+    def run(self, function: Callable, table_names: List[str] = None) -> Dict[str, Any]:
+        """
+        Calls {function} with the connection, cursor and name of every table in parallel and returns the results per
+        table. Waits for all tables before the first error is raised, so no connection is in use afterwards.
+        """
+        table_names = table_names if table_names is not None else self.table_names
+        metrics = self.integrator.metrics
+        file = metrics.current_file()
+
+        def task(table_name: str) -> Any:
+            with metrics.file(file):
+                conn, cur = self.connections[table_name]
+                return function(conn, cur, table_name)
+
+        futures = {table_name: self.executor.submit(task, table_name) for table_name in table_names}
+        results, error = {}, None
+        for table_name, future in futures.items():
+            try:
+                results[table_name] = future.result()
+            except Exception as e:
+                error = error if error else e
+        if error:
+            raise error
+        return results
+
+    def insert(self, df) -> Dict[str, int]:
+        """
+        Inserts the chunk into all tables, see 'DataIntegrator.insert_data2'. Returns the rows inserted per table.
+        """
+        return self.run(lambda conn, cur, table_name: self.integrator.insert_data2(conn, cur, df, table_name))
+
+    def prepare(self) -> None:
+        self.run(lambda conn, cur, table_name: conn.tpc_prepare())
+
+    def commit(self) -> None:
+        """
+        Commits the prepared branches, once the ledger recorded the {gtrid}. A branch that fails here stays prepared and is
+        committed by 'recover_prepared', so the error is only logged.
+        """
+        for table_name, (conn, cur) in self.connections.items():
+            try:
+                conn.tpc_commit()
+            except psycopg2.Error as e:
+                self.unresolved.add(table_name)
+                logging.error(f"Could not commit the prepared transaction of {table_name}, it is committed by the "
+                              f"next recovery: {e}")
+
+    def rollback(self) -> None:
+        for table_name, (conn, cur) in self.connections.items():
+            try:
+                conn.tpc_rollback()
+            except psycopg2.Error as e:
+                logging.error(f"Could not roll back the transaction of {table_name}: {e}")
+
+    def close(self) -> None:
+        """
+        Hands the connections back to the pool. Branches that are still open are rolled back.
+        """
+        for table_name, (conn, cur) in self.connections.items():
+            if table_name in self.unresolved:
+                conn.close()  # The prepared transaction outlives the session, the pool drops the closed connection.
+            # A prepared connection looks idle to the pool, so it has to be rolled back here.
+            elif not conn.closed and conn.status in (STATUS_BEGIN, STATUS_PREPARED):
+                try:
+                    conn.tpc_rollback()
+                except psycopg2.Error:
+                    pass
+            self.integrator.release_connection(conn, cur)
+        self.connections = {}
+        self.executor.shutdown(wait=True)
@@ -1,19 +1,22 @@
 #!/usr/bin/env python3
 
 from src.utils import *
+from src.PipelineMetrics import PipelineMetrics
 from typing import Dict, List, Tuple, Optional, Union, Iterator
 from tqdm import tqdm
-from bs4 import BeautifulSoup as bs
 import requests
 from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from tempfile import TemporaryDirectory
 from datetime import datetime
 from itertools import repeat
 from zipfile import ZipFile
 from pprint import pprint
 from hashlib import md5
+from bisect import bisect_left, bisect_right
 import os
 import re
+import json
 import sys
 import shutil
 import logging
@@ -35,53 +38,178 @@ class GdeltDownloader(object):
         self.start_date = datetime(*start_date)
         self.end_date = datetime(*end_date)
         self.max_workers = int(os.cpu_count()) * 2
+        self.chunk_size = 1024 * 1024  # Bytes read from the socket or the disk at once.
+        # Checksums of the verified archives per download directory, loaded on first use.
+        self.manifest_name = "manifest.jsonl"
+        self.manifests: Dict[str, Dict[str, Dict]] = {}
+        # Parsed file index of {url}, one line per file sorted by date, and the validators of the page it came from.
+        self.index_name = "index.tsv"
+        self.index_meta_name = "index.json"
+        self.index_timeout = 60
+        self.download_timeout = 60  # Seconds to connect or to wait for the next bytes of a download.
         self.dl_dir = TemporaryDirectory(prefix="batadase_", dir=".")
+        # Metrics of the integrator using this downloader, the checksum and unzip stages are measured here.
+        self.metrics: Optional[PipelineMetrics] = None
 
-    def get_file_links(self) -> List[Dict]:
-        '''
-        Gets all links from the Gdelt website to the zip files with the data.
-        '''
+    # A link of the index page: '<A HREF="20150101.export.CSV.zip">20150101.export.CSV.zip</A> 52.3MB (MD5: ...)'.
+    link_regex = re.compile(
+        r'<a\s+href="(?P<file>[^"]*?(?P<date>\d{8})[^"]*)"[^>]*>[^<]*</a>\s*(?P<size>\d+(?:\.\d+)?)MB\s*\(MD5:\s*(?P<md5>[a-fA-F\d]{32})\)',
+        re.IGNORECASE)
 
-        dateRegex = r"(\d{4})(\d{2})(\d{2})"
-        zipRegex = r""  # using href attribute
-        sizeRegex = r"(\d+\.\d)MB"
-        md5regex = r"([a-fA-F\d]{32})"
+    def get_file_links(self, refresh: bool = False) -> List[Dict]:
+        """Gets the links to the zip files with the data in the date range.
 
-        file_links = []
-        response = requests.get(self.base_url)
+        The parsed index is cached in the download directory. The page is only requested if the cache ends before the
+        end date (or {refresh} is set), and then with the validators of the cached page, so an unchanged page is not
+        downloaded again. The range is found by binary search on the dates.
 
-        soup = bs(response.text, features="lxml")
+        Parameters
+        ----------
+        refresh : bool, optional
+            Checks the page for changes even if the cache covers the date range, by default False.
 
-        links = soup.find_all('li')
+        Returns
+        -------
+        List[Dict]
+            One entry per file with the link ('file'), the date ('day'), the md5 sum and the size in MB.
+        """
+        dates, entries = self.load_index()
+        end_key = int(self.end_date.strftime("%Y%m%d"))
+        if refresh or not dates or dates[-1] < end_key:
+            dates, entries = self.refresh_index(dates, entries)
 
-        for link in tqdm(links, desc="Parsing links ..."):
-            try:
-                file = link.find('a')['href']
-                date_string: Tuple[int, int, int] = tuple(int(x)
-                                                          for x in re.findall(dateRegex, file)[0])
-                date = datetime(*date_string)
-
-                # Only add file link if the date is withing the range
-                if date <= self.end_date and date >= self.start_date:
-                    link_obj = {
-                        "file": file,
-                        "day": date,
-                        "md5": re.findall(md5regex, link.text)[0],
-                        "size": float(re.findall(sizeRegex, link.text)[0])
-                    }
-                    file_links.append(link_obj)
-
-            except Exception as e:
-                logging.info(f"Link '{link}' was empty!", e)
-                continue  # Skip link if one of the properties was not found
+        first = bisect_left(dates, int(self.start_date.strftime("%Y%m%d")))
+        last = bisect_right(dates, end_key)
+        file_links = [{"file": file, "day": datetime(date // 10000, date // 100 % 100, date % 100), "md5": md5_hash, "size": size}
+                      for date, file, md5_hash, size in entries[first:last]]
 
         print(
             f"{len(file_links)} links found in date range '{self.start_date} - {self.end_date}'!")
         return file_links
 
+    def load_index(self) -> Tuple[List[int], List[Tuple[int, str, str, float]]]:
+        """Loads the cached file index.
+
+        Returns
+        -------
+        Tuple[List[int], List[Tuple[int, str, str, float]]]
+            The dates (as YYYYMMDD) and the entries (date, file, md5 sum, size in MB), both sorted by date. Empty if
+            there is no cache for {url}.
+        """
+        meta = self.load_index_meta()
+        if meta.get("url") != self.base_url:
+            return [], []
+
+        entries = []
+        try:
+            with open(os.path.join(self.dl_path, self.index_name), "r", encoding="utf8") as f:
+                for line in f:
+                    date, file, md5_hash, size = line.rstrip("\n").split("\t")
+                    entries.append((int(date), file, md5_hash, float(size)))
+        except (FileNotFoundError, ValueError) as e:
+            logging.info(f"The file index cache in '{self.dl_path}' is not usable, loading the index again: {e}")
+            return [], []
+
+        return [entry[0] for entry in entries], entries
+
+    def load_index_meta(self) -> Dict:
+        try:
+            with open(os.path.join(self.dl_path, self.index_meta_name), "r", encoding="utf8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def refresh_index(self, dates: List[int], entries: List[Tuple[int, str, str, float]]) -> Tuple[List[int], List[Tuple[int, str, str, float]]]:
+        """Requests the index page if it changed since the cached one was loaded, parses and caches it.
+
+        Parameters
+        ----------
+        dates : List[int]
+            Dates of the cached index.
+        entries : List[Tuple[int, str, str, float]]
+            Entries of the cached index, see 'load_index'.
+
+        Returns
+        -------
+        Tuple[List[int], List[Tuple[int, str, str, float]]]
+            The current index, the cached one if the page did not change or can't be reached.
+        """
+        meta = self.load_index_meta() if entries else {}
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+        try:
+            response = requests.get(self.base_url, headers=headers, timeout=self.index_timeout)
+            if response.status_code == 304:
+                logging.debug(f"The file index at '{self.base_url}' did not change.")
+                return dates, entries
+            response.raise_for_status()
+        except requests.RequestException as e:
+            if not entries:
+                raise
+            logging.warning(f"Could not refresh the file index from '{self.base_url}', using the cached one: {e}")
+            return dates, entries
+
+        entries = self.parse_index(response.text)
+        self.save_index(entries, {"url": self.base_url, "etag": response.headers.get("ETag"),
+                                  "last_modified": response.headers.get("Last-Modified")})
+        return [entry[0] for entry in entries], entries
+
+    def parse_index(self, html: str) -> List[Tuple[int, str, str, float]]:
+        """Parses the links of the index page, skipping those without a valid date, size or md5 sum.
+
+        Parameters
+        ----------
+        html : str
+            The index page.
+
+        Returns
+        -------
+        List[Tuple[int, str, str, float]]
+            Entries (date, file, md5 sum, size in MB) sorted by date.
+        """
+        entries = []
+        for match in self.link_regex.finditer(html):
+            date = match.group("date")
+            try:
+                datetime.strptime(date, "%Y%m%d")
+            except ValueError:
+                logging.info(f"Link '{match.group(0)}' has no valid date!")
+                continue
+            entries.append((int(date), match.group("file"), match.group("md5"), float(match.group("size"))))
+
+        entries.sort()
+        return entries
+
+    def save_index(self, entries: List[Tuple[int, str, str, float]], meta: Dict) -> None:
+        """Writes the index and the validators of its page to the download directory. Both files are replaced at once,
+        the index first, so a crash in between leaves old validators that only cause one more download.
+
+        Parameters
+        ----------
+        entries : List[Tuple[int, str, str, float]]
+            Entries sorted by date, see 'load_index'.
+        meta : Dict
+            URL, ETag and Last-Modified header of the page.
+        """
+        os.makedirs(self.dl_path, exist_ok=True)
+        for name, content in [(self.index_name, "".join(f"{date}\t{file}\t{md5_hash}\t{size}\n" for date, file, md5_hash, size in entries)),
+                              (self.index_meta_name, json.dumps(meta))]:
+            path = os.path.join(self.dl_path, name)
+            with open(path + ".tmp", "w", encoding="utf8") as f:
+                f.write(content)
+            os.replace(path + ".tmp", path)
+
     # TODO: Change return type to a dict.
     def download_file(self, file_obj: Dict, dl_path: str, extract: bool = True, remove: bool = True, retries: int = 5) -> Optional[Tuple[str, bool]]:
-        """Downloads and extract a given file. Skips the file if it already exists.
+        """Downloads and extract a given file. Skips the download if the archive already exists and matches its md5 sum.
+
+        The data is written to '<name>.part', which is only renamed to the archive once its md5 sum matches, so an
+        interrupted download never leaves a broken archive behind. An existing archive that doesn't match (e.g. of an
+        older version) is downloaded again.
 
         Parameters
         ----------
@@ -93,48 +221,75 @@ class GdeltDownloader(object):
         Returns
         -------
         Optional[Tuple[str, bool]]
-            Return a tuple with information about the download. First item is the local filename, second item is a bool which is set to true if the md5 sum of the file matches. Can be none if the download was skipped.
+            Return a tuple with information about the download. First item is the local filename (the archive if {extract} is False), second item is a bool which is set to true if the md5 sum of the file matches. Can be none if the download was skipped.
+
+        Raises
+        ------
+        RuntimeError
+            If the md5 sum still doesn't match after {retries} additional attempts.
         """
         filename = file_obj['file'].split(
             '/')[-1]  # Get filename from file_obj for later use.
         # Compose relative file path. This is where the file gets saved.
         zip_local_path = os.path.join(dl_path, filename)
+        part_local_path = zip_local_path + ".part"
 
         result = None
 
-        try:
-            size = os.path.getsize(zip_local_path)
-            if size == 0:
+        # Without an md5 sum (e.g. a file the update feed no longer lists) an existing archive is a complete download.
+        is_md5_equal = False
+        if os.path.isfile(zip_local_path) and file_obj['md5']:
+            is_md5_equal = self.is_verified(zip_local_path, file_obj)
+            if not is_md5_equal:
+                logging.info(f"'{zip_local_path}' doesn't match its md5 sum. Downloading it again.")
                 os.remove(zip_local_path)
-        except os.error as e:
-            logging.debug(f"File '{zip_local_path}' does not exist.")
 
         # Skip download if .zip or .csv file already exists.
-        is_md5_equal = False
         if not os.path.isfile(zip_local_path) and not os.path.isfile(os.path.splitext(zip_local_path)[0]):
             uri = os.path.join(self.base_url, filename)
+            os.makedirs(dl_path, exist_ok=True)
 
-            with requests.get(uri, stream=True) as r:
-                with open(zip_local_path, "wb") as f:
-                    shutil.copyfileobj(r.raw, f)
-                    is_md5_equal = (
-                        self.md5sum(zip_local_path) == file_obj['md5'])
-
-            if not is_md5_equal and retries > 0:
-                logging.info(
-                    f"MD5 mismtach. Retrying download for file '{filename}'. {retries} attempts left.")
-                return self.download_file(file_obj, dl_path, extract, remove, retries=retries-1)
+            try:
+                for attempt in range(retries + 1):
+                    # The md5 sum is computed on the bytes while they are written, so the file is never read again.
+                    file_hash = md5()
+                    with requests.get(uri, stream=True, timeout=self.download_timeout) as r:
+                        r.raise_for_status()
+                        with open(part_local_path, "wb") as f:
+                            for chunk in r.iter_content(chunk_size=self.chunk_size):
+                                f.write(chunk)
+                                self.count(bytes=len(chunk))
+                                with self.stage("checksum"):
+                                    file_hash.update(chunk)
+
+                    is_md5_equal = file_hash.hexdigest() == file_obj['md5']
+                    if is_md5_equal or not file_obj['md5']:
+                        os.replace(part_local_path, zip_local_path)
+                        if is_md5_equal:
+                            self.record_checksum(zip_local_path, file_obj['md5'])
+                        break
+
+                    logging.info(
+                        f"MD5 mismtach. Retrying download for file '{filename}'. {retries - attempt} attempts left.")
+                else:
+                    raise RuntimeError(f"'{filename}' doesn't match its md5 sum after {retries + 1} attempts.")
+            finally:
+                if os.path.isfile(part_local_path):
+                    os.remove(part_local_path)
 
-            csv_local_path = os.path.join(
-                dl_path, os.path.splitext(filename)[0])
             result = (zip_local_path, is_md5_equal)
         else:
             logging.debug(f"Skipping download for: {zip_local_path}.")
+            # Without extraction the archive itself is the result, so a cached archive has to be handed out as well.
+            if not extract and os.path.isfile(zip_local_path):
+                result = (zip_local_path, is_md5_equal)
 
         if extract and not os.path.isfile(os.path.splitext(zip_local_path)[0]):
-            self.unzip(zip_local_path, dl_path)
             csv_local_path = os.path.join(
                 dl_path, os.path.splitext(filename)[0])
+            with self.stage("unzip"):
+                self.unzip(zip_local_path, dl_path)
+                self.count(bytes=os.path.getsize(csv_local_path))
             result = (csv_local_path, is_md5_equal)
         else:
             logging.debug(f"Skipping extraction of {zip_local_path}.")
@@ -159,7 +314,6 @@ class GdeltDownloader(object):
             Iterator object with download results.
         """
 
-        _ = input("Press 'Enter' to start download and extraction process ...")
         executor = ThreadPoolExecutor(max_workers=thread_count)
         results = tqdm(executor.map(
             self.download_file, files, repeat(dl_path)), desc="Queuing downloads ...")
@@ -179,11 +333,105 @@ class GdeltDownloader(object):
         str
             md5 hexdigest
         """
+        file_hash = md5()
         with open(file_path, "rb") as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                md5().update(chunk)
+            for chunk in iter(lambda: f.read(self.chunk_size), b""):
+                file_hash.update(chunk)
+
+        return file_hash.hexdigest()
+
+    def load_manifest(self, dl_path: str) -> Dict[str, Dict]:
+        """Loads the checksum manifest of a download directory.
+
+        The manifest is a JSON lines file with one entry per verified archive (file name, md5 sum and size in bytes).
+        It is only ever appended to, so several processes can write to it at the same time. Later entries win.
+
+        Parameters
+        ----------
+        dl_path : str
+            Download directory.
+
+        Returns
+        -------
+        Dict[str, Dict]
+            Manifest entries by file name.
+        """
+        if dl_path not in self.manifests:
+            manifest = {}
+            manifest_path = os.path.join(dl_path, self.manifest_name)
+            try:
+                with open(manifest_path, "r", encoding="utf8") as f:
+                    for line in f:
+                        try:
+                            entry = json.loads(line)
+                            manifest[entry["file"]] = entry
+                        except (ValueError, KeyError):
+                            continue  # Skip lines that were cut off by a crash.
+            except FileNotFoundError:
+                logging.debug(f"No manifest found at '{manifest_path}'.")
+            self.manifests[dl_path] = manifest
+
+        return self.manifests[dl_path]
+
+    def record_checksum(self, file_path: str, md5_hash: str) -> None:
+        """Adds a verified archive to the manifest.
+
+        Parameters
+        ----------
+        file_path : str
+            Full path of the verified file.
+        md5_hash : str
+            md5 hexdigest of the file.
+        """
+        dl_path, filename = os.path.split(file_path)
+        entry = {"file": filename, "md5": md5_hash,
+                 "size": os.path.getsize(file_path)}
+        self.load_manifest(dl_path)[filename] = entry
+
+        with open(os.path.join(dl_path, self.manifest_name), "a", encoding="utf8") as f:
+            f.write(json.dumps(entry) + "\n")
+
+    def is_verified(self, file_path: str, file_obj: Dict) -> bool:
+        """Checks the md5 sum of a local archive, trusting the manifest if possible.
+
+        If the manifest has an entry with the expected md5 sum and the file still has the recorded size, the file is
+        trusted without reading it. Otherwise the file is hashed once and added to the manifest if it matches.
+
+        Parameters
+        ----------
+        file_path : str
+            Full path of the local archive.
+        file_obj : Dict
+            Information about the file, as returned by 'get_file_links'.
+
+        Returns
+        -------
+        bool
+            True if the md5 sum of the file matches.
+        """
+        dl_path, filename = os.path.split(file_path)
+        entry = self.load_manifest(dl_path).get(filename)
+        if entry and entry["md5"] == file_obj['md5'] and entry["size"] == os.path.getsize(file_path):
+            return True
+
+        with self.stage("checksum"):
+            self.count(bytes=os.path.getsize(file_path))
+            is_md5_equal = self.md5sum(file_path) == file_obj['md5']
+        if is_md5_equal:
+            self.record_checksum(file_path, file_obj['md5'])
+            return True
+
+        return False
+
+    def stage(self, stage: str):
+        """
+        Measures the block as {stage} in the metrics of the integrator, if there are any.
+        """
+        return self.metrics.stage(stage) if self.metrics else nullcontext()
 
-        return md5().hexdigest()
+    def count(self, **values: float) -> None:
+        if self.metrics:
+            self.metrics.count(**values)
 
     def unzip(self, file_path: str, extract_path: str, remove: bool = True) -> None:
         """Unzip a file to the specified path and delete the file after.
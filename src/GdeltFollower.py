@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+
+import logging
+import threading
+import requests
+from datetime import datetime, timedelta
+
+from src.GdeltIntegrator import GdeltIntegrator
+
+from typing import List, Dict, Optional
+
+
+class GdeltFollower(object):
+    """
+    Keeps the database up to date with a GDELT feed, instead of loading a fixed date range. Every poll lists the exports
+    published after the high-water mark, loads them with 'GdeltIntegrator.integrate_files' and moves the mark past them.
+
+    The feed depends on the 'gdelt_version' of the integrator: GDELT 1.0 publishes one export per day in the index page
+    of its URL (see 'GdeltDownloader.get_file_links'), GDELT 2.0 one every 15 minutes, announced in 'lastupdate.txt'.
+    That file only names the newest export, the ones in between are derived from their timestamps.
+
+    The mark is stored per URL in 'ingest_watermark'. It only passes an export once it is loaded, or failed
+    {max_retries} times. Without a mark the daily feed starts at the start date of the integrator and the 15 minute
+    feed at its newest export.
+    """
+
+    poll_intervals = {1: 3600.0, 2: 60.0}  # Seconds between two polls per GDELT version.
+    update_interval = timedelta(minutes=15)  # Time between two exports of GDELT 2.0.
+    max_files_per_poll = 96  # Exports loaded per poll, a backlog is worked off in several polls without a pause.
+    timeout = 60
+
+    def __init__(self, integrator: GdeltIntegrator, table_names: List[str] = None, poll_interval: Optional[float] = None, max_retries: int = 3, max_workers: Optional[int] = None, pipeline: Optional[Dict[str, int]] = None):
+        super().__init__()
+        self.integrator = integrator
+        self.table_names = table_names
+        self.poll_interval = poll_interval if poll_interval else self.poll_intervals[integrator.gdelt_version]
+        self.max_retries = max_retries
+        self.max_workers = max_workers  # See 'GdeltIntegrator.integrate_files'.
+        self.pipeline = pipeline
+        self.feed = integrator.downloader.base_url  # Key of the mark in 'ingest_watermark'.
+        self.start_date = integrator.downloader.start_date
+        self.failures: Dict[str, int] = {}  # Failed attempts per file.
+        self.backlog = False  # Whether the last poll left exports for the next one.
+
+    def follow(self, max_polls: Optional[int] = None, stop: Optional[threading.Event] = None) -> int:
+        """
+        Polls the feed every {poll_interval} seconds until {stop} is set, {max_polls} polls are done or Ctrl+C is
+        pressed. A feed that can't be reached is tried again with the next poll. Returns the number of loaded exports.
+        """
+        stop = stop if stop else threading.Event()
+        polls, loaded = 0, 0
+        logging.info(f"Following '{self.feed}' every {self.poll_interval:.0f} s.")
+
+        try:
+            while not stop.is_set() and (max_polls is None or polls < max_polls):
+                try:
+                    loaded += sum(1 for result in self.poll() if not result["error"])
+                except requests.RequestException as e:
+                    logging.warning(f"Could not poll '{self.feed}', trying again in {self.poll_interval:.0f} s: {e}")
+                polls += 1
+                if not self.backlog and (max_polls is None or polls < max_polls):
+                    stop.wait(self.poll_interval)
+        except KeyboardInterrupt:
+            logging.warning(f"Stopped following '{self.feed}'.")
+
+        return loaded
+
+    def poll(self) -> List[Dict]:
+        """
+        Loads the exports published after the mark and moves the mark past the ones that are done. Returns the results
+        of 'integrate_files'.
+        """
+        mark = self.watermark()
+        files = self.pending_files(mark)
+        self.backlog = len(files) >= self.max_files_per_poll
+        if not files:
+            return []
+
+        results = self.integrator.integrate_files(
+            files, self.max_workers, self.table_names, pipeline=self.pipeline)
+
+        # Files without a result were skipped by the ledger, which counts as loaded.
+        errors = {result["file"]: result["error"] for result in results}
+        new_mark = mark
+        for file in files:
+            error = errors.get(file["file"])
+            if error:
+                self.failures[file["file"]] = self.failures.get(file["file"], 0) + 1
+                if self.failures[file["file"]] < self.max_retries:
+                    break  # Tried again with the next poll, the later files are skipped by the ledger then.
+                logging.error(
+                    f"Giving up on '{file['file']}' after {self.max_retries} attempts: {error}")
+            self.failures.pop(file["file"], None)
+            new_mark = self.key(file)
+
+        if new_mark != mark:
+            self.set_watermark(new_mark)
+            logging.info(f"Loaded '{self.feed}' up to {new_mark}.")
+        return results
+
+    def pending_files(self, mark: Optional[str]) -> List[Dict]:
+        """
+        Returns the exports after the {mark} (as returned by 'get_file_links'), at most {max_files_per_poll}, oldest first.
+        """
+        if self.integrator.gdelt_version == 2:
+            files = self.update_files(mark)
+        else:
+            files = self.daily_files(mark)
+        return files[:self.max_files_per_poll]
+
+    def daily_files(self, mark: Optional[str]) -> List[Dict]:
+        """
+        Lists the daily exports of GDELT 1.0 after the mark. The index page is only downloaded if it changed.
+        """
+        downloader = self.integrator.downloader
+        downloader.start_date = datetime.strptime(mark, "%Y%m%d") + timedelta(days=1) if mark else self.start_date
+        downloader.end_date = datetime.now()
+        files = downloader.get_file_links(refresh=True)
+        return sorted(files, key=self.key)
+
+    def update_files(self, mark: Optional[str]) -> List[Dict]:
+        """
+        Lists the 15 minute exports of GDELT 2.0 after the mark. 'lastupdate.txt' has a line 'size md5 url' for the
+        newest export (and for the mentions and GKG files), the exports in between have no known md5 sum.
+        """
+        url = self.feed.rstrip("/") + "/lastupdate.txt"
+        response = requests.get(url, timeout=self.timeout)
+        response.raise_for_status()
+
+        latest = None
+        for line in response.text.splitlines():
+            parts = line.split()
+            if len(parts) == 3 and parts[2].endswith(".export.CSV.zip"):
+                latest = {"file": parts[2].split("/")[-1], "md5": parts[1], "size": int(parts[0]) / 1e6}
+        if latest is None:
+            logging.warning(f"'{url}' doesn't list an export.")
+            return []
+        if mark is None:
+            return [latest]
+
+        files = []
+        moment = datetime.strptime(mark, "%Y%m%d%H%M%S") + self.update_interval
+        newest = datetime.strptime(self.key(latest), "%Y%m%d%H%M%S")
+        while moment < newest and len(files) < self.max_files_per_poll:
+            files.append({"file": f"{moment:%Y%m%d%H%M%S}.export.CSV.zip", "md5": None, "size": None})
+            moment += self.update_interval
+        if self.key(latest) > mark:
+            files.append(latest)
+        return files
+
+    @staticmethod
+    def key(file: Dict) -> str:
+        """
+        Returns the timestamp in the name of an export, e.g. '20150101' or '20150101120000'.
+        """
+        return file["file"].split("/")[-1].split(".")[0]
+
+    def watermark(self) -> Optional[str]:
+        conn, cur = self.integrator.connect_database(autocommit=True)
+        try:
+            cur.execute("SELECT Mark FROM ingest_watermark WHERE Feed = %s", (self.feed,))
+            row = cur.fetchone()
+            return row[0] if row else None
+        finally:
+            self.integrator.release_connection(conn, cur)
+
+    def set_watermark(self, mark: str) -> None:
+        conn, cur = self.integrator.connect_database(autocommit=True)
+        try:
+            cur.execute("INSERT INTO ingest_watermark (Feed, Mark) VALUES (%s, %s) "
+                        "ON CONFLICT (Feed) DO UPDATE SET Mark = EXCLUDED.Mark, UpdatedAt = now()", (self.feed, mark))
+        finally:
+            self.integrator.release_connection(conn, cur)
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    logging.basicConfig(level=logging.INFO)
+    parser = ArgumentParser(description="Load new GDELT exports as soon as they are published.")
+    parser.add_argument("--version", type=int, choices=[1, 2], default=2,
+                        help="1 for the daily exports of GDELT 1.0, 2 for the 15 minute exports of GDELT 2.0.")
+    parser.add_argument("--url", help="URL of the feed, by default the one of the GDELT project for the version.")
+    parser.add_argument("--interval", type=float, help="Seconds between two polls.")
+    parser.add_argument("--max-polls", type=int, help="Stop after this many polls.")
+    parser.add_argument("--dl-path", default="./data/gdelt")
+    parser.add_argument("--tables", nargs="+",
+                        default=["data_management_fields", "event_geo", "actor1", "actor2", "event_action",
+                                 "eventid_and_date", "event_rollup_daily", "event_rollup_monthly"],
+                        help="Tables to fill.")
+    args = parser.parse_args()
+
+    default_urls = {1: "http://data.gdeltproject.org/events/", 2: "http://data.gdeltproject.org/gdeltv2/"}
+    now = datetime.now()
+    integrator = GdeltIntegrator((now.year, now.month, now.day), (now.year, now.month, now.day),
+                                 url=args.url if args.url else default_urls[args.version], dl_path=args.dl_path,
+                                 gdelt_version=args.version)
+    follower = GdeltFollower(integrator, args.tables, poll_interval=args.interval)
+    print(f"Loaded {follower.follow(max_polls=args.max_polls)} exports.")
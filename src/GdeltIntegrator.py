@@ -2,20 +2,27 @@
 
 
 import os
+import signal
 import logging
+import threading
+import queue
+import asyncio
 
 import pandas as pd
-from itertools import repeat
 from psycopg2.errors import UniqueViolation
-from concurrent.futures import ThreadPoolExecutor, ALL_COMPLETED, wait
-from multiprocessing import Pool, Queue, Lock
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
 from tqdm import tqdm
 
 from src.utils import *
 from src.GdeltDownloader import GdeltDownloader
+from src.AsyncGdeltDownloader import AsyncGdeltDownloader
 from src.DataIntegrator import DataIntegrator
+from src.LoadPhaseManager import LoadPhaseManager
+from src.ParquetCache import ParquetCache
+from src.AdaptiveChunker import AdaptiveChunker
+from src.StageQueue import StageQueue, StageCancelled
 
-from typing import List, Generator, Tuple, Dict, Optional
+from typing import List, Generator, Tuple, Dict, Optional, Iterator
 
 
 class GdeltIntegrator(DataIntegrator):
@@ -23,13 +30,39 @@ class GdeltIntegrator(DataIntegrator):
     Class description.
     """
 
-    def __init__(self, start_date: Tuple[int, int, int], end_date: Tuple[int, int, int], url: str = "http://data.gdeltproject.org/events/", dl_path: str = "./data/gdelt"):
-        self.downloader = GdeltDownloader(start_date, end_date, url, dl_path)
+    # Worker threads per stage of the pipelined load (see 'integrate_pipelined'), for the stages not given explicitly.
+    pipeline_workers: Dict[str, int] = {"download": 4, "parse": 2, "load": 2}
+    pipeline_queue_size = 2  # Items (files or chunks) waiting between two stages.
+
+    def __init__(self, start_date: Tuple[int, int, int], end_date: Tuple[int, int, int], url: str = "http://data.gdeltproject.org/events/", dl_path: str = "./data/gdelt", chunksize: Optional[int] = 100000, stream_zip: bool = True, keep_zip: bool = False, warm_start: bool = False, defer_constraints: bool = False, parquet_cache: Optional[str] = None, metrics_path: Optional[str] = None, memory_budget: Optional[int] = None, fanout: bool = False, gdelt_version: int = 1, async_download: bool = False):
+        # The asynchronous downloader is only used by the pipeline, it downloads single files like the other one.
+        self.downloader = (AsyncGdeltDownloader if async_download else GdeltDownloader)(start_date, end_date, url, dl_path)
+        self.async_download = async_download
+        self.start_date = start_date
+        self.end_date = end_date
         self.table_script = "./schema/prepare_database.psql"
         self.data = "./data/20191027.export.CSV"
+        self.chunksize = chunksize  # Rows per streamed chunk. 'None' loads every file as a whole.
+        # Read the export straight from the archive instead of extracting it to disk first.
+        self.stream_zip = stream_zip
+        self.keep_zip = keep_zip  # Keep the archives as a local cache (only when streaming).
+        # Fill the key caches of the dimension tables from the database before loading.
+        self.warm_start = warm_start
+        # Drop the indexes and constraints before loading and rebuild them afterwards (see LoadPhaseManager).
+        self.defer_constraints = defer_constraints
+        # Directory of the Parquet cache of the parsed exports, 'None' disables the cache (see ParquetCache).
+        self.parquet_cache = parquet_cache
+        # Directory the stage metrics are written to, 'None' only collects them (see PipelineMetrics).
+        self.metrics_path = metrics_path
+        # Bytes of memory per process, the chunks are sized to stay below it (see AdaptiveChunker). 'None' reads
+        # {chunksize} rows at a time.
+        self.memory_budget = memory_budget
+        # Layout of the exports: 1 for the daily files of GDELT 1.0, 2 for the 15 minute files of GDELT 2.0.
+        self.gdelt_version = gdelt_version
 
         self.table_names = ["data_management_fields", "event_geo", "actor", "actor1", "actor2",
-                            "country", "income", "tourist", "influence_income", "event_action", "eventid_and_date"]
+                            "country", "income", "tourist", "influence_income", "event_action", "eventid_and_date",
+                            "event_rollup_daily", "event_rollup_monthly"]
 
         self.headers = ["GLOBALEVENTID", "SQLDATE", "MonthYear", "Year", "FractionDate",                            "Actor1Code", "Actor1Name",
                         "Actor1CountryCode", "Actor1KnownGroupCode", "Actor1EthnicCode", "Actor1Religion1Code",
@@ -45,10 +78,45 @@ class GdeltIntegrator(DataIntegrator):
                         "ActionGeo_ADM1Code", "ActionGeo_Lat", "ActionGeo_Long", "ActionGeo_FeatureID", "DATEADDED",
                         "SOURCEURL"]
 
+        # Types used when parsing the export. IDs, dates and counts are integers (always present in the export), the
+        # measures float32 and the CAMEO codes categoricals, since they only take a few hundred distinct values.
+        # Everything else stays a string.
+        cameo_codes = ["Actor1CountryCode", "Actor1KnownGroupCode", "Actor1EthnicCode", "Actor1Religion1Code",
+                       "Actor1Religion2Code", "Actor1Type1Code", "Actor1Type2Code", "Actor1Type3Code", "Actor2CountryCode",
+                       "Actor2KnownGroupCode", "Actor2EthnicCode", "Actor2Religion1Code", "Actor2Religion2Code",
+                       "Actor2Type1Code", "Actor2Type2Code", "Actor2Type3Code", "EventCode", "EventBaseCode",
+                       "EventRootCode", "Actor1Geo_CountryCode", "Actor2Geo_CountryCode", "ActionGeo_CountryCode"]
+        integers = ["GLOBALEVENTID", "SQLDATE", "MonthYear", "Year", "IsRootEvent", "QuadClass", "NumMentions",
+                    "NumSources", "NumArticles", "Actor1Geo_Type", "Actor2Geo_Type", "ActionGeo_Type", "DATEADDED"]
+        floats = ["GoldsteinScale", "AvgTone", "Actor1Geo_Lat", "Actor1Geo_Long", "Actor2Geo_Lat", "Actor2Geo_Long",
+                  "ActionGeo_Lat", "ActionGeo_Long"]
+
+        self.dtypes = {header: "str" for header in self.headers}
+        self.dtypes.update({header: "category" for header in cameo_codes})
+        self.dtypes.update({header: "int32" for header in integers})
+        self.dtypes.update({header: "float32" for header in floats})
+        self.dtypes["FractionDate"] = "float64"  # float32 can't hold the 4 decimals of the year.
+
+        # Lookup tables for the CAMEO codes, filled from the files of the GDELT documentation.
+        self.dictionaries = {
+            "cameo_country": "./data/doc/gdelt/CAMEO.country.txt",
+            "cameo_ethnic": "./data/doc/gdelt/CAMEO.ethnic.txt",
+            "cameo_eventcode": "./data/doc/gdelt/CAMEO.eventcodes.txt",
+            "cameo_knowngroup": "./data/doc/gdelt/CAMEO.knowngroup.txt",
+            "cameo_religion": "./data/doc/gdelt/CAMEO.religion.txt",
+            "cameo_type": "./data/doc/gdelt/CAMEO.type.txt"
+        }
+        actor_encodings = {"KnownGroupCode": "cameo_knowngroup", "Religion1Code": "cameo_religion",
+                           "Religion2Code": "cameo_religion", "CountryCode": "cameo_country", "Type1Code": "cameo_type",
+                           "Type2Code": "cameo_type", "Type3Code": "cameo_type", "EthnicCode": "cameo_ethnic"}
+        actor_types = ["text", "text"] + ["smallint"] * 8 + ["text"]
+
         self.tables = {
             "data_management_fields": {
                 "headers": [self.headers[i] for i in [0, 56, 57]],
                 "attributes": ["GlobalEventID", "DATEADDED", "SOURCEURL"],
+                "types": ["integer", "integer", "text"],
+                "copy_format": "binary",
                 "uniques": []  # FIXME ["SOURCEURL"]
             },
             "event_geo": {
@@ -57,7 +125,11 @@ class GdeltIntegrator(DataIntegrator):
                                                              [45, 48, 44, 46, 47, 42, 43]], [self.headers[i] for i in
                                                                                              [52, 55, 51, 53, 54, 49, 50]]],
                 "attributes": ["ADM1Code", "FeatureID", "CountryCode", "Lat", "Long", "Type", "FullName"],
-                "uniques": ["Actor1Geo_ADM1Code", "Actor2Geo_ADM1Code", "ActionGeo_ADM1Code"]
+                "types": ["text", "text", "text", "real", "real", "integer", "text"],
+                "copy_format": "binary",
+                "uniques": ["Actor1Geo_ADM1Code", "Actor2Geo_ADM1Code", "ActionGeo_ADM1Code"],
+                "merge": True,
+                "dimension": True
             },
             "actor": {
                 "attributes": ["Code", "Name", "KnownGroupCode", "Religion1Code", "Religion2Code", "CountryCode", "Type1Code", "Type2Code", "Type3Code", "EthnicCode"],
@@ -65,19 +137,27 @@ class GdeltIntegrator(DataIntegrator):
             },
             "actor1":  {
                 "headers": [self.headers[i]
-                            for i in [5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 38]],
+                            for i in [5, 6, 8, 10, 11, 7, 12, 13, 14, 9, 38]],
                 "attributes": ["Code", "Name", "KnownGroupCode", "Religion1Code", "Religion2Code", "CountryCode", "Type1Code", "Type2Code", "Type3Code", "EthnicCode", "ADM1Code"],
-                "uniques": ["Actor1Code"]
+                "types": actor_types,
+                "encodings": actor_encodings,
+                "uniques": ["Actor1Code"],
+                "merge": True,
+                "dimension": True
             },
             "actor2": {
                 "headers": [self.headers[i]
-                            for i in [15, 16, 17, 18, 19, 20, 21, 22, 23, 24, 45]],
+                            for i in [15, 16, 18, 20, 21, 17, 22, 23, 24, 19, 45]],
                 "attributes": ["Code", "Name", "KnownGroupCode", "Religion1Code", "Religion2Code", "CountryCode", "Type1Code", "Type2Code", "Type3Code", "EthnicCode", "ADM1Code"],
-                "uniques": ["Actor2Code"]
+                "types": actor_types,
+                "encodings": actor_encodings,
+                "uniques": ["Actor2Code"],
+                "merge": True,
+                "dimension": True
             },
             "country": {
                 "headers": [],
-                "attributes": ["CID", "Geo_Name"],
+                "attributes": ["CID"],
                 "uniques": []
             },
             "income": {
@@ -97,47 +177,559 @@ class GdeltIntegrator(DataIntegrator):
             },
             "event_action": {
                 "headers": [self.headers[i] for i in [
-                    0, 26, 5, 15, 52, 27, 28, 25, 30, 29, 34, 31, 32, 33]],
-                "attributes": ["GLobalEventID", "EventCode", "Actor1Code", "Actor2Code", "ADM1Code", "EventBaseCode", "EventRootCode", "IsRootEvent", "GoldsteinScale", "QuadClass", "AvgTone", "NumMentions", "NumSources", "NumArticles"],
-                "uniques": []
+                    0, 26, 5, 15, 52, 27, 28, 25, 30, 29, 34, 31, 32, 33, 2]],
+                "attributes": ["GLobalEventID", "EventCode", "Actor1Code", "Actor2Code", "ADM1Code", "EventBaseCode", "EventRootCode", "IsRootEvent", "GoldsteinScale", "QuadClass", "AvgTone", "NumMentions", "NumSources", "NumArticles", "MonthYear"],
+                "types": ["integer", "smallint", "text", "text", "text", "smallint", "smallint", "integer", "real", "integer", "real", "integer", "integer", "integer", "integer"],
+                "copy_format": "binary",
+                "encodings": {"EventCode": "cameo_eventcode", "EventBaseCode": "cameo_eventcode", "EventRootCode": "cameo_eventcode"},
+                "uniques": [],
+                "partition_by": "MonthYear"
             },
             "eventid_and_date": {
                 "headers": [self.headers[i] for i in [0, 4, 56, 2, 3]],
                 "attributes": ["GlobalEventID", "FractionDate", "Day", "MonthYear", "Year"],
-                "uniques": ["GLOBALEVENTID"]
+                "types": ["integer", "float", "integer", "integer", "integer"],
+                "copy_format": "binary",
+                "uniques": ["GLOBALEVENTID"],
+                "conflict": ["GlobalEventID", "MonthYear"],
+                "merge": True,
+                "partition_by": "MonthYear"
+            },
+            # Aggregates for the reports, updated with every loaded file (see 'accumulate_rollup').
+            "event_rollup_daily": {
+                "headers": [self.headers[i] for i in [1, 51, 28, 34, 30, 33]],
+                "attributes": ["SQLDate", "CountryCode", "EventRootCode", "SumAvgTone", "SumGoldsteinScale", "NumArticles", "NumEvents"],
+                "types": ["integer", "text", "smallint", "double precision", "double precision", "bigint", "bigint"],
+                "copy_format": "binary",
+                "encodings": {"EventRootCode": "cameo_eventcode"},
+                "uniques": [],
+                "rollup": {"keys": ["SQLDate", "CountryCode", "EventRootCode"]}
+            },
+            "event_rollup_monthly": {
+                "headers": [self.headers[i] for i in [2, 51, 28, 34, 30, 33]],
+                "attributes": ["MonthYear", "CountryCode", "EventRootCode", "SumAvgTone", "SumGoldsteinScale", "NumArticles", "NumEvents"],
+                "types": ["integer", "text", "smallint", "double precision", "double precision", "bigint", "bigint"],
+                "copy_format": "binary",
+                "encodings": {"EventRootCode": "cameo_eventcode"},
+                "uniques": [],
+                "rollup": {"keys": ["MonthYear", "CountryCode", "EventRootCode"]}
             }
         }
-        super().__init__(self.table_names, self.tables)
+        super().__init__(self.table_names, self.tables, metrics_path)
+        self.fanout = fanout  # Write the tables of a file in parallel, see 'FanoutWriter'.
+        self.downloader.metrics = self.metrics
+        if gdelt_version == 2:
+            # GDELT 2.0 has an ADM2 code after every ADM1 code, which no table uses, and adds the time to DATEADDED
+            # (see 'transform'). The tables refer to the columns by name, so they stay the same.
+            self.headers = [column for header in self.headers for column in
+                            ([header, header.replace("ADM1", "ADM2")] if header.endswith("Geo_ADM1Code") else [header])]
+            self.dtypes.update({header: self.dtypes[header.replace("ADM2", "ADM1")] for header in self.headers
+                                if header.endswith("Geo_ADM2Code")})
+            self.dtypes["DATEADDED"] = "int64"
+        elif gdelt_version != 1:
+            raise ValueError(f"Unknown GDELT version {gdelt_version}, use 1 or 2.")
+        if memory_budget:
+            # The budget needs the file to be streamed, {chunksize} is only the size of the first chunk.
+            self.chunksize = chunksize if chunksize else 100000
+            self.chunker = AdaptiveChunker(memory_budget, initial_rows=self.chunksize)
+        self.cache = ParquetCache(
+            parquet_cache, self.headers, self.dtypes) if parquet_cache else None
+
+    def download_and_integrate(self, max_workers: Optional[int] = None, table_names: List[str] = None, max_in_flight: Optional[int] = None, pipeline: Optional[Dict[str, int]] = None) -> List[Dict]:
+        """Downloads and integrates all files in the date range.
 
-    def download_and_integrate(self, max_workers: Optional[int] = None, table_names: List[str] = None) -> None:
+        Parameters
+        ----------
+        max_workers : Optional[int], optional
+            Number of worker processes, by default None which does everything in the main process.
+        table_names : List[str], optional
+            Tables to fill, by default all tables.
+        max_in_flight : Optional[int], optional
+            Maximum number of files handed to the workers at once, by default twice the number of workers.
+        pipeline : Optional[Dict[str, int]], optional
+            Worker threads per stage ('download', 'parse', 'load'), runs the stages overlapped in this process instead
+            (see 'integrate_pipelined'). By default None.
+
+        Returns
+        -------
+        List[Dict]
+            One result per file, see 'integrate_file'.
+        """
         _ = input("Press 'Enter' to start download and extraction process ...")
+
+        with self.metrics.stage("discover"):
+            file_list = self.downloader.get_file_links()
+            self.metrics.count(rows=len(file_list))
+        self.metrics.flush()
+        return self.integrate_files(file_list, max_workers, table_names, max_in_flight, pipeline)
+
+    def rebuild_from_cache(self, max_workers: Optional[int] = None, table_names: List[str] = None, max_in_flight: Optional[int] = None, pipeline: Optional[Dict[str, int]] = None) -> List[Dict]:
+        """
+        Integrates all files of the date range that are in the Parquet cache, without downloading or parsing anything.
+        Takes the same arguments as 'download_and_integrate'.
+        """
+        if not self.cache:
+            raise ValueError("There is no Parquet cache to rebuild from, pass 'parquet_cache' to the integrator.")
+
+        start_key, end_key = (f"{y:04d}{m:02d}{d:02d}" for y, m, d in (self.start_date, self.end_date))
+        file_list = [{"file": f"{key}.export.CSV.zip", "md5": self.cache.metadata(key).get("md5")}
+                     for key in self.cache.keys() if start_key <= key[:8] <= end_key]  # GDELT 2.0 keys add the time.
+        return self.integrate_files(file_list, max_workers, table_names, max_in_flight, pipeline)
+
+    def integrate_files(self, file_list: List[Dict], max_workers: Optional[int] = None, table_names: List[str] = None, max_in_flight: Optional[int] = None, pipeline: Optional[Dict[str, int]] = None) -> List[Dict]:
+        """
+        Integrates the files (as returned by 'get_file_links'), see 'download_and_integrate' for the arguments.
+        """
+        if max_workers and pipeline is not None:
+            raise ValueError("Use either worker processes ('max_workers') or the pipeline of threads ('pipeline').")
         table_names = table_names if table_names else self.table_names
 
-        file_list = self.downloader.get_file_links()
+        # Files the ledger lists as completed for all tables are skipped before they are even downloaded.
+        ledger = self.load_ledger([file["file"] for file in file_list])
+        pending_files = [file for file in file_list
+                         if not set(table_names) <= ledger.get(file["file"], set())]
+        if len(pending_files) < len(file_list):
+            print(
+                f"Skipping {len(file_list) - len(pending_files)} file(s) the ledger lists as completed.")
+        file_list = pending_files
 
-        # Assume we want to do everything in the main thread.
-        if not max_workers:
-            for file in tqdm(file_list, desc="Downloading and integrating GDELT files ...", mininterval=5.0):
-                logging.info(file)
-                self.gdelt_wrapper(file, self.downloader.dl_path, table_names)
+        # Tables a crashed load prepared but didn't commit would hold their locks and rows until they are resolved.
+        if self.fanout:
+            recovered = self.recover_prepared()
+            if any(recovered.values()):
+                print(f"Recovered prepared transactions of an earlier run: {recovered}.")
 
-        # Lets start some threads, shall we?
-        else:
-            logging.info(f"Starting {max_workers} thread(s).")
-            executor = ThreadPoolExecutor(max_workers=max_workers)
-            results = tqdm(executor.map(
-                self.gdelt_wrapper, file_list, repeat(self.downloader.dl_path)), desc="Downloading and integrating GDELT files ...")
+        load_phase = LoadPhaseManager(
+            self, table_names) if self.defer_constraints and file_list else None
+        if load_phase:
+            load_phase.drop()
+
+        try:
+            # The stages run in threads of the main process, overlapping each other.
+            if pipeline is not None:
+                if self.warm_start:
+                    self.warm_key_caches(table_names)
+                results = self.integrate_pipelined(file_list, table_names, pipeline)
+
+            # Assume we want to do everything in the main process.
+            elif not max_workers:
+                if self.warm_start:
+                    self.warm_key_caches(table_names)
+                results = []
+                for file in tqdm(file_list, desc="Downloading and integrating GDELT files ...", mininterval=5.0):
+                    logging.info(file)
+                    result = self.integrate_file(file, table_names)
+                    result.pop("metrics")  # Already written by 'integrate_file'.
+                    results.append(result)
+
+            # Every file is handled by its own worker process with its own database connection.
+            else:
+                results = self.integrate_parallel(
+                    file_list, table_names, max_workers, max_in_flight)
+        finally:
+            if load_phase:
+                print("Rebuilding indexes and constraints ...")
+                load_phase.rebuild()
+
+        failed = [result for result in results if result["error"]]
+        print(
+            f"{len(results) - len(failed)} of {len(file_list)} files integrated, {len(failed)} failed.")
+        for result in failed:
+            print(f"❌ {result['file']}: {result['error']}")
+        for stage, values in self.metrics.summary().items():
+            logging.info(f"Stage {stage}: {values['seconds']:.1f} s, {values['rows']:.0f} rows, "
+                         f"{values['bytes'] / 1e6:.1f} MB, {values['errors']:.0f} errors.")
+        peak = self.metrics.summary().get("parse", {}).get("peak_rss")
+        if peak:
+            logging.info(f"Highest peak memory usage of a file: {peak / 2 ** 20:.0f} MB.")
+
+        return results
+
+    def integrate_parallel(self, file_list: List[Dict], table_names: List[str], max_workers: int, max_in_flight: Optional[int] = None) -> List[Dict]:
+        """Integrates the files in a pool of worker processes.
+
+        At most {max_in_flight} files are submitted at once, so a long backfill doesn't queue thousands of tasks. On
+        Ctrl+C the files that haven't started yet are cancelled, while the running ones are finished and committed.
+
+        Returns
+        -------
+        List[Dict]
+            One result per finished file, in the order they finished.
+        """
+        max_in_flight = max_in_flight if max_in_flight else 2 * max_workers
+        logging.info(f"Starting {max_workers} worker process(es).")
+
+        results = []
+        pending = {}
+        executor = ProcessPoolExecutor(
+            max_workers=max_workers, initializer=_init_worker, initargs=(self.settings(),))
+        progress = tqdm(total=len(file_list),
+                        desc="Downloading and integrating GDELT files ...", mininterval=5.0)
+
+        def collect(done) -> None:
+            for future in done:
+                file = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:  # The worker process died, e.g. killed by the OOM killer.
+                    result = {"file": file["file"], "path": None,
+                              "md5": False, "error": repr(e), "metrics": []}
+                # The workers only collect the metrics, they are written by this process.
+                self.metrics.merge(result.pop("metrics"))
+                if result["error"]:
+                    logging.error(
+                        f"Integrating '{result['file']}' failed: {result['error']}")
+                else:
+                    logging.info(f"Integrated '{result['file']}'.")
+                results.append(result)
+                progress.update()
+
+        try:
+            for file in file_list:
+                if len(pending) >= max_in_flight:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+                pending[executor.submit(
+                    _integrate_in_worker, file, table_names)] = file
+
+            done, _ = wait(pending)
+            collect(done)
+        except KeyboardInterrupt:
+            logging.warning(
+                f"Interrupted. Cancelling the queued files and waiting for the running ones ...")
+            for future in pending:
+                future.cancel()
+            raise
+        finally:
+            executor.shutdown(wait=True)
+            progress.close()
+
+        return results
+
+    def integrate_pipelined(self, file_list: List[Dict], table_names: List[str], workers: Dict[str, int] = None, queue_size: Optional[int] = None) -> List[Dict]:
+        """Integrates the files in a pipeline of threads, so downloading, parsing and loading overlap.
+
+        Every stage has its own threads ({workers} per stage, see 'pipeline_workers' for the defaults), connected by
+        bounded queues of {queue_size} items. The download threads hand the local archives to the parse threads, which
+        start a file by handing a queue of its chunks to the load threads and then fill it. A full queue blocks the stage
+        before it, so the throughput approaches the one of the slowest stage while the downloaded files and parsed chunks
+        held at once stay bounded. The 'wait' stage of the metrics shows how long the load threads wait for chunks.
+
+        Every parse and load thread beyond the first uses its own integrator, with its own database connection and key
+        caches. On Ctrl+C no further files are downloaded, while the ones in the pipeline are finished and committed.
+
+        With {async_download} a single thread downloads the files with the 'AsyncGdeltDownloader' instead, which keeps
+        {workers['download']} requests going at once and resumes interrupted downloads.
+
+        The chunks have the fixed size {chunksize}, a {memory_budget} isn't applied: the threads share the memory of the
+        process, so the peak of a chunk can't be told apart from the others (nor reset for it without disturbing their
+        measurements), and a chunk is only projected and copied in a load thread after the parse thread read it. The
+        memory is bounded by the queues instead, at most about '(parse + load threads) * (queue_size + 1)' chunks.
+
+        Returns
+        -------
+        List[Dict]
+            One result per file, in the order they finished, see 'integrate_file'.
+        """
+        workers = dict(self.pipeline_workers, **(workers if workers else {}))
+        queue_size = queue_size if queue_size else self.pipeline_queue_size
+        logging.info(f"Starting a pipeline with {workers['download']} download, {workers['parse']} parse and "
+                     f"{workers['load']} load thread(s).")
+
+        files = queue.Queue()
+        for file in file_list:
+            files.put(file)
+        download_threads = 1 if self.async_download else workers["download"]
+        downloaded = StageQueue(queue_size, producers=download_threads)
+        parsed = StageQueue(queue_size, producers=workers["parse"])
+        stop = threading.Event()
+
+        results = []
+        progress = tqdm(total=len(file_list),
+                        desc="Downloading and integrating GDELT files ...", mininterval=5.0)
+
+        def finish(file: Dict, path: Optional[str], md5_equal: bool, error: Optional[Exception]) -> None:
+            if error:
+                logging.error(f"Integrating '{file['file']}' failed: {error!r}")
+            results.append({"file": file["file"], "path": path, "md5": md5_equal,
+                            "error": repr(error) if error else None})
+            self.metrics.flush()
+            progress.update()
+
+        def download() -> None:
+            while not stop.is_set():
+                try:
+                    file = files.get_nowait()
+                except queue.Empty:
+                    break
+                with self.metrics.file(file["file"]):
+                    try:
+                        result = self.download_stage(file)
+                    except Exception as e:
+                        finish(file, None, False, e)
+                        continue
+                if result:
+                    downloaded.put((file, result))
+                else:
+                    finish(file, None, False, None)  # The download was skipped, as in 'gdelt_wrapper'.
+            downloaded.close()
+
+        def download_async() -> None:
+            async def run() -> None:
+                loop = asyncio.get_running_loop()
+                pending = []
+                while not files.empty():
+                    file = files.get_nowait()
+                    key = file["file"].split(".")[0]
+                    if self.cache and self.cache.has(key):
+                        await loop.run_in_executor(None, downloaded.put, (file, (self.cache.path(key), True)))
+                    else:
+                        pending.append(file)
+
+                self.downloader.max_concurrency = workers["download"]
+                async for file, path, md5_equal in self.downloader.download_files(pending, self.downloader.dl_path):
+                    if path is None:
+                        finish(file, None, False, RuntimeError(f"Could not download '{file['file']}'."))
+                    else:
+                        if not self.stream_zip:
+                            with self.metrics.file(file["file"]), self.metrics.stage("unzip"):
+                                await loop.run_in_executor(None, self.downloader.unzip, path, self.downloader.dl_path)
+                            path = os.path.splitext(path)[0]
+                        # A full queue would block the other downloads, so the thread of the loop doesn't wait for it.
+                        await loop.run_in_executor(None, downloaded.put, (file, (path, md5_equal)))
+                    if stop.is_set():
+                        break
+
+            try:
+                asyncio.run(run())
+            finally:
+                downloaded.close()
+
+        def parse(integrator: GdeltIntegrator) -> None:
+            for file, result in downloaded:
+                chunks = StageQueue(queue_size)
+                parsed.put((file, result, chunks))
+                with self.metrics.file(file["file"]):
+                    try:
+                        for df in self.metrics.iterate("parse", integrator.parse_stage(file, result[0], table_names), count_rows=False):
+                            chunks.put(df)
+                            del df
+                        chunks.close()
+                    except StageCancelled:
+                        pass  # The load of the file failed, see 'load'.
+                    except Exception as e:
+                        chunks.close(e)
+            parsed.close()
+
+        def load(integrator: GdeltIntegrator) -> None:
+            for file, (path, md5_equal), chunks in parsed:
+                try:
+                    integrator.load_stage(file, path, table_names, chunks)
+                    finish(file, path, md5_equal, None)
+                except Exception as e:
+                    finish(file, None, False, e)
+                finally:
+                    chunks.cancel()  # Stops the parse thread if the file failed or was skipped.
+
+        parsers = [self if i == 0 else self.clone() for i in range(workers["parse"])]
+        loaders = [self if i == 0 else self.clone() for i in range(workers["load"])]
+        chunker = self.chunker
+        if chunker:
+            logging.warning(f"The memory budget isn't applied in the pipeline, reading {self.chunksize} rows at a time.")
+        for integrator in parsers + loaders:
+            integrator.chunker = None
+
+        threads = [threading.Thread(target=download_async if self.async_download else download, name=f"download-{i}",
+                                    daemon=True) for i in range(download_threads)]
+        threads += [threading.Thread(target=parse, args=(integrator,), name=f"parse-{i}", daemon=True)
+                    for i, integrator in enumerate(parsers)]
+        threads += [threading.Thread(target=load, args=(integrator,), name=f"load-{i}", daemon=True)
+                    for i, integrator in enumerate(loaders)]
+        for thread in threads:
+            thread.start()
+
+        try:
+            self.join_threads(threads)
+        except KeyboardInterrupt:
+            logging.warning(
+                f"Interrupted. Waiting for the files in the pipeline to finish ...")
+            stop.set()
+            self.join_threads(threads)
+            raise
+        finally:
+            self.chunker = chunker
+            progress.close()
+
+        return results
+
+    @staticmethod
+    def join_threads(threads: List[threading.Thread]) -> None:
+        # Joined with a timeout, so Ctrl+C reaches the main thread.
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(0.5)
+
+    def clone(self) -> "GdeltIntegrator":
+        """
+        Returns an integrator with the same settings and its own database connection and caches, which records its
+        stages in the metrics of this one.
+        """
+        integrator = GdeltIntegrator(**self.settings())
+        integrator.metrics = self.metrics
+        integrator.downloader.metrics = self.metrics
+        if self.warm_start:
+            integrator.warm_key_caches()
+        return integrator
+
+    def download_stage(self, file: Dict) -> Optional[Tuple[str, bool]]:
+        """
+        Downloads the file for the pipeline (see 'gdelt_wrapper'). Returns the local path and whether the md5 sum
+        matched, the cached Parquet file if the day is cached, or None if the download was skipped.
+        """
+        key = file["file"].split(".")[0]
+        if self.cache and self.cache.has(key):
+            return self.cache.path(key), True
+
+        with self.metrics.stage("download"):
+            return self.downloader.download_file(file, self.downloader.dl_path, extract=not self.stream_zip)
+
+    def parse_stage(self, file: Dict, path: str, table_names: List[str]) -> Iterator[pd.DataFrame]:
+        """
+        Returns the chunks of a downloaded file for the pipeline, as 'gdelt_wrapper' hands them to 'insert_wrapper2'.
+        """
+        key = file["file"].split(".")[0]
+        columns = self.projection(table_names, self.headers)
+        if self.cache and self.cache.has(key):
+            return self.cache.read_chunks(key, columns=columns, batch_size=self.chunksize)
+
+        self.metrics.add("parse", bytes=os.path.getsize(path))
+        frames = self.cached_frames(path, key, file["md5"])
+        if frames is not None:
+            return frames
+        if self.chunksize:
+            return self.read_csv_chunks(path, headers=self.headers, chunksize=self.chunksize, seperator="\t",
+                                        columns=columns, dtypes=self.dtypes)
+        return iter([self.read_csv(path, headers=self.headers, seperator="\t", columns=columns, dtypes=self.dtypes)])
+
+    def load_stage(self, file: Dict, path: str, table_names: List[str], chunks: StageQueue) -> None:
+        """
+        Inserts the chunks the parse stage puts into {chunks} in one transaction and removes the downloaded file, unless
+        it is a kept archive or the Parquet cache.
+        """
+        self.insert_wrapper2(path, self.headers, seperator="\t", table_names=table_names, ledger_key=file["file"],
+                             md5_hash=file["md5"], frames=self.metrics.iterate("wait", chunks, count_rows=False))
+        if self.cache and path == self.cache.path(file["file"].split(".")[0]):
+            return
+        if not path.lower().endswith(".zip") or not self.keep_zip:
+            os.remove(path)
+
+    def integrate_file(self, file: Dict, table_names: List[str]) -> Dict:
+        """
+        Downloads and integrates a single file. Never raises, errors are reported in the result instead.
+        The result contains the name of the file, the local path, whether the md5 sum matched, the error (or None) and
+        the metrics of its stages.
+        """
+        with self.metrics.file(file["file"]):
+            try:
+                result = self.gdelt_wrapper(
+                    file, self.downloader.dl_path, table_names)
+                path, md5_equal = result if result else (None, False)
+                result = {"file": file["file"], "path": path, "md5": md5_equal, "error": None}
+            except Exception as e:
+                logging.error(e)
+                result = {"file": file["file"], "path": None, "md5": False, "error": repr(e)}
+        result["metrics"] = self.metrics.flush()
+        return result
+
+    def settings(self) -> Dict:
+        """
+        Returns the constructor arguments of this integrator, used to build an identical one in the worker processes.
+        """
+        return {"start_date": self.start_date, "end_date": self.end_date, "url": self.downloader.base_url,
+                "dl_path": self.downloader.dl_path, "chunksize": self.chunksize, "stream_zip": self.stream_zip,
+                "keep_zip": self.keep_zip, "warm_start": self.warm_start,
+                "defer_constraints": self.defer_constraints, "parquet_cache": self.parquet_cache,
+                "metrics_path": self.metrics_path, "memory_budget": self.memory_budget, "fanout": self.fanout,
+                "gdelt_version": self.gdelt_version, "async_download": self.async_download}
 
     def gdelt_wrapper(self, file: Dict, dl_path: str, table_names: List[str]) -> Optional[Tuple]:
-        result = self.downloader.download_file(file, dl_path)
+        # Days that are already cached are read from the cache, nothing is downloaded.
+        key = file["file"].split(".")[0]
+        if self.cache and self.cache.has(key):
+            frames = self.cache.read_chunks(key, columns=self.projection(
+                table_names, self.headers), batch_size=self.chunksize)
+            self.insert_wrapper2(self.cache.path(key), self.headers, table_names=table_names,
+                                 ledger_key=file["file"], md5_hash=file["md5"], frames=frames)
+            return self.cache.path(key), True
+
+        # The archive is parsed directly, so the uncompressed export never touches the disk.
+        if self.stream_zip:
+            with self.metrics.stage("download"):
+                result = self.downloader.download_file(
+                    file, dl_path, extract=False)
+            if result:
+                zip_file, success = result
+                self.insert_wrapper2(zip_file, self.headers, seperator="\t", table_names=table_names,
+                                     chunksize=self.chunksize, ledger_key=file["file"], md5_hash=file["md5"],
+                                     frames=self.cached_frames(zip_file, key, file["md5"]))
+                if not self.keep_zip:
+                    os.remove(zip_file)
+
+            return result
+
+        with self.metrics.stage("download"):
+            result = self.downloader.download_file(file, dl_path)
         if result:
             csv_file, success = result
-            self.insert_wrapper2(csv_file, self.headers, seperator="\t",
-                                 table_names=table_names)
+            self.insert_wrapper2(csv_file, self.headers, seperator="\t", table_names=table_names,
+                                 chunksize=self.chunksize, ledger_key=file["file"], md5_hash=file["md5"],
+                                 frames=self.cached_frames(csv_file, key, file["md5"]))
             os.remove(csv_file)
 
         return result
 
+    def transform(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Cuts the DATEADDED of GDELT 2.0 (YYYYMMDDHHMMSS) to the day, so the tables hold the same values for both versions.
+        """
+        if self.gdelt_version == 2 and "DATEADDED" in df.columns:
+            df["DATEADDED"] = (df["DATEADDED"] // 1000000).astype("int32")
+        return df
+
+    def cached_frames(self, file_path: str, key: str, md5_hash: str) -> Optional[Iterator[pd.DataFrame]]:
+        """
+        Returns the chunks of the export with all columns, which are written to the Parquet cache while they are
+        inserted. Returns None without a cache, so 'insert_wrapper2' reads only the columns it needs itself.
+        """
+        if not self.cache:
+            return None
+
+        if self.chunksize:
+            chunks = self.read_csv_chunks(file_path, headers=self.headers, chunksize=self.chunksize, seperator="\t",
+                                          dtypes=self.dtypes)
+        else:
+            chunks = iter([self.read_csv(file_path, headers=self.headers,
+                                         seperator="\t", dtypes=self.dtypes)])
+        return self.cache.write_through(key, chunks, metadata={"md5": md5_hash or ""})
+
+
+# Every worker process builds its own integrator (and with it its own database connections) once at startup.
+_worker_integrator: Optional[GdeltIntegrator] = None
+
+
+def _init_worker(settings: Dict) -> None:
+    global _worker_integrator
+    # Ctrl+C is handled by the main process, which lets the running files finish.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # The metrics are sent back with the results, only the main process writes them.
+    _worker_integrator = GdeltIntegrator(**dict(settings, metrics_path=None))
+    if _worker_integrator.warm_start:
+        _worker_integrator.warm_key_caches()
+
+
+def _integrate_in_worker(file: Dict, table_names: List[str]) -> Dict:
+    return _worker_integrator.integrate_file(file, table_names)
+
 
 if __name__ == "__main__":
     start_date = (2015, 1, 1)
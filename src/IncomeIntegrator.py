@@ -4,9 +4,8 @@ from src.EurostatIntegrator import EurostatIntegrator
 
 
 class IncomeIntegrator(EurostatIntegrator):
-    def __init__(self):
-        # super().__init__()
-        self.data = "./data/ilc_di15_1_Data.csv"
+    def __init__(self, metrics_path: str = None):
+        self.data = "./data/doc/eurostat/ilc_di15/ilc_di15_1_Data.csv"
 
         self.headers = ["Year", "Geo", "Unit",
                         "Type", "Citizens", "Sex", "AgeGroup", "Value", "Flags"]
@@ -16,23 +15,25 @@ class IncomeIntegrator(EurostatIntegrator):
         self.tables = {
             "country": {
                 "headers": [self.headers[i] for i in [1]],
-                "attributes": ["Geo_Name"],
-                "uniques": ["Geo_Name"]
+                "attributes": ["CID"],
+                "types": ["text"],
+                "uniques": ["Geo"],
+                "merge": True
             },
             "income": {
-                # TODO: How to get CID
-                "headers": [self.headers[i] for i in [1, 7, 2, 4, 6, 3, 0, 5]],
-                "attributes": ["CID", "Value", "Unit", "Citizens", "AgeGroup", "Type", "Year", "Sex"],
+                "headers": [self.headers[i] for i in [1, 7, 2, 4, 6, 3, 0, 5, 8]],
+                "attributes": ["CID", "Value", "Unit", "Citizens", "AgeGroup", "Type", "Year", "Sex", "Flags"],
+                "types": ["text", "integer", "text", "text", "text", "text", "integer", "text", "text"],
+                "copy_format": "binary",
                 "uniques": []
             }
         }
+        super().__init__(self.table_names, self.tables, metrics_path)
 
 
 if __name__ == "__main__":
     integrator = IncomeIntegrator()
-    table_names = ["income"]
 
     _ = input(f"Press 'Enter' to start the integration process ...")
     integrator.execute_script(integrator.table_script)  # Create the tables.
-    integrator.insert_wrapper(
-        integrator.data, headers=integrator.headers, table_names=table_names)
+    print(integrator.integrate())
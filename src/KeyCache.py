@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+from collections import OrderedDict
+
+from typing import Iterable, List
+
+
+class KeyCache(object):
+    """
+    Bounded set of the keys that are already stored in a dimension table, evicting the least recently seen keys.
+    Keys of a running transaction are staged and only become part of the cache once the transaction commits, so a
+    rollback never leaves keys in the cache that are missing in the database.
+    """
+
+    def __init__(self, capacity: int = 250000):
+        super().__init__()
+        self.capacity = capacity
+        self.keys: OrderedDict = OrderedDict()
+        self.staged: set = set()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def filter_new(self, keys: Iterable) -> List[bool]:
+        """
+        Returns a mask that is True for every key that is neither cached nor staged. Cached keys count as recently seen.
+        """
+        mask = []
+        for key in keys:
+            if key in self.keys:
+                self.keys.move_to_end(key)
+                mask.append(False)
+            else:
+                mask.append(key not in self.staged)
+
+        new = sum(mask)
+        self.misses += new
+        self.hits += len(mask) - new
+        return mask
+
+    def stage(self, keys: Iterable) -> None:
+        """
+        Remembers keys that were written in the running transaction.
+        """
+        self.staged.update(keys)
+
+    def commit(self) -> None:
+        """
+        Moves the staged keys into the cache and evicts the oldest keys beyond the capacity.
+        """
+        self.add(self.staged)
+        self.staged = set()
+
+    def rollback(self) -> None:
+        """
+        Forgets the staged keys, they never made it into the database.
+        """
+        self.staged = set()
+
+    def add(self, keys: Iterable) -> None:
+        """
+        Adds keys that are known to be stored in the database, e.g. to warm up the cache.
+        """
+        for key in keys:
+            self.keys[key] = None
+            self.keys.move_to_end(key)
+
+        while len(self.keys) > self.capacity:
+            self.keys.popitem(last=False)
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+
+import logging
+from contextlib import contextmanager
+
+from src.DataIntegrator import DataIntegrator
+
+from typing import List, Dict, Tuple, Iterator
+
+
+class LoadPhaseManager(object):
+    """
+    Drops the indexes and constraints of the tables before a bulk load and rebuilds them afterwards, so a backfill
+    doesn't update every B-tree row by row. The definitions are stored in the table 'load_phase_definitions' in the
+    same transaction that drops them, so an interrupted load can still be rebuilt later (see 'rebuild').
+
+    Only the keys the load itself needs are kept: the key a 'merge' table skips its duplicates on (e.g. the primary key
+    of 'eventid_and_date' or 'event_geo') and the key of a 'rollup' table (see 'kept_constraints'). Their other unique
+    keys, all foreign keys and all other indexes are dropped.
+    """
+
+    parallel_workers = 4  # Workers per parallel index build (max_parallel_maintenance_workers).
+    maintenance_work_mem = "1GB"
+
+    def __init__(self, integrator: DataIntegrator, table_names: List[str] = None):
+        super().__init__()
+        self.integrator = integrator
+        self.table_names = table_names if table_names else integrator.table_names
+
+    def kept_constraints(self) -> Dict[str, List[str]]:
+        """
+        Returns the columns (in lower case) of the key that has to stay while loading per table, because 'move_staged'
+        and 'flush_rollup' need it as the target of ON CONFLICT. That is the 'conflict' key of a 'merge' table (or the
+        attribute of its first 'uniques') and the 'keys' of a 'rollup' table.
+        """
+        kept = {}
+        for table_name in self.table_names:
+            table = self.integrator.tables.get(table_name, {})
+            if table.get("merge"):
+                columns = table.get("conflict", [self.integrator.unique_attribute(table_name)])
+            elif table.get("rollup"):
+                columns = table["rollup"]["keys"]
+            else:
+                continue
+            kept[table_name] = sorted(column.lower() for column in columns)
+        return kept
+
+    def record(self, cur) -> List[Tuple[str, str, str, str]]:
+        """
+        Returns (table, name, kind, definition) of the indexes and constraints of the tables, foreign keys first so
+        they are dropped before the keys they reference. The kind is 'f', 'p' or 'u' like in pg_constraint or 'index'
+        for indexes that don't belong to a constraint. Foreign keys of other tables referencing the tables are included.
+        """
+        kept = self.kept_constraints()
+        cur.execute("""
+            SELECT c.conrelid::regclass::text, c.conname, c.contype, pg_get_constraintdef(c.oid),
+                   ARRAY(SELECT a.attname::text FROM pg_attribute a
+                         WHERE a.attrelid = c.conrelid AND a.attnum = ANY(c.conkey) ORDER BY 1)
+            FROM pg_constraint c
+            WHERE c.contype IN ('f', 'p', 'u') AND c.conparentid = 0
+              AND (c.conrelid::regclass::text = ANY(%(tables)s) OR c.confrelid::regclass::text = ANY(%(tables)s))
+            ORDER BY c.contype = 'f' DESC, 1, 2""", {"tables": self.table_names})
+        constraints = [(table_name, name, kind, definition)
+                       for table_name, name, kind, definition, columns in cur.fetchall()
+                       if not (kind in ("p", "u") and kept.get(table_name) == sorted(columns))]
+
+        # Indexes backing a primary or unique key are handled with their constraint. Indexes of partitions are
+        # recreated by the index on the partitioned table, which is why it is defined without ONLY.
+        cur.execute("""
+            SELECT i.indrelid::regclass::text, x.relname, 'index', replace(pg_get_indexdef(i.indexrelid), ' ON ONLY ', ' ON ')
+            FROM pg_index i JOIN pg_class x ON x.oid = i.indexrelid
+            WHERE i.indrelid::regclass::text = ANY(%(tables)s)
+              AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = i.indexrelid AND c.contype IN ('p', 'u', 'x'))
+              AND NOT EXISTS (SELECT 1 FROM pg_inherits h WHERE h.inhrelid = i.indexrelid)
+            ORDER BY 1, 2""", {"tables": self.table_names})
+        return constraints + cur.fetchall()
+
+    def drop(self) -> int:
+        """
+        Records and drops the indexes and constraints of the tables in one transaction. Returns the number of dropped
+        objects. Definitions that are still stored from an earlier, unfinished load are kept as they are.
+        """
+        conn, cur = self.integrator.connect_database(autocommit=False)
+        try:
+            definitions = self.record(cur)
+            for table_name, name, kind, definition in definitions:
+                cur.execute("INSERT INTO load_phase_definitions (TableName, Name, Kind, Definition) VALUES (%s, %s, %s, %s) "
+                            "ON CONFLICT (TableName, Name) DO NOTHING", (table_name, name, kind, definition))
+                if kind == "index":
+                    cur.execute(f'DROP INDEX "{name}"')
+                else:
+                    cur.execute(
+                        f'ALTER TABLE {table_name} DROP CONSTRAINT "{name}"')
+                logging.info(f"Dropped {kind} {name} on {table_name}.")
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logging.error(
+                f"Dropping the indexes and constraints failed, nothing was dropped: {e}")
+            raise e
+        finally:
+            self.integrator.release_connection(conn, cur)
+
+        return len(definitions)
+
+    def rebuild(self) -> int:
+        """
+        Recreates all stored indexes and constraints, each in its own transaction, and analyzes the tables. Indexes are
+        built in parallel by the server. Foreign keys are added as NOT VALID first and validated afterwards, which checks
+        the existing rows in one pass and doesn't block writes to the referencing table. Returns the number of objects.
+        """
+        conn, cur = self.integrator.connect_database(autocommit=False)
+        try:
+            cur.execute(
+                f"SET max_parallel_maintenance_workers = {self.parallel_workers}")
+            cur.execute(
+                f"SET maintenance_work_mem = '{self.maintenance_work_mem}'")
+            conn.commit()
+
+            cur.execute(
+                "SELECT TableName, Name, Kind, Definition FROM load_phase_definitions")
+            definitions = cur.fetchall()
+            # Keys before indexes before foreign keys, a foreign key needs the key it references.
+            order = {"p": 0, "u": 1, "index": 2, "f": 3, "v": 4}
+            definitions.sort(key=lambda d: order[d[2]])
+
+            for table_name, name, kind, definition in definitions:
+                if kind == "index":
+                    cur.execute(definition)
+                elif kind in ("p", "u"):
+                    cur.execute(
+                        f'ALTER TABLE {table_name} ADD CONSTRAINT "{name}" {definition}')
+                elif kind == "f":
+                    cur.execute(
+                        f'ALTER TABLE {table_name} ADD CONSTRAINT "{name}" {definition.replace(" NOT VALID", "")} NOT VALID')
+                    # Validated in the next step, a restart picks it up from there.
+                    cur.execute("UPDATE load_phase_definitions SET Kind = 'v' WHERE TableName = %s AND Name = %s",
+                                (table_name, name))
+                    conn.commit()
+                    continue
+
+                if kind != "v":
+                    cur.execute("DELETE FROM load_phase_definitions WHERE TableName = %s AND Name = %s",
+                                (table_name, name))
+                    conn.commit()
+                    logging.info(f"Rebuilt {kind} {name} on {table_name}.")
+
+            for table_name, name, kind, _ in definitions:
+                if kind in ("f", "v"):
+                    cur.execute(
+                        f'ALTER TABLE {table_name} VALIDATE CONSTRAINT "{name}"')
+                    cur.execute("DELETE FROM load_phase_definitions WHERE TableName = %s AND Name = %s",
+                                (table_name, name))
+                    conn.commit()
+                    logging.info(f"Validated foreign key {name} on {table_name}.")
+
+            for table_name in sorted({d[0] for d in definitions}):
+                cur.execute(f"ANALYZE {table_name}")
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logging.error(
+                f"Rebuilding the indexes and constraints failed, the rest is still stored in 'load_phase_definitions': {e}")
+            raise e
+        finally:
+            cur.execute("RESET max_parallel_maintenance_workers")
+            cur.execute("RESET maintenance_work_mem")
+            conn.commit()
+            self.integrator.release_connection(conn, cur)
+
+        return len(definitions)
+
+    def pending(self) -> Dict[str, List[str]]:
+        """
+        Returns the names of the dropped indexes and constraints per table that haven't been rebuilt yet.
+        """
+        conn, cur = self.integrator.connect_database(autocommit=True)
+        try:
+            cur.execute("SELECT TableName, Name FROM load_phase_definitions")
+            pending = {}
+            for table_name, name in cur.fetchall():
+                pending.setdefault(table_name, []).append(name)
+            return pending
+        finally:
+            self.integrator.release_connection(conn, cur)
+
+    @contextmanager
+    def bulk_load(self) -> Iterator[None]:
+        """
+        Drops the indexes and constraints for the duration of the block and rebuilds them afterwards, also if the load
+        fails, so the tables are never left without their keys.
+        """
+        self.drop()
+        try:
+            yield
+        finally:
+            self.rebuild()
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+    from src.GdeltIntegrator import GdeltIntegrator
+
+    parser = ArgumentParser(
+        description="Drop or rebuild the indexes and constraints of the GDELT tables around a bulk load.")
+    parser.add_argument("action", choices=["drop", "rebuild", "pending"])
+    args = parser.parse_args()
+
+    manager = LoadPhaseManager(GdeltIntegrator((2015, 1, 1), (2015, 1, 1)))
+    if args.action == "drop":
+        print(f"Dropped {manager.drop()} indexes and constraints.")
+    elif args.action == "rebuild":
+        print(f"Rebuilt {manager.rebuild()} indexes and constraints.")
+    else:
+        for table_name, names in manager.pending().items():
+            print(f"{table_name}: {', '.join(names)}")
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+import os
+import logging
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from typing import List, Dict, Iterator, Iterable, Optional
+
+
+class ParquetCache(object):
+    """
+    Keeps every parsed GDELT export as a typed, compressed Parquet file named after its date (e.g. '20150101.parquet').
+    The files are written while an export is loaded for the first time. Later loads read the cache instead of
+    downloading and parsing the export again, memory-mapped and only with the columns they need.
+    """
+
+    # Maps the parser types of the integrator to the Arrow types of the cache.
+    arrow_types = {
+        "int32": pa.int32(),
+        "int64": pa.int64(),
+        "float32": pa.float32(),
+        "float64": pa.float64(),
+        "category": pa.dictionary(pa.int32(), pa.string()),
+        "str": pa.string(),
+    }
+
+    def __init__(self, cache_path: str, headers: List[str], dtypes: Dict[str, str], compression: str = "zstd"):
+        super().__init__()
+        self.cache_path = cache_path
+        self.compression = compression
+        self.schema = pa.schema([(header, self.arrow_types[dtypes[header]]) for header in headers])
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.cache_path, f"{key}.parquet")
+
+    def has(self, key: str) -> bool:
+        return os.path.isfile(self.path(key))
+
+    def keys(self) -> List[str]:
+        """
+        Returns the keys of all cached files, sorted.
+        """
+        if not os.path.isdir(self.cache_path):
+            return []
+        return sorted(name[:-len(".parquet")] for name in os.listdir(self.cache_path) if name.endswith(".parquet"))
+
+    def metadata(self, key: str) -> Dict[str, str]:
+        """
+        Returns the metadata stored with the cached file, e.g. the md5 sum of the original archive.
+        """
+        metadata = pq.read_schema(self.path(key)).metadata or {}
+        return {k.decode("utf8"): v.decode("utf8") for k, v in metadata.items() if not k.startswith(b"ARROW")}
+
+    def write_through(self, key: str, chunks: Iterable[pd.DataFrame], metadata: Dict[str, str] = None) -> Iterator[pd.DataFrame]:
+        """
+        Generator that passes the chunks on unchanged and writes each one to the cache as a row group on the way.
+        The file only appears under its key once all chunks have been consumed, so an aborted load leaves no partial file.
+        """
+        os.makedirs(self.cache_path, exist_ok=True)
+        part_path = self.path(key) + ".part"
+        schema = self.schema.with_metadata(metadata) if metadata else self.schema
+
+        writer = pq.ParquetWriter(part_path, schema, compression=self.compression)
+        try:
+            for chunk in chunks:
+                writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+                yield chunk
+            writer.close()
+            os.replace(part_path, self.path(key))
+        finally:
+            if os.path.isfile(part_path):
+                writer.close()
+                os.remove(part_path)
+                logging.info(f"Discarded the incomplete cache file for {key}.")
+
+    def read_chunks(self, key: str, columns: Optional[List[str]] = None, batch_size: Optional[int] = None) -> Iterator[pd.DataFrame]:
+        """
+        Generator that yields the cached file in DataFrames of at most {batch_size} rows (one per row group if None).
+        Only the {columns} are read (all if None) and the file is memory-mapped instead of read into memory.
+        """
+        parquet_file = pq.ParquetFile(self.path(key), memory_map=True)
+        if batch_size:
+            for batch in parquet_file.iter_batches(batch_size=batch_size, columns=columns):
+                yield batch.to_pandas()
+        else:
+            for i in range(parquet_file.num_row_groups):
+                yield parquet_file.read_row_group(i, columns=columns).to_pandas()
+
+    def read(self, key: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        Reads the whole cached file (only the {columns} if given) into one DataFrame, e.g. for an analysis.
+        """
+        return pq.read_table(self.path(key), columns=columns, memory_map=True).to_pandas()
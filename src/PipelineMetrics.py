@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import threading
+from datetime import datetime
+from contextlib import contextmanager
+from time import perf_counter, time
+
+from typing import List, Dict, Tuple, Iterator, Iterable, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class PipelineMetrics(object):
+    """
+    Collects the wall time, rows, bytes and errors of every stage of the pipeline (link discovery, download, checksum,
+    unzip, parse, projection, COPY and commit) per file and table. Times are exclusive: a stage running inside another
+    one (e.g. the checksum while downloading) is only charged to the inner stage, so the stages of a file add up to
+    its total time. The peak resident memory of loading a file is kept as 'peak_rss' of its parse stage.
+
+    The numbers are collected until 'flush', which appends one JSON line per file, stage and table to
+    '<metrics_path>/<name>.jsonl' and rewrites the totals in '<metrics_path>/<name>.prom' in the Prometheus text format
+    (e.g. for the textfile collector of the node exporter). Without a {metrics_path} nothing is written.
+    """
+
+    # 'wait' is the time a stage of the pipelined load (see 'GdeltIntegrator.integrate_pipelined') waits for its input.
+    stages = ["discover", "download", "checksum", "unzip", "parse", "projection", "copy", "commit", "wait"]
+    values = ["seconds", "rows", "bytes", "errors", "calls", "peak_rss"]
+    maxima = ["peak_rss"]  # Values that keep their maximum instead of being added up.
+
+    def __init__(self, metrics_path: str = None, name: str = "pipeline"):
+        super().__init__()
+        self.metrics_path = metrics_path
+        self.name = name
+        self.current: Dict[Tuple, Dict[str, float]] = {}  # (file, stage, table) -> values, since the last flush.
+        self.totals: Dict[Tuple, Dict[str, float]] = {}  # (stage, table) -> values, since the start.
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()  # Serializes the writes of the files, which threads may flush at once.
+        self.local = threading.local()  # The running stages and the current file of each thread.
+
+    def running(self) -> List[List]:
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+        return self.local.stack
+
+    def current_file(self) -> Optional[str]:
+        """
+        Returns the file the stages of this thread are charged to, e.g. to hand it on to another thread.
+        """
+        return getattr(self.local, "file", None)
+
+    @contextmanager
+    def file(self, file: str) -> Iterator[None]:
+        """
+        Charges the stages of the block to {file}, unless they name a file themselves.
+        """
+        previous = getattr(self.local, "file", None)
+        self.local.file = file
+        try:
+            yield
+        finally:
+            self.local.file = previous
+
+    @contextmanager
+    def stage(self, stage: str, table: str = None, file: str = None) -> Iterator[None]:
+        """
+        Measures the block as {stage} of the table and file. An exception raised in the block counts as error of the
+        innermost stage it passes and is raised again, also if it is handed on to another thread.
+        """
+        key = (file if file else getattr(self.local, "file", None), stage, table)
+        stack = self.running()
+        frame = [key, 0.0]  # Key and time spent in the stages running inside this one.
+        stack.append(frame)
+        start = perf_counter()
+        try:
+            yield
+        except BaseException as e:
+            if not getattr(e, "_counted_by_metrics", False):
+                e._counted_by_metrics = True
+                self._add(key, errors=1)
+            raise
+        finally:
+            elapsed = perf_counter() - start
+            stack.pop()
+            self._add(key, seconds=elapsed - frame[1], calls=1)
+            if stack:
+                stack[-1][1] += elapsed
+
+    def iterate(self, stage: str, items: Iterable[T], table: str = None, count_rows: bool = True) -> Iterator[T]:
+        """
+        Generator that passes the items on and charges the time to produce each one to {stage}, e.g. the parsing of a
+        file read in chunks. DataFrames count their rows, unless {count_rows} is off.
+        """
+        iterator = iter(items)
+        while True:
+            with self.stage(stage, table):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                if count_rows:
+                    self.count(rows=len(item) if hasattr(item, "__len__") else 1)
+            yield item
+
+    def count(self, **values: float) -> None:
+        """
+        Adds the values (rows, bytes) to the innermost running stage of this thread.
+        """
+        stack = self.running()
+        if stack:
+            self._add(stack[-1][0], **values)
+
+    def add(self, stage: str, table: str = None, file: str = None, **values: float) -> None:
+        """
+        Adds the values to {stage} of the table and file without measuring any time, e.g. the size of a file.
+        """
+        self._add((file if file else getattr(self.local, "file", None), stage, table), **values)
+
+    def _add(self, key: Tuple, **values: float) -> None:
+        with self.lock:
+            entry = self.current.setdefault(key, dict.fromkeys(self.values, 0))
+            self.accumulate(entry, values)
+
+    def accumulate(self, entry: Dict[str, float], values: Dict[str, float]) -> None:
+        for name, value in values.items():
+            entry[name] = max(entry[name], value) if name in self.maxima else entry[name] + value
+
+    def flush(self) -> List[Dict]:
+        """
+        Returns the records collected since the last flush, adds them to the totals and writes them out.
+        """
+        with self.lock:
+            current, self.current = self.current, {}
+        timestamp = datetime.now().isoformat(timespec="seconds")
+        records = [self.record(timestamp, file, stage, table, values)
+                   for (file, stage, table), values in current.items()]
+        self.merge(records)
+        return records
+
+    def record(self, timestamp: str, file: Optional[str], stage: str, table: Optional[str], values: Dict[str, float]) -> Dict:
+        return {"timestamp": timestamp, "integrator": self.name, "pid": os.getpid(), "file": file, "stage": stage,
+                "table": table, "seconds": round(values["seconds"], 6), "rows": int(values["rows"]),
+                "bytes": int(values["bytes"]), "rows_per_s": round(values["rows"] / values["seconds"], 1) if values["seconds"] else None,
+                "errors": int(values["errors"]), "calls": int(values["calls"]), "peak_rss": int(values["peak_rss"])}
+
+    def merge(self, records: List[Dict]) -> None:
+        """
+        Adds records to the totals and writes them out, also records collected by another process (e.g. a worker).
+        """
+        with self.lock:
+            for record in records:
+                totals = self.totals.setdefault((record["stage"], record["table"]), dict.fromkeys(self.values, 0))
+                self.accumulate(totals, {name: record[name] for name in self.values})
+
+        if self.metrics_path and records:
+            with self.write_lock:
+                os.makedirs(self.metrics_path, exist_ok=True)
+                with open(os.path.join(self.metrics_path, f"{self.name}.jsonl"), "a", encoding="utf8") as f:
+                    f.write("".join(json.dumps(record) + "\n" for record in records))
+                self.write_prometheus()
+
+    def write_prometheus(self) -> None:
+        """
+        Writes the totals in the Prometheus text format. The file is replaced at once, so a scrape never sees half of it.
+        """
+        metrics = [
+            ("seconds_total", "counter", "Wall time spent in the stage.", "seconds"),
+            ("rows_total", "counter", "Rows handled by the stage.", "rows"),
+            ("bytes_total", "counter", "Bytes handled by the stage.", "bytes"),
+            ("errors_total", "counter", "Errors raised in the stage.", "errors"),
+            ("calls_total", "counter", "Number of times the stage ran.", "calls"),
+        ]
+        with self.lock:
+            totals = sorted(self.totals.items(), key=lambda item: (item[0][0], item[0][1] or ""))
+
+        lines = []
+        for suffix, kind, description, value in metrics:
+            lines += [f"# HELP batadase_stage_{suffix} {description}", f"# TYPE batadase_stage_{suffix} {kind}"]
+            lines += [f"batadase_stage_{suffix}{{{self.labels(stage, table)}}} {values[value]:.15g}"
+                      for (stage, table), values in totals]
+        lines += ["# HELP batadase_stage_rows_per_second Rows per second of wall time in the stage.",
+                  "# TYPE batadase_stage_rows_per_second gauge"]
+        lines += [f"batadase_stage_rows_per_second{{{self.labels(stage, table)}}} {values['rows'] / values['seconds']:.15g}"
+                  for (stage, table), values in totals if values["seconds"]]
+        lines += ["# HELP batadase_stage_peak_rss_bytes Highest peak resident memory of loading a file.",
+                  "# TYPE batadase_stage_peak_rss_bytes gauge"]
+        lines += [f"batadase_stage_peak_rss_bytes{{{self.labels(stage, table)}}} {values['peak_rss']:.15g}"
+                  for (stage, table), values in totals if values["peak_rss"]]
+        lines += ["# HELP batadase_metrics_updated_seconds Time of the last update of these metrics.",
+                  "# TYPE batadase_metrics_updated_seconds gauge",
+                  f'batadase_metrics_updated_seconds{{integrator="{self.name}"}} {time():.3f}']
+
+        prom_path = os.path.join(self.metrics_path, f"{self.name}.prom")
+        with open(prom_path + ".tmp", "w", encoding="utf8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(prom_path + ".tmp", prom_path)
+
+    def labels(self, stage: str, table: Optional[str]) -> str:
+        labels = {"integrator": self.name, "stage": stage, "table": table if table else ""}
+        return ",".join(f'{name}="{self.escape(value)}"' for name, value in labels.items())
+
+    @staticmethod
+    def escape(value: str) -> str:
+        return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """
+        Returns the totals per stage over all tables, with rows/s, e.g. to find the stage that limits the throughput.
+        """
+        with self.lock:
+            totals = list(self.totals.items())
+        summary: Dict[str, Dict[str, float]] = {}
+        for (stage, _), values in totals:
+            self.accumulate(summary.setdefault(stage, dict.fromkeys(self.values, 0)), values)
+        for entry in summary.values():
+            entry["rows_per_s"] = entry["rows"] / entry["seconds"] if entry["seconds"] else None
+        return summary
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+import queue
+import threading
+
+from typing import Any, Iterator, Optional
+
+
+class StageCancelled(Exception):
+    """
+    Raised in a producer when the consumers of its queue gave up, so it can stop its work.
+    """
+
+
+class StageQueue(object):
+    """
+    Bounded queue between two stages of a pipeline of threads. A producer blocks while the queue is full, which slows
+    the faster stages down to the slowest one instead of piling up downloads or chunks in memory.
+
+    Every producer calls 'close' when it is done, optionally with the exception that stopped it. The consumers iterate
+    over the queue until all producers closed it, the exception of a producer is raised in the consumer that reaches
+    it. A consumer that gives up calls 'cancel', which makes the producers' 'put' raise 'StageCancelled'.
+    """
+
+    poll_interval = 0.1  # Seconds between the checks for a cancellation while blocked.
+
+    def __init__(self, maxsize: int, producers: int = 1):
+        super().__init__()
+        self.queue = queue.Queue(maxsize)
+        self.producers = producers  # Producers that haven't closed the queue yet.
+        self.lock = threading.Lock()
+        self.cancelled = threading.Event()
+        self.end = _End()
+
+    def put(self, item: Any) -> None:
+        """
+        Adds the item, blocking while the queue is full. Raises 'StageCancelled' if the consumers gave up.
+        """
+        while True:
+            if self.cancelled.is_set():
+                raise StageCancelled()
+            try:
+                self.queue.put(item, timeout=self.poll_interval)
+                return
+            except queue.Full:
+                continue
+
+    def close(self, error: Optional[BaseException] = None) -> None:
+        """
+        Ends the items of one producer. The first {error} is raised in the consumers instead of ending their iteration.
+        """
+        with self.lock:
+            if error is not None and self.end.error is None:
+                self.end.error = error
+            self.producers -= 1
+            last = self.producers == 0
+        if last:
+            try:
+                self.put(self.end)
+            except StageCancelled:
+                pass
+
+    def cancel(self) -> None:
+        """
+        Stops the producers and drops the queued items.
+        """
+        self.cancelled.set()
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                return
+
+    def __iter__(self) -> Iterator[Any]:
+        while True:
+            item = self.queue.get()
+            if item is self.end:
+                # Put the end back for the other consumers, there's room since this one was just taken out.
+                self.queue.put(item)
+                if item.error is not None:
+                    raise item.error
+                return
+            yield item
+
+
+class _End(object):
+    """
+    Marks the end of the items in a 'StageQueue', with the error of a producer if there was one.
+    """
+
+    def __init__(self):
+        self.error: Optional[BaseException] = None
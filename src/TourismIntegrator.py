@@ -2,9 +2,8 @@ from src.EurostatIntegrator import EurostatIntegrator
 
 
 class TourismIntegrator(EurostatIntegrator):
-    def __init__(self):
-        # super().__init__()
-        self.data = "./data/tour_occ_nim_1_Data.csv"
+    def __init__(self, metrics_path: str = None):
+        self.data = "./data/doc/eurostat/tour_occ_nim/tour_occ_nim_1_Data.csv"
 
         self.headers = ["Time", "Geo", "RESID", "Unit",
                         "Accommodation", "Value", "Flags"]
@@ -14,22 +13,25 @@ class TourismIntegrator(EurostatIntegrator):
         self.tables = {
             "country": {
                 "headers": [self.headers[i] for i in [1]],
-                "attributes": ["Geo_Name"],
-                "uniques": ["Geo_Name"]
+                "attributes": ["CID"],
+                "types": ["text"],
+                "uniques": ["Geo"],
+                "merge": True
             },
             "tourist": {
-                "headers": [self.headers[i] for i in [1, 5, 0, 2, 4, 3]],
-                "attributes": ["CID", "Value", "Time", "RESID", "Accommodation", "Unit"],
+                "headers": [self.headers[i] for i in [1, 5, 0, 2, 4, 3, 6]],
+                "attributes": ["CID", "Value", "Time", "RESID", "Accommodation", "Unit", "Flags"],
+                "types": ["text", "float", "text", "text", "text", "text", "text"],
+                "copy_format": "binary",
                 "uniques": []
             }
         }
+        super().__init__(self.table_names, self.tables, metrics_path)
 
 
 if __name__ == "__main__":
     integrator = TourismIntegrator()
-    table_names = ["tourist"]
 
     _ = input(f"Press 'Enter' to start the integration process ...")
     integrator.execute_script(integrator.table_script)  # Create the tables.
-    integrator.insert_wrapper(
-        integrator.data, headers=integrator.headers, table_names=table_names)
+    print(integrator.integrate())
@@ -1,8 +1,11 @@
 #!/usr/bin/env python3
 
 
+import sys
+import resource
 from functools import wraps
 from time import time
+from typing import Optional
 
 #from GdeltIntegrator import GdeltIntegrator
 
@@ -27,6 +30,42 @@ def bufcount(filename: str) -> int:
     return lines
 
 
+def memory_usage(field: str = "VmRSS") -> Optional[int]:
+    """
+    Returns a memory field of this process from /proc/self/status in bytes, e.g. 'VmRSS' (resident memory now) or
+    'VmHWM' (peak resident memory). Returns None where there is no /proc.
+    """
+    try:
+        with open("/proc/self/status", "r") as status:
+            for line in status:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def peak_memory_usage() -> int:
+    """
+    Returns the peak resident memory of this process in bytes, since the start or the last 'reset_peak_memory_usage'.
+    """
+    peak = memory_usage("VmHWM")
+    # Without /proc, ru_maxrss is the peak since the start (in kilobytes on Linux, in bytes on macOS).
+    return peak if peak is not None else resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+
+def reset_peak_memory_usage() -> bool:
+    """
+    Resets the peak resident memory of this process to the current one (Linux 4.0+). Returns False where that isn't possible.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+        return True
+    except OSError:
+        return False
+
+
 def timer(func):
     """
     A simple decorator that times the duration of a function's execution.
@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import glob
+import json
+import inspect
+import logging
+import platform
+import resource
+import subprocess
+import tempfile
+import psycopg2
+import psycopg2.extensions
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import date, datetime
+from dotenv import load_dotenv
+from time import perf_counter
+
+from typing import List, Dict, Tuple, Iterator, Callable, Optional
+
+
+class StageTimer(object):
+    """
+    Measures the time spent in methods of the integrators, by wrapping them on the instance. Times are exclusive: a
+    stage calling another stage (e.g. 'merge_data' calling 'copy_data') is only charged for its own part, so the stages
+    add up to the total. For generators every step is timed, which charges the parsing to the reader and not to the
+    loop consuming it.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.times: Dict[str, float] = defaultdict(float)
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.stack: List[float] = []  # Time spent in the stages called by each running stage.
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        self.stack.append(0.0)
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = perf_counter() - start
+            self.times[name] += elapsed - self.stack.pop()
+            self.calls[name] += 1
+            if self.stack:
+                self.stack[-1] += elapsed
+
+    def instrument(self, obj, method_names: List[str]) -> None:
+        """
+        Wraps the methods of {obj}. Methods a version of the integrators doesn't have are skipped, so the same
+        benchmark runs against older versions.
+        """
+        for name in method_names:
+            method = getattr(obj, name, None)
+            if method is not None:
+                setattr(obj, name, self.wrap(name, method))
+
+    def wrap(self, name: str, method: Callable) -> Callable:
+        if inspect.isgeneratorfunction(method):
+            def timed_generator(*args, **kwargs):
+                generator = method(*args, **kwargs)
+                try:
+                    while True:
+                        with self.stage(name):
+                            try:
+                                item = next(generator)
+                            except StopIteration:
+                                return
+                        yield item
+                finally:
+                    generator.close()
+            return timed_generator
+
+        def timed(*args, **kwargs):
+            with self.stage(name):
+                return method(*args, **kwargs)
+        return timed
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        return {name: {"seconds": round(self.times[name], 4), "calls": self.calls[name]}
+                for name in sorted(self.times, key=self.times.get, reverse=True)}
+
+
+class Benchmark(object):
+    """
+    Benchmarks the load paths on synthetic data (see 'SyntheticData') against a throwaway database, which is created
+    on the configured Postgres server next to the real one and dropped afterwards. Every case runs in its own process
+    on its own copy of the empty schema, which gives a clean peak RSS and no state carried over from other cases.
+    The results are appended to {results_path} with the commit they were measured on, and every run is compared with
+    the previous run of the same case and size to catch regressions between versions.
+    """
+
+    results_path = "./test/benchmark_results.jsonl"
+    tolerance = 0.15  # Share by which rows/s may drop (or the peak RSS grow) before a case counts as regressed.
+    host = "localhost"
+    port = 5432
+
+    # Methods of the integrators that are timed as stages.
+    stages = ["insert_wrapper", "insert_wrapper2", "read_csv", "read_csv_chunks", "transform", "insert_data",
+              "completed_tables", "record_ledger", "encode_codes", "update_dictionary", "ensure_partitions",
+              "merge_data", "stage_data", "copy_data", "accumulate_rollup", "flush_rollup"]
+    cache_stages = ["write_through", "read_chunks"]
+
+    # The row by row path fills every table but the rollups, so both paths are compared on these tables.
+    row_tables = ["data_management_fields", "event_geo", "actor1", "actor2", "event_action", "eventid_and_date"]
+
+    cases = {
+        "insert_wrapper": "Row by row INSERTs ('insert_wrapper') of the uncompressed exports into the row tables.",
+        "insert_wrapper2_rows": "'insert_wrapper2' on the same files and tables as 'insert_wrapper'.",
+        "insert_wrapper2": "Chunked COPY ('insert_wrapper2') of the zipped exports into all GDELT tables.",
+        "insert_wrapper2_text": "Like 'insert_wrapper2', but with text instead of binary COPY for every table.",
+        "parquet_write": "Like 'insert_wrapper2', while writing the Parquet cache on the way.",
+        "parquet_read": "Loading all GDELT tables from the Parquet cache, which is written beforehand (not timed).",
+        "eurostat_income": "The income export with 'IncomeIntegrator.integrate'.",
+        "eurostat_tourism": "The tourism export with 'TourismIntegrator.integrate'.",
+    }
+
+    def __init__(self, rows: int = 100000, files: int = 2, row_rows: int = 5000, eurostat_rows: int = 50000, seed: int = 0):
+        super().__init__()
+        self.rows = rows  # Events per GDELT export.
+        self.files = files
+        self.row_rows = row_rows  # Events per export for the row by row cases, which are much slower.
+        self.eurostat_rows = eurostat_rows
+        self.seed = seed
+
+    def sizes(self, case: str) -> Dict[str, int]:
+        """
+        Returns the size of the input of a case. Only runs of the same size are compared.
+        """
+        if case.startswith("eurostat"):
+            return {"rows": self.eurostat_rows, "files": 1}
+        if case in ("insert_wrapper", "insert_wrapper2_rows"):
+            return {"rows": self.row_rows, "files": self.files}
+        return {"rows": self.rows, "files": self.files}
+
+    def generate(self, data_path: str) -> None:
+        """
+        Writes the synthetic input of all cases to {data_path}.
+        """
+        from test.SyntheticData import SyntheticData
+
+        data = SyntheticData(self.seed)
+        data.gdelt_files(os.path.join(data_path, "gdelt"), date(2015, 1, 1), self.files, self.rows)
+        data.gdelt_files(os.path.join(data_path, "rows"), date(2015, 1, 1), self.files, self.row_rows, zip_files=False)
+        data.income_export(os.path.join(data_path, "ilc_di15_1_Data.csv"), self.eurostat_rows)
+        data.tourism_export(os.path.join(data_path, "tour_occ_nim_1_Data.csv"), self.eurostat_rows)
+
+    def credentials(self) -> Dict[str, str]:
+        load_dotenv()
+        return {"user": os.environ.get("POSTGRES_USER", "db-proj"), "password": os.environ.get("POSTGRES_PASSWORD"),
+                "host": self.host, "port": self.port}
+
+    def execute(self, statement: str, dbname: str = "postgres") -> None:
+        conn = psycopg2.connect(dbname=dbname, **self.credentials())
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        try:
+            with conn.cursor() as cur:
+                cur.execute(statement)
+        finally:
+            conn.close()
+
+    @contextmanager
+    def throwaway_database(self, name: str, template: str = "template0") -> Iterator[str]:
+        """
+        Creates an empty database (a copy of {template}) for the duration of the block and drops it afterwards.
+        """
+        self.execute(f'CREATE DATABASE "{name}" ENCODING UTF8 TEMPLATE "{template}"')
+        try:
+            yield name
+        finally:
+            self.execute(f'DROP DATABASE IF EXISTS "{name}"')
+
+    def run(self, cases: List[str], data_path: Optional[str] = None) -> List[Dict]:
+        """
+        Runs the cases and returns their results. The data is generated to a temporary directory, or to a directory
+        per size and seed in {data_path}, where it is kept for the next runs.
+        """
+        with tempfile.TemporaryDirectory(prefix="batadase_bench_") as tmp_path:
+            if data_path:
+                data_path = os.path.join(
+                    data_path, f"{self.files}x{self.rows}_{self.row_rows}_{self.eurostat_rows}_{self.seed}")
+            else:
+                data_path = tmp_path
+            if not os.path.isdir(data_path) or not os.listdir(data_path):
+                logging.info(f"Generating the synthetic data in {data_path} ...")
+                self.generate(data_path)
+
+            template = f"bench_{os.getpid()}_template"
+            with self.throwaway_database(template):
+                with open("./schema/prepare_database.psql", "r") as script_handle:
+                    self.execute(script_handle.read(), dbname=template)
+                return [self.run_case(case, data_path, template) for case in cases]
+
+    def run_case(self, case: str, data_path: str, template: str) -> Dict:
+        """
+        Runs the case in a new process on a fresh copy of the {template} database and returns its result.
+        """
+        logging.info(f"Running case '{case}' ...")
+        with self.throwaway_database(f"bench_{os.getpid()}_{case}", template) as dbname:
+            env = dict(os.environ, POSTGRES_DB=dbname)
+            process = subprocess.run([sys.executable, "-m", "test.Benchmark", "--run-case", case, "--data", data_path],
+                                     env=env, stdout=subprocess.PIPE)
+            if process.returncode != 0:
+                raise RuntimeError(f"Case '{case}' failed with exit code {process.returncode}.")
+
+        result = json.loads(process.stdout.decode("utf8").strip().splitlines()[-1])
+        result.update({"case": case, **self.sizes(case), "rows_per_s": round(result["rows_loaded"] / result["seconds"], 1)})
+        return result
+
+    def version(self) -> Dict[str, str]:
+        """
+        Returns the commit (marked dirty with local changes) and the environment the benchmark runs in.
+        """
+        def git(*args) -> str:
+            try:
+                return subprocess.run(["git", *args], capture_output=True, text=True, check=True).stdout.strip()
+            except (OSError, subprocess.CalledProcessError):
+                return ""
+
+        commit = git("rev-parse", "--short", "HEAD")
+        if git("status", "--porcelain", "--untracked-files=no"):
+            commit += "-dirty"
+
+        conn = psycopg2.connect(dbname="postgres", **self.credentials())
+        try:
+            server = conn.server_version
+        finally:
+            conn.close()
+        return {"commit": commit, "python": platform.python_version(), "postgres": server, "machine": platform.node()}
+
+    def store(self, results: List[Dict]) -> None:
+        """
+        Appends the results to {results_path}, one JSON object per line.
+        """
+        version = self.version()
+        timestamp = datetime.now().isoformat(timespec="seconds")
+        with open(self.results_path, "a") as results_handle:
+            for result in results:
+                results_handle.write(json.dumps({"timestamp": timestamp, **version, **result}) + "\n")
+
+    def previous(self) -> Dict[Tuple, Dict]:
+        """
+        Returns the latest stored result of every case and size.
+        """
+        latest = {}
+        if not os.path.isfile(self.results_path):
+            return latest
+        with open(self.results_path, "r") as results_handle:
+            for line in results_handle:
+                result = json.loads(line)
+                latest[(result["case"], result["rows"], result["files"])] = result
+        return latest
+
+    def compare(self, results: List[Dict], previous: Dict[Tuple, Dict]) -> List[str]:
+        """
+        Prints the results next to the previous run and returns the cases that got slower or use more memory than
+        {tolerance} allows.
+        """
+        regressions = []
+        print(f"{'case':<22} {'rows/s':>12} {'prev':>12} {'peak MB':>9} {'prev':>9}  slowest stages")
+        for result in results:
+            before = previous.get((result["case"], result["rows"], result["files"]))
+            stages = ", ".join(f"{name} {stage['seconds']:.2f}s" for name, stage in list(result["stages"].items())[:3])
+            print(f"{result['case']:<22} {result['rows_per_s']:>12,.0f} "
+                  f"{before['rows_per_s'] if before else float('nan'):>12,.0f} {result['peak_rss_mb']:>9.1f} "
+                  f"{before['peak_rss_mb'] if before else float('nan'):>9.1f}  {stages}")
+
+            if before and (result["rows_per_s"] < before["rows_per_s"] * (1 - self.tolerance) or
+                           result["peak_rss_mb"] > before["peak_rss_mb"] * (1 + self.tolerance)):
+                regressions.append(result["case"])
+                print(f"  -> regression against {before['commit']} ({before['timestamp']})")
+        return regressions
+
+
+def run_case(case: str, data_path: str) -> Dict:
+    """
+    Runs one case in this process against the database in POSTGRES_DB and returns the number of loaded events, the
+    time and the time per stage.
+    """
+    from src.GdeltIntegrator import GdeltIntegrator
+    from src.IncomeIntegrator import IncomeIntegrator
+    from src.TourismIntegrator import TourismIntegrator
+    from src.ParquetCache import ParquetCache
+
+    timer = StageTimer()
+    gdelt_files = sorted(glob.glob(os.path.join(data_path, "gdelt", "*.zip")))
+    row_files = sorted(glob.glob(os.path.join(data_path, "rows", "*.CSV")))
+
+    def count_rows(files: List[str]) -> int:
+        integrator = GdeltIntegrator((2015, 1, 1), (2015, 1, 1))
+        return sum(len(integrator.read_csv(path, headers=integrator.headers, seperator="\t", columns=["GLOBALEVENTID"]))
+                   for path in files)
+
+    if case.startswith("eurostat"):
+        integrator = IncomeIntegrator() if case == "eurostat_income" else TourismIntegrator()
+        path = os.path.join(data_path, os.path.basename(integrator.data))
+        rows = len(integrator.read_csv(path, headers=integrator.headers, columns=["Geo"]))
+        runs = [lambda: integrator.integrate(path)]
+    else:
+        integrator = GdeltIntegrator((2015, 1, 1), (2015, 1, 1))
+        # The tables filled from the exports, the others are only listed for the schema.
+        table_names = [table_name for table_name in integrator.table_names
+                       if integrator.tables.get(table_name, {}).get("headers")]
+
+        if case == "insert_wrapper":
+            files, table_names = row_files, Benchmark.row_tables
+            runs = [lambda path=path: integrator.insert_wrapper(path, integrator.headers, "\t", table_names)
+                    for path in files]
+        elif case == "insert_wrapper2_rows":
+            files, table_names = row_files, Benchmark.row_tables
+            runs = [lambda path=path: integrator.insert_wrapper2(path, integrator.headers, "\t", table_names,
+                                                                 chunksize=integrator.chunksize) for path in files]
+        elif case in ("insert_wrapper2", "insert_wrapper2_text"):
+            files = gdelt_files
+            if case == "insert_wrapper2_text":
+                for table in integrator.tables.values():
+                    table.pop("copy_format", None)
+            runs = [lambda path=path: integrator.insert_wrapper2(path, integrator.headers, "\t", table_names,
+                                                                 chunksize=integrator.chunksize) for path in files]
+        elif case in ("parquet_write", "parquet_read"):
+            files = gdelt_files
+            cache_path = tempfile.mkdtemp(prefix="batadase_bench_cache_")
+            integrator.cache = ParquetCache(cache_path, integrator.headers, integrator.dtypes)
+
+            def key(path: str) -> str:
+                return os.path.basename(path).split(".")[0]
+
+            if case == "parquet_write":
+                runs = [lambda path=path: integrator.insert_wrapper2(
+                    path, integrator.headers, "\t", table_names, chunksize=integrator.chunksize,
+                    frames=integrator.cached_frames(path, key(path), "")) for path in files]
+            else:
+                for path in files:
+                    for _ in integrator.cached_frames(path, key(path), ""):
+                        pass
+                columns = integrator.projection(table_names, integrator.headers)
+                runs = [lambda path=path: integrator.insert_wrapper2(
+                    integrator.cache.path(key(path)), integrator.headers, table_names=table_names,
+                    frames=integrator.cache.read_chunks(key(path), columns=columns, batch_size=integrator.chunksize))
+                    for path in files]
+            timer.instrument(integrator.cache, Benchmark.cache_stages)
+        else:
+            raise ValueError(f"Unknown case '{case}', use one of {list(Benchmark.cases)}.")
+        rows = count_rows(files)
+
+    timer.instrument(integrator, Benchmark.stages)
+    table_rows: Dict[str, int] = defaultdict(int)
+    start = perf_counter()
+    for run in runs:
+        for table_name, count in (run() or {}).items():
+            table_rows[table_name] += count
+    seconds = perf_counter() - start
+
+    result = {"rows_loaded": rows, "seconds": round(seconds, 4), "peak_rss_mb": peak_rss_mb(), "stages": timer.summary(),
+              "table_rows": dict(table_rows)}
+    # The pipeline stages as measured by the integrator itself, in versions that have them.
+    if hasattr(integrator, "metrics"):
+        integrator.metrics.flush()
+        result["pipeline"] = integrator.metrics.summary()
+    return result
+
+
+def peak_rss_mb() -> float:
+    """
+    Returns the peak resident memory of this process in MB. The high water mark of /proc is used where there is one,
+    because the 'ru_maxrss' of a child process starts at the peak of its parent.
+    """
+    try:
+        with open("/proc/self/status", "r") as status_handle:
+            for line in status_handle:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)  # Kilobytes on Linux.
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser, SUPPRESS
+
+    parser = ArgumentParser(
+        description="Benchmark the load paths on synthetic data against a throwaway database.")
+    parser.add_argument("cases", nargs="*", default=list(Benchmark.cases),
+                        help=f"Cases to run (all by default): {', '.join(Benchmark.cases)}")
+    parser.add_argument("--rows", type=int, default=100000, help="Events per GDELT export.")
+    parser.add_argument("--files", type=int, default=2, help="Number of GDELT exports.")
+    parser.add_argument("--row-rows", type=int, default=5000, help="Events per export for the row by row cases.")
+    parser.add_argument("--eurostat-rows", type=int, default=50000, help="Rows of the Eurostat exports.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data", help="Directory to keep the synthetic data in between runs (temporary if not given).")
+    parser.add_argument("--no-store", action="store_true", help="Don't append the results to the results file.")
+    parser.add_argument("--check", action="store_true", help="Exit with status 1 if a case regressed.")
+    parser.add_argument("--run-case", help=SUPPRESS)  # Runs a single case in this process, see 'Benchmark.run_case'.
+    args = parser.parse_args()
+
+    if args.run_case:
+        # Only the result goes to stdout, the parent reads it from there.
+        logging.disable(logging.CRITICAL)
+        print(json.dumps(run_case(args.run_case, args.data)))
+        sys.exit(0)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    benchmark = Benchmark(args.rows, args.files, args.row_rows, args.eurostat_rows, args.seed)
+    unknown = [case for case in args.cases if case not in Benchmark.cases]
+    if unknown:
+        parser.error(f"Unknown cases {unknown}, use {list(Benchmark.cases)}.")
+
+    previous = benchmark.previous()
+    results = benchmark.run(args.cases, args.data)
+    if not args.no_store:
+        benchmark.store(results)
+    regressions = benchmark.compare(results, previous)
+    sys.exit(1 if args.check and regressions else 0)
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+import os
+import atexit
+import unittest
+import psycopg2
+
+from src.DataIntegrator import DataIntegrator
+from test.Benchmark import Benchmark
+
+from typing import List, Tuple, Optional
+
+
+class DatabaseTestCase(unittest.TestCase):
+    """
+    Base class of the tests that load into Postgres. The tests of a run share one throwaway database, created from
+    'schema/prepare_database.psql' on the server of the '.env' file (the user needs the CREATEDB privilege) and dropped
+    when the run ends. Every test starts with empty tables and without prepared transactions. The integrators connect
+    to it through POSTGRES_DB, so it is also used by their worker processes. Without a server the tests are skipped.
+    """
+
+    database: Optional[str] = None
+    postgres = Benchmark()  # Creates and drops the databases, see 'Benchmark.throwaway_database'.
+
+    @classmethod
+    def setUpClass(cls):
+        if DatabaseTestCase.database is None:
+            name = f"batadase_test_{os.getpid()}"
+            try:
+                cls.postgres.execute(f'CREATE DATABASE "{name}" ENCODING UTF8 TEMPLATE template0')
+            except psycopg2.OperationalError as e:
+                raise unittest.SkipTest(f"No database server: {e}")
+            atexit.register(DatabaseTestCase.drop_database, name)
+            with open("./schema/prepare_database.psql", "r") as script_handle:
+                cls.postgres.execute(script_handle.read(), dbname=name)
+            DatabaseTestCase.database = name
+
+        # The pools of earlier tests may point to another database.
+        DataIntegrator.close_pools()
+        os.environ["POSTGRES_DB"] = DatabaseTestCase.database
+
+    @staticmethod
+    def drop_database(name: str) -> None:
+        DataIntegrator.close_pools()
+        DatabaseTestCase.postgres.execute(
+            f"SELECT pg_terminate_backend(pid) FROM pg_stat_activity WHERE datname = '{name}' AND pid <> pg_backend_pid()")
+        DatabaseTestCase.postgres.execute(f'DROP DATABASE IF EXISTS "{name}"')
+
+    def setUp(self):
+        for gid, in self.query("SELECT gid FROM pg_prepared_xacts WHERE database = current_database()"):
+            self.execute(f"ROLLBACK PREPARED '{gid}'")
+        tables = [table for table, in self.query("SELECT tablename FROM pg_tables WHERE schemaname = 'public'")]
+        self.execute(f"TRUNCATE {', '.join(tables)}")
+
+    def query(self, statement: str, params: Tuple = None) -> List[Tuple]:
+        conn = psycopg2.connect(dbname=self.database, **self.postgres.credentials())
+        try:
+            with conn.cursor() as cur:
+                cur.execute(statement, params)
+                return cur.fetchall()
+        finally:
+            conn.close()
+
+    def execute(self, statement: str) -> None:
+        self.postgres.execute(statement, dbname=self.database)
+
+    def count(self, table_name: str) -> int:
+        return self.query(f"SELECT count(*) FROM {table_name}")[0][0]
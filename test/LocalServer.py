@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+import os
+import threading
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+from typing import List, Tuple, Optional
+
+
+class LocalServer(object):
+    """
+    Serves a directory over HTTP on a free local port in a background thread, as a stand-in for the GDELT server in the
+    tests. Range requests ('bytes=<start>-') are answered with 206, or with 416 if they start at the end of the file.
+    Every request is recorded in {requests} as (path, range header, status). With {range_shift} the ranges are answered
+    from that many bytes before the requested start, like a broken proxy.
+    """
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self.requests: List[Tuple[str, Optional[str], int]] = []
+        self.range_shift = 0
+        handler = partial(_RangeRequestHandler, self, directory=path)
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}/"
+
+    def __enter__(self) -> "LocalServer":
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+
+class _RangeRequestHandler(SimpleHTTPRequestHandler):
+
+    def __init__(self, local_server: LocalServer, *args, **kwargs):
+        self.local_server = local_server
+        super().__init__(*args, **kwargs)
+
+    def do_GET(self) -> None:
+        byte_range = self.headers.get("Range")
+        path = self.translate_path(self.path)
+        if not byte_range or not os.path.isfile(path):
+            return super().do_GET()
+
+        size = os.path.getsize(path)
+        start = int(byte_range.split("=")[1].split("-")[0])
+        if start >= size:
+            self.send_response(416)
+            self.send_header("Content-Range", f"bytes */{size}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        start = max(0, start - self.local_server.range_shift)
+        with open(path, "rb") as f:
+            f.seek(start)
+            data = f.read()
+        self.send_response(206)
+        self.send_header("Content-Range", f"bytes {start}-{size - 1}/{size}")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        try:
+            self.wfile.write(data)
+        except ConnectionError:
+            pass  # The client doesn't want the rest, e.g. a range it can't use.
+
+    def log_request(self, code="-", size="-") -> None:
+        self.local_server.requests.append(
+            (self.path.lstrip("/"), self.headers.get("Range"), int(code) if str(code).isdigit() else 0))
+
+    def log_message(self, format, *args) -> None:
+        pass  # Keeps the output of the tests clean, the requests are in {requests}.
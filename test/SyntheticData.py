@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+
+import os
+import zipfile
+import hashlib
+import numpy as np
+import pandas as pd
+
+from src.GdeltIntegrator import GdeltIntegrator
+
+from datetime import date, datetime, timedelta
+from typing import List, Dict
+
+
+class SyntheticData(object):
+    """
+    Generates synthetic GDELT daily exports and Eurostat exports of any size for the benchmarks. The files look like the
+    real ones: GDELT exports have the 58 tab separated columns of 'GdeltIntegrator.headers' with real CAMEO codes,
+    empty actors and locations, events that happened before the export date and locations that repeat. The 15 minute
+    exports of GDELT 2.0 and the listings of both feeds can be written as well, to follow them from a local web server. The Eurostat
+    exports have the header line, spaces as thousands separator, ':' for missing values and flags. The same seed always
+    generates the same files.
+    """
+
+    cameo_path = "./data/doc/gdelt"
+    num_locations = 5000  # Distinct locations the events take place at, so the dimension tables see repeating keys.
+    num_actors = 3000  # Distinct actors per file.
+    late_events = 0.1  # Share of events that happened up to a year before the export date.
+
+    countries = ["Austria", "Belgium", "Bulgaria", "Croatia", "Cyprus", "Czechia", "Denmark", "Estonia", "Finland",
+                 "France", "Germany (until 1990 former territory of the FRG)", "Greece", "Hungary", "Iceland",
+                 "Ireland", "Italy", "Latvia", "Lithuania", "Luxembourg", "Malta", "Netherlands", "Norway", "Poland",
+                 "Portugal", "Romania", "Slovakia", "Slovenia", "Spain", "Sweden", "Switzerland", "United Kingdom"]
+
+    def __init__(self, seed: int = 0):
+        super().__init__()
+        self.seed = seed
+        self.headers = GdeltIntegrator((2015, 1, 1), (2015, 1, 1)).headers
+        self.codes = {name: self.read_codes(f"CAMEO.{name}.txt")
+                      for name in ["country", "type", "knowngroup", "ethnic", "religion"]}
+
+        events = pd.read_csv(os.path.join(self.cameo_path, "CAMEO.goldsteinscale.txt"), sep="\t", dtype=str)
+        # Only the full codes, the root codes (two digits) are never the code of an event.
+        events = events[events["CAMEOEVENTCODE"].str.len() > 2]
+        self.event_codes = events["CAMEOEVENTCODE"].to_numpy()
+        self.goldstein = events["GOLDSTEINSCALE"].astype(float).to_numpy()
+
+    def read_codes(self, file_name: str) -> np.ndarray:
+        return pd.read_csv(os.path.join(self.cameo_path, file_name), sep="\t", dtype=str,
+                           keep_default_na=False)["CODE"].to_numpy()
+
+    def gdelt_export(self, day: date, rows: int, first_id: int = 400000000) -> pd.DataFrame:
+        """
+        Returns the synthetic export of {day} with {rows} events as strings, like a parser without types would read it.
+        """
+        rng = np.random.default_rng([self.seed, day.toordinal()])
+        columns: Dict[str, np.ndarray] = {"GLOBALEVENTID": (first_id + np.arange(rows)).astype(str)}
+
+        # Most events happened on the export date, some were reported late.
+        delays = np.where(rng.random(rows) < self.late_events, rng.integers(1, 366, rows), 0)
+        days = np.datetime64(day) - delays.astype("timedelta64[D]")
+        years = days.astype("datetime64[Y]").astype(int) + 1970
+        months = days.astype("datetime64[M]").astype(int) % 12 + 1
+        day_of_year = (days - days.astype("datetime64[Y]")).astype(int)
+        columns["SQLDATE"] = np.char.replace(np.datetime_as_string(days), "-", "")
+        columns["MonthYear"] = (years * 100 + months).astype(str)
+        columns["Year"] = years.astype(str)
+        columns["FractionDate"] = np.char.mod("%.4f", years + day_of_year / 365.0)
+
+        for i in (1, 2):
+            columns.update(self.actors(rng, f"Actor{i}", rows, empty=0.1 if i == 1 else 0.3))
+
+        codes = rng.integers(0, len(self.event_codes), rows)
+        event_codes = self.event_codes[codes]
+        roots = np.array([code[:2] for code in event_codes])
+        columns["IsRootEvent"] = rng.integers(0, 2, rows).astype(str)
+        columns["EventCode"] = event_codes
+        columns["EventBaseCode"] = np.array([code[:3] for code in event_codes])
+        columns["EventRootCode"] = roots
+        # Verbal and material cooperation, verbal and material conflict.
+        columns["QuadClass"] = (np.digitize(roots.astype(int), [5, 9, 14]) + 1).astype(str)
+        columns["GoldsteinScale"] = np.char.mod("%.1f", self.goldstein[codes])
+        mentions = rng.geometric(0.3, rows)
+        columns["NumMentions"] = mentions.astype(str)
+        columns["NumSources"] = np.minimum(mentions, rng.geometric(0.6, rows)).astype(str)
+        columns["NumArticles"] = mentions.astype(str)
+        columns["AvgTone"] = np.char.mod("%.10f", rng.normal(-2.0, 4.0, rows))
+
+        for prefix, empty in (("Actor1Geo", 0.15), ("Actor2Geo", 0.35), ("ActionGeo", 0.05)):
+            columns.update(self.locations(rng, prefix, rows, empty))
+
+        columns["DATEADDED"] = np.full(rows, day.strftime("%Y%m%d"))
+        columns["SOURCEURL"] = np.char.add("http://news.example.com/", rng.integers(0, 10 ** 9, rows).astype(str))
+
+        return pd.DataFrame({header: columns[header] for header in self.headers})
+
+    def gdelt_update_export(self, moment: datetime, rows: int, first_id: int = 400000000) -> pd.DataFrame:
+        """
+        Returns the synthetic GDELT 2.0 export published at {moment}: an ADM2 code after every ADM1 code and DATEADDED
+        with the time (YYYYMMDDHHMMSS).
+        """
+        df = self.gdelt_export(moment.date(), rows, first_id)
+        for prefix in ("Actor1Geo", "Actor2Geo", "ActionGeo"):
+            adm1 = df[f"{prefix}_ADM1Code"]
+            df.insert(df.columns.get_loc(f"{prefix}_ADM1Code") + 1, f"{prefix}_ADM2Code",
+                      np.where(adm1 != "", adm1 + "1", ""))
+        df["DATEADDED"] = moment.strftime("%Y%m%d%H%M%S")
+        return df
+
+    def actors(self, rng: np.random.Generator, prefix: str, rows: int, empty: float) -> Dict[str, np.ndarray]:
+        """
+        Returns the ten columns of an actor. The actors are drawn from a pool, so the same actor shows up in many events.
+        """
+        pool = self.num_actors
+        countries = self.codes["country"][rng.integers(0, len(self.codes["country"]), pool)]
+        types = self.codes["type"][rng.integers(0, len(self.codes["type"]), pool)]
+        attributes = {
+            "Code": np.char.add(countries, np.where(rng.random(pool) < 0.6, types, "")),
+            "Name": np.char.add("ACTOR ", np.arange(pool).astype(str)),
+            "CountryCode": countries,
+            "KnownGroupCode": self.sometimes(rng, self.codes["knowngroup"], pool, 0.05),
+            "EthnicCode": self.sometimes(rng, self.codes["ethnic"], pool, 0.05),
+            "Religion1Code": self.sometimes(rng, self.codes["religion"], pool, 0.1),
+            "Religion2Code": self.sometimes(rng, self.codes["religion"], pool, 0.02),
+            "Type1Code": types,
+            "Type2Code": self.sometimes(rng, self.codes["type"], pool, 0.2),
+            "Type3Code": self.sometimes(rng, self.codes["type"], pool, 0.02),
+        }
+        actors = rng.zipf(1.5, rows) % pool
+        missing = rng.random(rows) < empty
+        return {f"{prefix}{name}": np.where(missing, "", values[actors]) for name, values in attributes.items()}
+
+    def locations(self, rng: np.random.Generator, prefix: str, rows: int, empty: float) -> Dict[str, np.ndarray]:
+        """
+        Returns the seven columns of a location. The locations are the same for every file of a seed.
+        """
+        pool = np.random.default_rng([self.seed, 0])
+        size = self.num_locations
+        countries = np.array([f"{chr(a)}{chr(b)}" for a, b in pool.integers(65, 91, (size, 2))])
+        attributes = {
+            "Type": pool.integers(1, 6, size).astype(str),
+            "FullName": np.char.add("Place ", np.arange(size).astype(str)),
+            "CountryCode": countries,
+            "ADM1Code": np.char.add(countries, np.char.zfill(np.arange(size).astype(str), 4)),
+            "Lat": np.char.mod("%.4f", pool.uniform(-90, 90, size)),
+            "Long": np.char.mod("%.4f", pool.uniform(-180, 180, size)),
+            "FeatureID": (-pool.integers(1, 10 ** 7, size)).astype(str),
+        }
+        locations = rng.zipf(1.3, rows) % size
+        missing = rng.random(rows) < empty
+        # Without a location GDELT writes the type 0 and leaves the other columns empty.
+        return {f"{prefix}_{name}": np.where(missing, "0" if name == "Type" else "", values[locations])
+                for name, values in attributes.items()}
+
+    @staticmethod
+    def sometimes(rng: np.random.Generator, codes: np.ndarray, size: int, share: float) -> np.ndarray:
+        return np.where(rng.random(size) < share, codes[rng.integers(0, len(codes), size)], "")
+
+    def gdelt_files(self, dl_path: str, start: date, days: int, rows: int, zip_files: bool = True) -> List[str]:
+        """
+        Writes the exports of {days} days from {start} on with {rows} events each, named like the GDELT downloads
+        (e.g. '20150101.export.CSV.zip'). Returns the paths of the files.
+        """
+        os.makedirs(dl_path, exist_ok=True)
+        paths = []
+        for i in range(days):
+            day = start + timedelta(days=i)
+            df = self.gdelt_export(day, rows, first_id=400000000 + i * rows)
+            paths.append(self.write_export(dl_path, f"{day:%Y%m%d}.export.CSV", df, zip_files))
+        return paths
+
+    def gdelt_update_files(self, dl_path: str, start: datetime, count: int, rows: int) -> List[str]:
+        """
+        Writes {count} GDELT 2.0 exports, one every 15 minutes from {start} on (e.g. '20150101000000.export.CSV.zip'),
+        and 'lastupdate.txt' announcing the newest one like the GDELT 2.0 feed. Returns the paths of the exports.
+        """
+        os.makedirs(dl_path, exist_ok=True)
+        paths = []
+        for i in range(count):
+            moment = start + timedelta(minutes=15 * i)
+            df = self.gdelt_update_export(moment, rows, first_id=500000000 + i * rows)
+            paths.append(self.write_export(dl_path, f"{moment:%Y%m%d%H%M%S}.export.CSV", df))
+
+        if paths:
+            name = os.path.basename(paths[-1])
+            with open(os.path.join(dl_path, "lastupdate.txt"), "w", encoding="utf8") as f:
+                f.write(f"{os.path.getsize(paths[-1])} {self.md5sum(paths[-1])} http://localhost/gdeltv2/{name}\n")
+        return paths
+
+    def gdelt_index(self, dl_path: str) -> str:
+        """
+        Writes 'index.html' listing the daily exports in {dl_path} with their size and md5 sum, newest first, like the
+        GDELT 1.0 download page. Returns its path.
+        """
+        names = sorted((name for name in os.listdir(dl_path) if name.endswith(".export.CSV.zip") and len(name) == 23),
+                       reverse=True)
+        links = [f'<LI><A HREF="{name}">{name}</A> {os.path.getsize(os.path.join(dl_path, name)) / 1e6:.1f}MB '
+                 f'(MD5: {self.md5sum(os.path.join(dl_path, name))})' for name in names]
+        path = os.path.join(dl_path, "index.html")
+        with open(path, "w", encoding="utf8") as f:
+            f.write("<HTML><BODY><UL>" + "\n".join(links) + "</UL></BODY></HTML>\n")
+        return path
+
+    @staticmethod
+    def write_export(dl_path: str, name: str, df: pd.DataFrame, zip_files: bool = True) -> str:
+        data = df.to_csv(sep="\t", header=False, index=False)
+        path = os.path.join(dl_path, name + (".zip" if zip_files else ""))
+        if zip_files:
+            with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+                archive.writestr(name, data)
+        else:
+            with open(path, "w", encoding="utf8") as f:
+                f.write(data)
+        return path
+
+    @staticmethod
+    def md5sum(path: str) -> str:
+        with open(path, "rb") as f:
+            return hashlib.md5(f.read()).hexdigest()
+
+    def income_export(self, path: str, rows: int) -> str:
+        """
+        Writes an export in the format of 'ilc_di15' (mean and median income) with {rows} rows.
+        """
+        rng = np.random.default_rng([self.seed, 1])
+        df = pd.DataFrame({
+            "TIME": rng.integers(2003, 2019, rows).astype(str),
+            "GEO": np.array(self.countries)[rng.integers(0, len(self.countries), rows)],
+            "UNIT": rng.choice(["Euro", "Purchasing power standard (PPS)", "National currency"], rows),
+            "INDIC_IL": rng.choice(["Mean equivalised net income", "Median equivalised net income"], rows),
+            "CITIZEN": rng.choice(["EU28 countries except reporting country", "Reporting country", "Foreign country"], rows),
+            "SEX": rng.choice(["Total", "Males", "Females"], rows),
+            "AGE": rng.choice(["18 years or over", "From 18 to 64 years", "65 years or over"], rows),
+        })
+        return self.eurostat_export(path, df, rng.lognormal(9.5, 0.6, rows))
+
+    def tourism_export(self, path: str, rows: int) -> str:
+        """
+        Writes an export in the format of 'tour_occ_nim' (nights spent per month) with {rows} rows.
+        """
+        rng = np.random.default_rng([self.seed, 2])
+        df = pd.DataFrame({
+            "TIME": np.char.add(rng.integers(2012, 2020, rows).astype(str),
+                                np.char.add("M", np.char.zfill(rng.integers(1, 13, rows).astype(str), 2))),
+            "GEO": np.array(self.countries)[rng.integers(0, len(self.countries), rows)],
+            "C_RESID": rng.choice(["Total", "Foreign country", "Reporting country"], rows),
+            "UNIT": rng.choice(["Number", "Percentage change on same period of previous year"], rows),
+            "NACE_R2": rng.choice(["Hotels; holiday and other short-stay accommodation; camping grounds, recreational vehicle parks and trailer parks",
+                                   "Hotels and similar accommodation"], rows),
+        })
+        return self.eurostat_export(path, df, rng.lognormal(12.0, 1.5, rows))
+
+    def eurostat_export(self, path: str, df: pd.DataFrame, values: np.ndarray) -> str:
+        """
+        Adds the values the way Eurostat writes them ('2 127', ':' if missing, sometimes with a flag) and writes the file.
+        """
+        rng = np.random.default_rng([self.seed, len(df)])
+        rows = len(df)
+        # Spaces as thousands separator, e.g. '1 234 567'.
+        numbers = pd.Series(values.round().astype(np.int64)).map("{:,}".format).str.replace(",", " ")
+        missing = rng.random(rows) < 0.1
+        flags = np.where(rng.random(rows) < 0.05, rng.choice(["u", "e", "b"], rows), "")
+        attached = rng.random(rows) < 0.5  # Half of the flags are written next to the value, like in the exports.
+        df["Value"] = np.where(missing, ":", np.char.add(numbers.to_numpy().astype(str),
+                                                        np.where(attached & (flags != ""), np.char.add(" ", flags), "")))
+        df["Flag and Footnotes"] = np.where(attached | missing, "", flags)
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        df.to_csv(path, index=False, quoting=1)  # Every field quoted, like the exports.
+        return path
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description="Write synthetic GDELT and Eurostat exports.")
+    parser.add_argument("path", help="Directory to write the files to.")
+    parser.add_argument("--days", type=int, default=1, help="Number of GDELT exports, one per day from 2015-01-01.")
+    parser.add_argument("--rows", type=int, default=100000, help="Events per GDELT export.")
+    parser.add_argument("--eurostat-rows", type=int, default=10000, help="Rows of each Eurostat export.")
+    parser.add_argument("--updates", type=int, default=0,
+                        help="Number of GDELT 2.0 exports, one every 15 minutes from 2015-01-01 00:00, with 'lastupdate.txt'.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    data = SyntheticData(args.seed)
+    for path in data.gdelt_files(args.path, date(2015, 1, 1), args.days, args.rows):
+        print(path)
+    print(data.gdelt_index(args.path))
+    for path in data.gdelt_update_files(args.path, datetime(2015, 1, 1), args.updates, args.rows):
+        print(path)
+    print(data.income_export(os.path.join(args.path, "ilc_di15_1_Data.csv"), args.eurostat_rows))
+    print(data.tourism_export(os.path.join(args.path, "tour_occ_nim_1_Data.csv"), args.eurostat_rows))
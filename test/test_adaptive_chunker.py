@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from src.AdaptiveChunker import AdaptiveChunker
+
+from typing import List
+
+MB = 2 ** 20
+
+
+class FakeReader(object):
+    """
+    Stands in for the reader of 'pandas.read_csv' and hands out chunks of 1 KB per row, recording the requested sizes.
+    """
+
+    def __init__(self, rows: int):
+        self.remaining = rows
+        self.requested: List[int] = []
+
+    def get_chunk(self, size: int) -> pd.DataFrame:
+        if not self.remaining:
+            raise StopIteration
+        self.requested.append(size)
+        rows = min(size, self.remaining)
+        self.remaining -= rows
+        return pd.DataFrame({f"c{i}": np.zeros(rows, dtype=np.int64) for i in range(128)})
+
+
+class AdaptiveChunkerTest(unittest.TestCase):
+    """
+    Drives the chunker with fake readings of the resident memory, so the chosen chunk sizes are known exactly.
+    """
+
+    def setUp(self):
+        self.rss = 100 * MB
+        for name, value in [("memory_usage", lambda field="VmRSS": self.rss),
+                            ("reset_peak_memory_usage", lambda: True)]:
+            patcher = mock.patch(f"src.AdaptiveChunker.{name}", side_effect=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def chunker(self, **kwargs) -> AdaptiveChunker:
+        return AdaptiveChunker(1000 * MB, initial_rows=1000, min_rows=10, max_rows=10 ** 6, **kwargs)
+
+    def test_growth(self):
+        # A chunk of 1 MB with a peak of 4 MB above the baseline leaves room for far more rows than twice the chunk.
+        chunker = self.chunker()
+        chunker.adjust(1000, MB, 100 * MB, 104 * MB)
+        self.assertEqual(chunker.amplification, 4.0)
+        self.assertEqual(chunker.rows, 2000)
+
+        chunker.rows = 512000
+        chunker.adjust(512000, 500 * MB, 100 * MB, 2100 * MB)
+        # 750 MB are available, each row needs 4 KB at its peak.
+        self.assertEqual(chunker.rows, 750 * MB // (4 * 1024))
+
+    def test_amplification(self):
+        # A larger amplification is taken at once, a smaller one only slowly.
+        chunker = self.chunker()
+        chunker.adjust(1000, MB, 100 * MB, 102 * MB)
+        chunker.adjust(1000, MB, 100 * MB, 110 * MB)
+        self.assertEqual(chunker.amplification, 10.0)
+        chunker.adjust(1000, MB, 100 * MB, 100 * MB)
+        self.assertAlmostEqual(chunker.amplification, 0.7 * 10.0 + 0.3 * 1.0)
+
+    def test_over_budget(self):
+        chunker = self.chunker()
+        self.rss = 900 * MB
+        with self.assertLogs(level="WARNING"):
+            chunker.adjust(1000, MB, 100 * MB, 104 * MB)
+        self.assertEqual(chunker.rows, 10)
+
+    def test_chunks(self):
+        # Every chunk peaks at three times its size above the memory before it was read.
+        chunker = self.chunker()
+        reader = FakeReader(20000)
+        peaks = []
+        with mock.patch("src.AdaptiveChunker.peak_memory_usage", side_effect=lambda: peaks[-1]):
+            for df in chunker.chunks(reader):
+                peaks.append(self.rss + 3 * int(df.memory_usage(deep=True).sum()))
+
+        self.assertEqual(reader.requested, [1000, 2000, 4000, 8000, 16000])
+        self.assertAlmostEqual(chunker.amplification, 3.0)
+        self.assertEqual(chunker.file_peak, max(peaks))
+
+    def test_not_measured(self):
+        # Without /proc the chunks keep their size.
+        chunker = self.chunker()
+        reader = FakeReader(3500)
+        self.rss = None
+        with mock.patch("src.AdaptiveChunker.peak_memory_usage", return_value=None):
+            self.assertEqual([len(df) for df in chunker.chunks(reader)], [1000, 1000, 1000, 500])
+        self.assertIsNone(chunker.amplification)
+
+
+if __name__ == "__main__":
+    unittest.main()
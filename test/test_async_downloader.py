@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import unittest
+from hashlib import md5
+
+from src.AsyncGdeltDownloader import AsyncGdeltDownloader
+from test.LocalServer import LocalServer
+
+
+class AsyncGdeltDownloaderTest(unittest.TestCase):
+    """
+    Downloads an archive of three chunks from a local server, starting from different states of its '.part' file.
+    """
+
+    name = "20150101.export.CSV.zip"
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory(prefix="batadase_test_")
+        self.site_path = os.path.join(self.tmp.name, "site")
+        self.dl_path = os.path.join(self.tmp.name, "dl")
+        os.makedirs(self.site_path)
+        os.makedirs(self.dl_path)
+
+        self.data = os.urandom(3 * 1024 * 1024)
+        with open(os.path.join(self.site_path, self.name), "wb") as f:
+            f.write(self.data)
+        self.file_obj = {"file": self.name, "md5": md5(self.data).hexdigest(), "size": len(self.data) / 1e6}
+
+        self.server = LocalServer(self.site_path).__enter__()
+        self.downloader = AsyncGdeltDownloader((2015, 1, 1), (2015, 1, 1), url=self.server.url, dl_path=self.dl_path)
+        self.zip_path = os.path.join(self.dl_path, self.name)
+
+    def tearDown(self):
+        self.server.__exit__(None, None, None)
+        self.downloader.dl_dir.cleanup()
+        self.tmp.cleanup()
+
+    def write_part(self, data: bytes) -> None:
+        with open(self.zip_path + ".part", "wb") as f:
+            f.write(data)
+
+    def assert_downloaded(self, result) -> None:
+        self.assertEqual(result, [(self.file_obj, self.zip_path, True)])
+        with open(self.zip_path, "rb") as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertFalse(os.path.exists(self.zip_path + ".part"))
+
+    def test_download(self):
+        self.assert_downloaded(self.downloader.download_all([self.file_obj], self.dl_path, retries=0))
+        self.assertEqual(self.server.requests, [(self.name, None, 200)])
+
+    def test_resume(self):
+        self.write_part(self.data[:1024 * 1024])
+        self.assert_downloaded(self.downloader.download_all([self.file_obj], self.dl_path, retries=0))
+        self.assertEqual(self.server.requests, [(self.name, f"bytes={1024 * 1024}-", 206)])
+
+    def test_already_complete(self):
+        self.write_part(self.data)
+        self.assert_downloaded(self.downloader.download_all([self.file_obj], self.dl_path, retries=0))
+        self.assertEqual(self.server.requests, [(self.name, f"bytes={len(self.data)}-", 416)])
+
+    def test_truncated_archive(self):
+        with open(self.zip_path, "wb") as f:
+            f.write(self.data[:1000])
+        self.assert_downloaded(self.downloader.download_all([self.file_obj], self.dl_path, retries=0))
+        self.assertEqual(self.server.requests, [(self.name, None, 200)])
+
+    def test_misaligned_range(self):
+        # Appending a range that doesn't start at the end of the '.part' file would corrupt it.
+        self.server.range_shift = 1000
+        self.write_part(self.data[:1024 * 1024])
+        self.assert_downloaded(self.downloader.download_all([self.file_obj], self.dl_path, retries=0))
+        self.assertEqual(self.server.requests, [(self.name, f"bytes={1024 * 1024}-", 206), (self.name, None, 200)])
+
+    def test_md5_mismatch(self):
+        file_obj = dict(self.file_obj, md5="0" * 32)
+        self.write_part(self.data[:1024 * 1024])
+        result = self.downloader.download_all([file_obj], self.dl_path, retries=1)
+
+        self.assertEqual(result, [(file_obj, None, False)])
+        # The resumed file is corrupt, so the second attempt starts over.
+        self.assertEqual(self.server.requests, [(self.name, f"bytes={1024 * 1024}-", 206), (self.name, None, 200)])
+        self.assertEqual(os.listdir(self.dl_path), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
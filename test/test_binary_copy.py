@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import unittest
+from datetime import date
+
+import pandas as pd
+
+from src.BinaryCopyWriter import BinaryCopyWriter
+from src.GdeltIntegrator import GdeltIntegrator
+from test.DatabaseTestCase import DatabaseTestCase
+from test.SyntheticData import SyntheticData
+
+from typing import Dict, List, Tuple
+
+
+class BinaryCopyWriterTest(unittest.TestCase):
+    """
+    Encodes single columns, which have to be rejected where the server would reject them in the text format.
+    """
+
+    def encode(self, values: List, pg_type: str, dtype: str = None) -> Tuple:
+        payload, lengths = BinaryCopyWriter([pg_type])._encode_column(pd.Series(values, name="value", dtype=dtype), pg_type)
+        return payload.tobytes(), lengths.tolist()
+
+    def test_integers(self):
+        self.assertEqual(self.encode(["12", "", None], "smallint"), (b"\x00\x0c", [2, 0, 0]))
+        self.assertEqual(self.encode([1, None], "integer", dtype="Int16"), (b"\x00\x00\x00\x01", [4, 0]))
+        self.assertEqual(self.encode([3.0, -1.0], "bigint"), (b"\x00" * 7 + b"\x03" + b"\xff" * 8, [8, 8]))
+
+    def test_out_of_range(self):
+        for values in ([2.7, 70000], [70000], ["-40000"]):
+            with self.assertRaises(ValueError):
+                self.encode(values, "smallint")
+        with self.assertRaises(ValueError):
+            self.encode([1e40], "real")
+
+    def test_not_an_integer(self):
+        with self.assertRaises(ValueError):
+            self.encode([2.7], "integer")
+
+    def test_not_a_number(self):
+        with self.assertRaises(ValueError):
+            self.encode(["1", "GIN"], "smallint")
+        with self.assertRaises(ValueError):
+            self.encode(["1.5", "n/a"], "double precision")
+
+
+class CopyFormatTest(DatabaseTestCase):
+    """
+    Loads a synthetic export with binary and with text COPY, which have to store the same rows.
+    """
+
+    rows = 3000
+    table_names = ["data_management_fields", "event_geo", "actor1", "actor2", "event_action", "eventid_and_date",
+                   "event_rollup_daily", "event_rollup_monthly"]
+
+    def setUp(self):
+        super().setUp()
+        self.tmp = tempfile.TemporaryDirectory(prefix="batadase_test_")
+        self.path, = SyntheticData().gdelt_files(self.tmp.name, date(2015, 1, 1), 1, self.rows)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def load(self, integrator: GdeltIntegrator) -> Dict[str, List[Tuple]]:
+        integrator.insert_wrapper2(self.path, integrator.headers, "\t", self.table_names, chunksize=1000)
+        rows = {}
+        for table_name in self.table_names:
+            attribute_string = ','.join(integrator.tables[table_name]["attributes"])
+            rows[table_name] = self.query(f"SELECT {attribute_string} FROM {table_name} ORDER BY {attribute_string}")
+        return rows
+
+    def test_same_rows(self):
+        integrator = GdeltIntegrator((2015, 1, 1), (2015, 1, 1))
+        self.assertEqual(integrator.tables["event_action"]["copy_format"], "binary")
+        binary = self.load(integrator)
+
+        # The lookup tables are kept, so the codes get the same IDs. A new integrator has empty key caches.
+        self.execute(f"TRUNCATE {', '.join(self.table_names)}")
+        integrator = GdeltIntegrator((2015, 1, 1), (2015, 1, 1))
+        for table in integrator.tables.values():
+            table.pop("copy_format", None)
+        text = self.load(integrator)
+
+        for table_name in self.table_names:
+            self.assertTrue(binary[table_name], table_name)
+            self.assertEqual(binary[table_name], text[table_name], table_name)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+
+import unittest
+
+import psycopg2
+from psycopg2.pool import PoolError
+
+from src.DataIntegrator import DataIntegrator
+from test.DatabaseTestCase import DatabaseTestCase
+
+
+class ConnectionPoolTest(DatabaseTestCase):
+    """
+    Takes connections from the pool until it is exhausted and connects with a login the server rejects, which have to
+    raise different errors instead of handing out no connection.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.integrator = DataIntegrator([], {})
+        self.integrator.pool_size = 2
+        self.addCleanup(DataIntegrator.close_pools)
+
+    def test_reuse(self):
+        conn, cur = self.integrator.connect_database(dbname=self.database)
+        backend_pid = conn.info.backend_pid
+        self.integrator.release_connection(conn, cur)
+
+        conn, cur = self.integrator.connect_database(dbname=self.database)
+        self.assertEqual(conn.info.backend_pid, backend_pid)
+        self.integrator.release_connection(conn, cur)
+
+    def test_exhausted(self):
+        connections = [self.integrator.connect_database(dbname=self.database) for _ in range(2)]
+        with self.assertRaises(PoolError):
+            self.integrator.connect_database(dbname=self.database)
+
+        self.integrator.release_connection(*connections.pop())
+        conn, cur = self.integrator.connect_database(dbname=self.database)
+        cur.execute("SELECT 1")
+        self.integrator.release_connection(conn, cur)
+        self.integrator.release_connection(*connections.pop())
+
+    def test_rejected_login(self):
+        with self.assertRaises(psycopg2.OperationalError):
+            self.integrator.connect_database(dbname=self.database, user="batadase_no_such_user", passwd="wrong")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+
+import unittest
+
+import numpy as np
+
+from src.CorrelationAnalysis import CorrelationAnalysis
+from src.DataIntegrator import DataIntegrator
+from test.DatabaseTestCase import DatabaseTestCase
+
+from typing import List, Tuple
+
+
+class CorrelationAnalysisTest(DatabaseTestCase):
+    """
+    Correlates the events in Austria with tourist nights and income that are stored next to the rows of the other
+    residencies, units and citizenships, like in the Eurostat exports.
+    """
+
+    months = ["2015M01", "2015M02", "2015M03", "2015M04", "2015M05", "2015M06"]
+    total = [100, 200, 300, 250, 150, 400]
+
+    def setUp(self):
+        super().setUp()
+        accommodation = CorrelationAnalysis.tourist_defaults["Accommodation"]
+        # Foreign and local guests don't add up to the total, and the percentages are no nights at all.
+        other = {("Foreign country", "Number"): [90, 10, 200, 5, 100, 1],
+                 ("Reporting country", "Number"): [5, 500, 7, 300, 2, 9],
+                 ("Total", "Percentage change compared to same period in previous year"): [10, -5, 3, 99, -50, 0]}
+        rows = [("Austria", value, month, "Total", accommodation, "Number") for month, value in zip(self.months, self.total)]
+        rows += [("Austria", value, month, resid, accommodation, unit)
+                 for (resid, unit), values in other.items() for month, value in zip(self.months, values)]
+        rows += [("Austria", 1000, month, "Total", "Hotels and similar accommodation", "Number") for month in self.months]
+        self.insert("tourist", ["CID", "Value", "Time", "RESID", "Accommodation", "Unit"], rows)
+
+        self.insert("income", ["CID", "Value", "Unit", "Citizens", "AgeGroup", "Type", "Year", "Sex"], [
+            ("Austria", 25000, "Euro", "Reporting country", "18 years or over", "Mean equivalised net income", 2015, "Total"),
+            ("Austria", 18000, "Euro", "Foreign country", "18 years or over", "Mean equivalised net income", 2015, "Total"),
+            ("Austria", 23000, "Euro", "Reporting country", "18 years or over", "Median equivalised net income", 2015, "Total"),
+            ("Austria", 27000, "Purchasing power standard (PPS)", "Reporting country", "18 years or over",
+             "Mean equivalised net income", 2015, "Total")])
+
+        # Twice the nights plus ten events, which correlates perfectly without a lag.
+        self.execute("INSERT INTO cameo_eventcode (ID, Code) VALUES (1, '14')")
+        self.insert("event_rollup_monthly", ["MonthYear", "CountryCode", "EventRootCode", "SumAvgTone",
+                                             "SumGoldsteinScale", "NumArticles", "NumEvents"],
+                    [(201501 + i, "AU", 1, 0, 0, 0, 2 * value + 10) for i, value in enumerate(self.total)])
+
+    def insert(self, table_name: str, attributes: List[str], rows: List[Tuple]) -> None:
+        values = ", ".join(f"({', '.join(repr(value) for value in row)})" for row in rows)
+        self.execute(f"INSERT INTO {table_name} ({', '.join(attributes)}) VALUES {values}")
+
+    def test_defaults(self):
+        analysis = CorrelationAnalysis(DataIntegrator([], {}))
+        analysis.load()
+
+        self.assertEqual(analysis.countries, ["Austria"])
+        np.testing.assert_array_equal(analysis.tourism, [self.total])
+        np.testing.assert_array_equal(analysis.income[:, list(analysis.years).index(2015)], [25000])
+
+        result = analysis.events_vs_tourism(lags=[0]).set_index("lag")
+        self.assertAlmostEqual(result.loc[0, "r"], 1.0)
+        self.assertEqual(result.loc[0, "n"], len(self.months))
+
+    def test_filters(self):
+        # Given filters replace the defaults, without any every row is added up.
+        analysis = CorrelationAnalysis(DataIntegrator([], {}), tourist_filters={}, income_filters={"Unit": "Euro"})
+        analysis.load()
+
+        self.assertEqual(analysis.tourism[0, 0], 100 + 90 + 5 + 10 + 1000)
+        np.testing.assert_array_equal(analysis.income[:, list(analysis.years).index(2015)], [22000])
+        self.assertLess(analysis.events_vs_tourism(lags=[0])["r"].iloc[0], 0.99)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import unittest
+from hashlib import md5
+
+from src.GdeltDownloader import GdeltDownloader
+from test.LocalServer import LocalServer
+
+
+class GdeltDownloaderTest(unittest.TestCase):
+    """
+    Downloads an archive with 'download_file' from a local server, with broken files left by earlier runs.
+    """
+
+    name = "20150101.export.CSV.zip"
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory(prefix="batadase_test_")
+        self.site_path = os.path.join(self.tmp.name, "site")
+        self.dl_path = os.path.join(self.tmp.name, "dl")
+        os.makedirs(self.site_path)
+
+        self.data = os.urandom(2 * 1024 * 1024)
+        with open(os.path.join(self.site_path, self.name), "wb") as f:
+            f.write(self.data)
+        self.file_obj = {"file": self.name, "md5": md5(self.data).hexdigest(), "size": len(self.data) / 1e6}
+
+        self.server = LocalServer(self.site_path).__enter__()
+        self.downloader = GdeltDownloader((2015, 1, 1), (2015, 1, 1), url=self.server.url, dl_path=self.dl_path)
+        self.zip_path = os.path.join(self.dl_path, self.name)
+
+    def tearDown(self):
+        self.server.__exit__(None, None, None)
+        self.downloader.dl_dir.cleanup()
+        self.tmp.cleanup()
+
+    def write(self, path: str, data: bytes) -> None:
+        os.makedirs(self.dl_path, exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+
+    def assert_downloaded(self, result) -> None:
+        self.assertEqual(result, (self.zip_path, True))
+        with open(self.zip_path, "rb") as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertFalse(os.path.exists(self.zip_path + ".part"))
+
+    def test_download(self):
+        self.assert_downloaded(self.downloader.download_file(self.file_obj, self.dl_path, extract=False))
+        # The verified archive is used again without a request.
+        self.assert_downloaded(self.downloader.download_file(self.file_obj, self.dl_path, extract=False))
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_truncated_archive(self):
+        self.write(self.zip_path, self.data[:1000])
+        self.assert_downloaded(self.downloader.download_file(self.file_obj, self.dl_path, extract=False))
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_interrupted_download(self):
+        self.write(self.zip_path + ".part", self.data[:1000])
+        self.assert_downloaded(self.downloader.download_file(self.file_obj, self.dl_path, extract=False))
+
+    def test_md5_mismatch(self):
+        file_obj = dict(self.file_obj, md5="0" * 32)
+        with self.assertRaises(RuntimeError):
+            self.downloader.download_file(file_obj, self.dl_path, extract=False, retries=1)
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(os.listdir(self.dl_path), [])
+
+    def test_without_md5(self):
+        file_obj = dict(self.file_obj, md5=None)
+        self.assertEqual(self.downloader.download_file(file_obj, self.dl_path, extract=False), (self.zip_path, False))
+        self.assertEqual(self.downloader.download_file(file_obj, self.dl_path, extract=False), (self.zip_path, False))
+        self.assertEqual(len(self.server.requests), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,26 @@
+#!/usr/bin/env python3
+
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from src.IncomeIntegrator import IncomeIntegrator
+
+
+class EurostatTransformTest(unittest.TestCase):
+    """
+    Cleans the values of an income export the way Eurostat writes them.
+    """
+
+    def test_transform(self):
+        df = pd.DataFrame({"Value": ["2 127 u", ":", "1 000", "350 b", "12"],
+                           "Flags": ["", "", "(1)", "e", None]})
+        df = IncomeIntegrator().transform(df)
+
+        np.testing.assert_array_equal(df["Value"].to_numpy(dtype=float), [2127, np.nan, 1000, 350, 12])
+        self.assertEqual(df["Flags"].tolist(), ["u", pd.NA, "(1)", "e b", pd.NA])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import unittest
+from datetime import date
+from unittest import mock
+
+from src.DataIntegrator import DataIntegrator
+from src.FanoutWriter import FanoutWriter
+from src.GdeltIntegrator import GdeltIntegrator
+from test.DatabaseTestCase import DatabaseTestCase
+from test.LocalServer import LocalServer
+from test.SyntheticData import SyntheticData
+
+from typing import List, Dict, Tuple
+
+
+class FanoutTest(DatabaseTestCase):
+    """
+    Loads synthetic daily exports from a local server with 'fanout=True' and recovers the prepared tables of loads
+    that crashed before and after the ledger decided their outcome.
+    """
+
+    days = 2
+    rows = 3000
+    table_names = ["data_management_fields", "event_geo", "actor1", "actor2", "event_action", "eventid_and_date",
+                   "event_rollup_daily", "event_rollup_monthly"]
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.tmp = tempfile.TemporaryDirectory(prefix="batadase_test_")
+        site_path = os.path.join(cls.tmp.name, "site")
+        data = SyntheticData()
+        cls.files = [{"file": os.path.basename(path), "md5": data.md5sum(path), "size": os.path.getsize(path) / 1e6}
+                     for path in data.gdelt_files(site_path, date(2015, 1, 1), cls.days, cls.rows)]
+        cls.server = LocalServer(site_path).__enter__()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.__exit__(None, None, None)
+        cls.tmp.cleanup()
+        super().tearDownClass()
+
+    def integrate(self, files: List[Dict]) -> Tuple[GdeltIntegrator, List[Dict]]:
+        dl_path = tempfile.mkdtemp(prefix="dl_", dir=self.tmp.name)
+        integrator = GdeltIntegrator((2015, 1, 1), (2015, 1, self.days), url=self.server.url, dl_path=dl_path,
+                                     fanout=True)
+        return integrator, integrator.integrate_files(files, table_names=self.table_names)
+
+    def prepared(self) -> int:
+        return self.query("SELECT count(*) FROM pg_prepared_xacts WHERE database = current_database()")[0][0]
+
+    def test_fanout(self):
+        integrator, results = self.integrate(self.files)
+
+        self.assertEqual([result["error"] for result in results], [None] * self.days)
+        self.assertEqual(self.count("eventid_and_date"), self.days * self.rows)
+        self.assertEqual(self.count("event_action"), self.days * self.rows)
+        self.assertEqual(self.query("SELECT count(*), count(DISTINCT Gtrid) FROM ingest_ledger"),
+                         [(self.days * len(self.table_names), self.days)])
+        self.assertEqual(self.prepared(), 0)
+
+    def test_recover_after_ledger(self):
+        # The process dies after the ledger committed, before the branches are committed. It would not load another
+        # file, the prepared branches hold the locks of the rollup rows.
+        with mock.patch.object(FanoutWriter, "commit", lambda writer: writer.unresolved.update(writer.connections)):
+            integrator, results = self.integrate(self.files[:1])
+        self.assertEqual([result["error"] for result in results], [None])
+        self.assertEqual(self.count("event_action"), 0)
+        self.assertEqual(self.prepared(), len(self.table_names))
+
+        self.assertEqual(integrator.recover_prepared(min_age=0), {"committed": len(self.table_names), "rolled_back": 0})
+        self.assertEqual(self.count("event_action"), self.rows)
+        self.assertEqual(self.prepared(), 0)
+
+    def test_recover_before_ledger(self):
+        # The process dies after the branches are prepared, before the ledger committed.
+        def crash(*args, **kwargs):
+            raise RuntimeError("crash")
+
+        with mock.patch.object(DataIntegrator, "record_ledger", crash), \
+                mock.patch.object(FanoutWriter, "rollback", lambda writer: writer.unresolved.update(writer.connections)):
+            integrator, results = self.integrate(self.files[:1])
+        self.assertIsNotNone(results[0]["error"])
+        self.assertEqual(self.prepared(), len(self.table_names))
+
+        self.assertEqual(integrator.recover_prepared(min_age=0), {"committed": 0, "rolled_back": len(self.table_names)})
+        self.assertEqual(self.count("event_action"), 0)
+        self.assertEqual(self.count("ingest_ledger"), 0)
+        self.assertEqual(self.prepared(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import time
+import unittest
+from datetime import date
+
+from src.GdeltDownloader import GdeltDownloader
+from test.LocalServer import LocalServer
+from test.SyntheticData import SyntheticData
+
+from typing import List, Tuple
+
+
+class FileIndexTest(unittest.TestCase):
+    """
+    Selects the exports of a date range from the index page of a local server with five daily exports, which is cached
+    in the download directory and only requested again if it ends before the end date.
+    """
+
+    days = ["20150101", "20150102", "20150103", "20150104", "20150105"]
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory(prefix="batadase_test_")
+        self.addCleanup(self.tmp.cleanup)
+        self.site_path = os.path.join(self.tmp.name, "site")
+        self.dl_path = os.path.join(self.tmp.name, "dl")
+        self.data = SyntheticData()
+        self.data.gdelt_files(self.site_path, date(2015, 1, 1), len(self.days), 10)
+        self.data.gdelt_index(self.site_path)
+        self.server = LocalServer(self.site_path).__enter__()
+        self.addCleanup(self.server.__exit__, None, None, None)
+
+    def links(self, start_date: Tuple[int, int, int], end_date: Tuple[int, int, int], refresh: bool = False) -> List[str]:
+        downloader = GdeltDownloader(start_date, end_date, url=self.server.url, dl_path=self.dl_path)
+        try:
+            return [link["file"].split(".")[0] for link in downloader.get_file_links(refresh=refresh)]
+        finally:
+            downloader.dl_dir.cleanup()
+
+    def index_requests(self) -> List[int]:
+        return [status for path, byte_range, status in self.server.requests if path == ""]
+
+    def test_range_edges(self):
+        self.assertEqual(self.links((2015, 1, 1), (2015, 1, 5)), self.days)
+        self.assertEqual(self.links((2015, 1, 3), (2015, 1, 3)), ["20150103"])
+        self.assertEqual(self.links((2014, 12, 1), (2015, 1, 1)), ["20150101"])
+        self.assertEqual(self.links((2015, 1, 5), (2015, 1, 9)), ["20150105"])
+        self.assertEqual(self.links((2015, 1, 6), (2015, 1, 9)), [])
+        self.assertEqual(self.links((2014, 12, 1), (2014, 12, 31)), [])
+
+    def test_not_modified(self):
+        self.assertEqual(self.links((2015, 1, 1), (2015, 1, 5)), self.days)
+        # The cache covers the range, so the page isn't requested.
+        self.assertEqual(self.links((2015, 1, 2), (2015, 1, 4)), self.days[1:4])
+        self.assertEqual(self.index_requests(), [200])
+
+        # It ends before the end date, the unchanged page is answered with 304 and the cache is used.
+        self.assertEqual(self.links((2015, 1, 4), (2015, 1, 9)), self.days[3:])
+        self.assertEqual(self.index_requests(), [200, 304])
+
+    def test_changed_index(self):
+        self.assertEqual(self.links((2015, 1, 1), (2015, 1, 9)), self.days)
+
+        # An export of the next day is published, the page is newer than the cached one.
+        self.data.gdelt_files(self.site_path, date(2015, 1, 6), 1, 10)
+        path = self.data.gdelt_index(self.site_path)
+        os.utime(path, (time.time() + 10, time.time() + 10))
+
+        self.assertEqual(self.links((2015, 1, 5), (2015, 1, 9)), ["20150105", "20150106"])
+        self.assertEqual(self.index_requests(), [200, 200])
+        # The new page is cached with its validators.
+        self.assertEqual(self.links((2015, 1, 1), (2015, 1, 6), refresh=True), self.days + ["20150106"])
+        self.assertEqual(self.index_requests(), [200, 200, 304])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import unittest
+from datetime import date, datetime
+from unittest import mock
+
+from src.GdeltFollower import GdeltFollower
+from src.GdeltIntegrator import GdeltIntegrator
+from test.DatabaseTestCase import DatabaseTestCase
+from test.LocalServer import LocalServer
+from test.SyntheticData import SyntheticData
+
+from typing import List
+
+
+class GdeltFollowerTest(DatabaseTestCase):
+    """
+    Follows synthetic feeds from a local server: four GDELT 2.0 exports 15 minutes apart with their 'lastupdate.txt'
+    and three daily GDELT 1.0 exports with their index page.
+    """
+
+    rows = 1000
+    updates = ["20150101000000", "20150101001500", "20150101003000", "20150101004500"]
+    days = ["20150101", "20150102", "20150103"]
+    table_names = ["data_management_fields", "event_geo", "actor1", "actor2", "event_action", "eventid_and_date",
+                   "event_rollup_daily", "event_rollup_monthly"]
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.tmp = tempfile.TemporaryDirectory(prefix="batadase_test_")
+        site_path = os.path.join(cls.tmp.name, "site")
+        data = SyntheticData()
+        data.gdelt_update_files(os.path.join(site_path, "gdeltv2"), datetime(2015, 1, 1), len(cls.updates), cls.rows)
+        data.gdelt_files(os.path.join(site_path, "events"), date(2015, 1, 1), len(cls.days), cls.rows)
+        data.gdelt_index(os.path.join(site_path, "events"))
+        cls.server = LocalServer(site_path).__enter__()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.__exit__(None, None, None)
+        cls.tmp.cleanup()
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+        self.server.requests.clear()
+
+    def follower(self, gdelt_version: int = 2, **kwargs) -> GdeltFollower:
+        dl_path = tempfile.mkdtemp(prefix="dl_", dir=self.tmp.name)
+        feed = {1: "events/", 2: "gdeltv2/"}[gdelt_version]
+        integrator = GdeltIntegrator((2015, 1, 1), (2015, 1, 1), url=self.server.url + feed, dl_path=dl_path,
+                                     gdelt_version=gdelt_version)
+        return GdeltFollower(integrator, self.table_names, poll_interval=0.01, **kwargs)
+
+    def downloads(self) -> List[str]:
+        return [path.split("/")[-1].split(".")[0] for path, byte_range, status in self.server.requests
+                if path.endswith(".export.CSV.zip")]
+
+    def test_first_poll(self):
+        # Without a mark the 15 minute feed starts at its newest export.
+        follower = self.follower()
+        results = follower.poll()
+
+        self.assertEqual([(result["file"], result["error"]) for result in results],
+                         [("20150101004500.export.CSV.zip", None)])
+        self.assertEqual(follower.watermark(), self.updates[-1])
+        self.assertEqual(self.count("eventid_and_date"), self.rows)
+        self.assertEqual(follower.poll(), [])
+
+    def test_gap(self):
+        # The exports between the mark and the newest one are derived from their timestamps.
+        follower = self.follower()
+        follower.set_watermark(self.updates[0])
+        with mock.patch.object(follower.integrator, "load_ledger", wraps=follower.integrator.load_ledger) as load_ledger:
+            results = follower.poll()
+
+        self.assertEqual([result["error"] for result in results], [None] * 3)
+        self.assertEqual(self.downloads(), self.updates[1:])
+        # The ledger is only read for the candidates, not scanned.
+        load_ledger.assert_called_once_with([f"{key}.export.CSV.zip" for key in self.updates[1:]])
+        self.assertEqual(follower.watermark(), self.updates[-1])
+        self.assertEqual(self.count("eventid_and_date"), 3 * self.rows)
+
+    def test_missing_export(self):
+        # The mark stops before an export that can't be loaded, until it is given up on.
+        missing = os.path.join(self.server.path, "gdeltv2", f"{self.updates[2]}.export.CSV.zip")
+        os.rename(missing, missing + ".hidden")
+        self.addCleanup(os.rename, missing + ".hidden", missing)
+        follower = self.follower(max_retries=2)
+        follower.set_watermark(self.updates[0])
+
+        results = follower.poll()
+        self.assertEqual([result["file"] for result in results if result["error"]],
+                         [f"{self.updates[2]}.export.CSV.zip"])
+        self.assertEqual(follower.watermark(), self.updates[1])
+        self.assertEqual(self.count("eventid_and_date"), 2 * self.rows)
+
+        self.server.requests.clear()
+        results = follower.poll()
+        # The export after the missing one is in the ledger already.
+        self.assertEqual(self.downloads(), [self.updates[2]])
+        self.assertEqual(len(results), 1)
+        self.assertEqual(follower.watermark(), self.updates[-1])
+        self.assertEqual(follower.failures, {})
+
+    def test_daily_feed(self):
+        # Without a mark the daily feed starts at the start date of the integrator.
+        follower = self.follower(gdelt_version=1)
+        self.assertEqual(follower.follow(max_polls=2), len(self.days))
+
+        self.assertEqual(self.downloads(), self.days)
+        self.assertEqual(follower.watermark(), self.days[-1])
+        self.assertEqual(self.count("eventid_and_date"), len(self.days) * self.rows)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+
+import tempfile
+import unittest
+from datetime import date
+
+import psycopg2
+
+from src.GdeltIntegrator import GdeltIntegrator
+from src.LoadPhaseManager import LoadPhaseManager
+from test.DatabaseTestCase import DatabaseTestCase
+from test.SyntheticData import SyntheticData
+
+from typing import Set
+
+
+class LoadPhaseManagerTest(DatabaseTestCase):
+    """
+    Drops the indexes and constraints around the load of a synthetic export and rebuilds them, also after a run that
+    was interrupted. The test schema has no foreign keys and indexes besides the keys, so a few are added.
+    """
+
+    rows = 1000
+    table_names = ["data_management_fields", "event_geo", "actor1", "actor2", "event_action", "eventid_and_date",
+                   "event_rollup_daily", "event_rollup_monthly"]
+    extra = {"actor1_adm1code_fkey": "ALTER TABLE actor1 ADD CONSTRAINT actor1_adm1code_fkey FOREIGN KEY (ADM1Code) REFERENCES event_geo (ADM1Code)",
+             "event_action_actor1code": "CREATE INDEX event_action_actor1code ON event_action (Actor1Code)",
+             "eventid_and_date_day": "CREATE INDEX eventid_and_date_day ON eventid_and_date (Day)"}
+    # The keys 'move_staged' and 'flush_rollup' need.
+    kept = {"event_geo_pkey", "actor1_pkey", "actor2_pkey", "eventid_and_date_pkey", "event_rollup_daily_pkey",
+            "event_rollup_monthly_pkey"}
+
+    def setUp(self):
+        super().setUp()
+        self.tmp = tempfile.TemporaryDirectory(prefix="batadase_test_")
+        self.addCleanup(self.tmp.cleanup)
+        self.path, = SyntheticData().gdelt_files(self.tmp.name, date(2015, 1, 1), 1, self.rows)
+        # Partitions of earlier tests would get their own copy of the index, so the months start from scratch.
+        for table_name in ["event_action", "eventid_and_date"]:
+            for partition, in self.query("SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = %s::regclass",
+                                         (table_name,)):
+                self.execute(f"DROP TABLE {partition}")
+
+        for statement in self.extra.values():
+            self.execute(statement)
+        self.addCleanup(self.execute, "ALTER TABLE actor1 DROP CONSTRAINT IF EXISTS actor1_adm1code_fkey; "
+                                      "DROP INDEX IF EXISTS event_action_actor1code; DROP INDEX IF EXISTS eventid_and_date_day")
+        self.integrator = GdeltIntegrator((2015, 1, 1), (2015, 1, 1))
+        self.manager = LoadPhaseManager(self.integrator, self.table_names)
+        self.before = self.objects()
+
+    def objects(self) -> Set[str]:
+        """
+        Returns the names of the keys, foreign keys and valid indexes of the tables, foreign keys only once validated.
+        """
+        constraints = self.query("SELECT conname FROM pg_constraint WHERE conrelid::regclass::text = ANY(%s) "
+                                 "AND contype IN ('f', 'p', 'u') AND convalidated", (self.table_names,))
+        indexes = self.query("SELECT x.relname FROM pg_index i JOIN pg_class x ON x.oid = i.indexrelid "
+                             "WHERE i.indrelid::regclass::text = ANY(%s) AND i.indisvalid", (self.table_names,))
+        return {name for name, in constraints + indexes}
+
+    def load(self) -> None:
+        self.integrator.insert_wrapper2(self.path, self.integrator.headers, "\t", self.table_names, chunksize=500)
+
+    def assert_restored(self) -> None:
+        self.assertEqual(self.objects(), self.before)
+        self.assertEqual(self.manager.pending(), {})
+        # The index of the partitioned table is rebuilt for its partitions as well.
+        self.assertTrue(self.query("SELECT 1 FROM pg_index i JOIN pg_inherits h ON h.inhrelid = i.indrelid "
+                                   "WHERE h.inhparent = 'event_action'::regclass AND i.indisvalid"))
+
+    def test_bulk_load(self):
+        self.assertTrue(set(self.extra) | self.kept | {"data_management_fields_pkey"} <= self.before)
+        with self.manager.bulk_load():
+            self.assertEqual(self.objects(), self.kept)
+            self.load()
+        self.assert_restored()
+        self.assertEqual(self.count("eventid_and_date"), self.rows)
+
+    def test_interrupted(self):
+        # The run stops after the load, the next one finds the definitions and rebuilds them.
+        self.manager.drop()
+        self.load()
+        manager = LoadPhaseManager(GdeltIntegrator((2015, 1, 1), (2015, 1, 1)), self.table_names)
+        self.assertEqual(set(sum(manager.pending().values(), [])), self.before - self.kept)
+        self.assertEqual(manager.drop(), 0)
+        self.assertEqual(manager.rebuild(), len(self.before - self.kept))
+        self.assert_restored()
+
+    def test_invalid_foreign_key(self):
+        # A row without its key stops the rebuild at the validation, which is resumed once the row is fixed.
+        self.manager.drop()
+        self.load()
+        self.execute("INSERT INTO actor1 (Code, ADM1Code) VALUES ('batadase_test', 'no_such_region')")
+        with self.assertRaises(psycopg2.errors.ForeignKeyViolation):
+            self.manager.rebuild()
+        self.assertEqual(self.manager.pending(), {"actor1": ["actor1_adm1code_fkey"]})
+        self.assertEqual(self.objects(), self.before - {"actor1_adm1code_fkey"})
+
+        self.execute("DELETE FROM actor1 WHERE Code = 'batadase_test'")
+        self.manager.rebuild()
+        self.assert_restored()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import unittest
+from datetime import date
+from unittest import mock
+
+from src.DataIntegrator import DataIntegrator
+from src.GdeltIntegrator import GdeltIntegrator
+from test.DatabaseTestCase import DatabaseTestCase
+from test.LocalServer import LocalServer
+from test.SyntheticData import SyntheticData
+
+from typing import List, Dict
+
+
+class ParallelLoadTest(DatabaseTestCase):
+    """
+    Loads synthetic daily exports from a local server with every load path. Their locations and actors repeat, so
+    concurrent loads merge the same keys into the dimension tables at the same time, over several chunks per file.
+    """
+
+    days = 8
+    rows = 5000
+    chunksize = 1000
+    table_names = ["data_management_fields", "event_geo", "actor1", "actor2", "event_action", "eventid_and_date",
+                   "event_rollup_daily", "event_rollup_monthly"]
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.tmp = tempfile.TemporaryDirectory(prefix="batadase_test_")
+        site_path = os.path.join(cls.tmp.name, "site")
+        data = SyntheticData()
+        cls.files = [{"file": os.path.basename(path), "md5": data.md5sum(path), "size": os.path.getsize(path) / 1e6}
+                     for path in data.gdelt_files(site_path, date(2015, 1, 1), cls.days, cls.rows)]
+        cls.server = LocalServer(site_path).__enter__()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.__exit__(None, None, None)
+        cls.tmp.cleanup()
+        super().tearDownClass()
+
+    def integrator(self, **kwargs) -> GdeltIntegrator:
+        dl_path = tempfile.mkdtemp(prefix="dl_", dir=self.tmp.name)
+        return GdeltIntegrator((2015, 1, 1), (2015, 1, self.days), url=self.server.url, dl_path=dl_path,
+                               chunksize=self.chunksize, **kwargs)
+
+    def assert_loaded(self, results: List[Dict]) -> None:
+        self.assertEqual(sorted((result["file"], result["error"]) for result in results),
+                         [(file["file"], None) for file in self.files])
+        self.assertEqual(self.count("eventid_and_date"), self.days * self.rows)
+        self.assertEqual(self.count("event_action"), self.days * self.rows)
+        # Events without a country or root code are in no group.
+        self.assertEqual(self.query("SELECT sum(NumEvents) FROM event_rollup_daily"),
+                         self.query("SELECT sum(NumEvents) FROM event_rollup_monthly"))
+        self.assertEqual(self.query("SELECT count(DISTINCT File) FROM ingest_ledger")[0][0], self.days)
+
+    def test_serial(self):
+        self.assert_loaded(self.integrator().integrate_files(self.files, table_names=self.table_names))
+
+    def test_process_pool(self):
+        self.assert_loaded(self.integrator().integrate_files(self.files, max_workers=2, table_names=self.table_names))
+
+    def test_pipeline(self):
+        self.assert_loaded(self.integrator().integrate_files(self.files, table_names=self.table_names,
+                                                             pipeline={"download": 2, "parse": 2, "load": 2}))
+
+    def test_failed_file(self):
+        # The keys of the dimension tables are committed on their own, everything else is rolled back with the file.
+        with mock.patch.object(DataIntegrator, "record_ledger", side_effect=RuntimeError("crash")):
+            results = self.integrator().integrate_files(self.files[:1], table_names=self.table_names)
+        self.assertIsNotNone(results[0]["error"])
+        self.assertEqual([self.count(table_name) for table_name in ["eventid_and_date", "event_action",
+                                                                     "event_rollup_daily", "ingest_ledger"]], [0] * 4)
+        dimensions = {table_name: self.count(table_name) for table_name in ["event_geo", "actor1", "actor2"]}
+        self.assertTrue(all(dimensions.values()))
+
+        results = self.integrator().integrate_files(self.files[:1], table_names=self.table_names)
+        self.assertEqual(results[0]["error"], None)
+        self.assertEqual(self.count("eventid_and_date"), self.rows)
+        self.assertEqual({table_name: self.count(table_name) for table_name in dimensions}, dimensions)
+
+    def test_pipeline_async_download(self):
+        self.server.requests.clear()
+        integrator = self.integrator(async_download=True)
+        self.assert_loaded(integrator.integrate_files(self.files, table_names=self.table_names,
+                                                      pipeline={"download": 3, "parse": 2, "load": 2}))
+        self.assertEqual(sorted(path for path, byte_range, status in self.server.requests),
+                         sorted(file["file"] for file in self.files))
+
+    def test_pipeline_memory_budget(self):
+        # The budget is only applied to the other load paths, the pipeline reads chunks of {chunksize}.
+        integrator = self.integrator(memory_budget=2 ** 30)
+        with self.assertLogs(level="WARNING") as logs:
+            self.assert_loaded(integrator.integrate_files(self.files, table_names=self.table_names,
+                                                          pipeline={"download": 2, "parse": 2, "load": 2}))
+        self.assertTrue(any("memory budget isn't applied in the pipeline" in line for line in logs.output))
+        self.assertIsNotNone(integrator.chunker)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import unittest
+from datetime import datetime
+
+from src.GdeltIntegrator import GdeltIntegrator
+from test.DatabaseTestCase import DatabaseTestCase
+from test.LocalServer import LocalServer
+from test.SyntheticData import SyntheticData
+
+
+class ParquetCacheTest(DatabaseTestCase):
+    """
+    Loads synthetic GDELT 2.0 exports from a local server through the Parquet cache, then rebuilds the tables from the
+    cache alone.
+    """
+
+    exports = 3
+    rows = 2000
+    table_names = ["data_management_fields", "event_geo", "actor1", "actor2", "event_action", "eventid_and_date",
+                   "event_rollup_daily", "event_rollup_monthly"]
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.tmp = tempfile.TemporaryDirectory(prefix="batadase_test_")
+        site_path = os.path.join(cls.tmp.name, "site")
+        data = SyntheticData()
+        cls.files = [{"file": os.path.basename(path), "md5": data.md5sum(path), "size": os.path.getsize(path) / 1e6}
+                     for path in data.gdelt_update_files(site_path, datetime(2015, 1, 1), cls.exports, cls.rows)]
+        cls.server = LocalServer(site_path).__enter__()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.__exit__(None, None, None)
+        cls.tmp.cleanup()
+        super().tearDownClass()
+
+    def test_gdelt_version_2(self):
+        cache_path = os.path.join(self.tmp.name, "cache")
+        dl_path = tempfile.mkdtemp(prefix="dl_", dir=self.tmp.name)
+        integrator = GdeltIntegrator((2015, 1, 1), (2015, 1, 1), url=self.server.url, dl_path=dl_path,
+                                     parquet_cache=cache_path, gdelt_version=2)
+
+        results = integrator.integrate_files(self.files, table_names=self.table_names)
+        self.assertEqual([result["error"] for result in results], [None] * self.exports)
+        self.assertEqual(integrator.cache.keys(), [file["file"].split(".")[0] for file in self.files])
+        loaded = self.query("SELECT min(DATEADDED), max(DATEADDED), count(*) FROM data_management_fields")
+        self.assertEqual(loaded, [(20150101, 20150101, self.exports * self.rows)])
+
+        self.execute("TRUNCATE data_management_fields, event_action, eventid_and_date, event_rollup_daily, "
+                     "event_rollup_monthly, ingest_ledger")
+        results = integrator.rebuild_from_cache(table_names=self.table_names)
+        self.assertEqual([result["error"] for result in results], [None] * self.exports)
+        self.assertEqual(self.query("SELECT min(DATEADDED), max(DATEADDED), count(*) FROM data_management_fields"),
+                         loaded)
+        self.assertEqual(self.count("event_action"), self.exports * self.rows)
+
+
+if __name__ == "__main__":
+    unittest.main()
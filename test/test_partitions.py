@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+
+import tempfile
+import unittest
+from datetime import date
+
+from src.GdeltIntegrator import GdeltIntegrator
+from test.DatabaseTestCase import DatabaseTestCase
+from test.SyntheticData import SyntheticData
+
+
+class PartitionTest(DatabaseTestCase):
+    """
+    Creates and detaches the monthly partitions of 'event_action' and 'eventid_and_date', and loads a synthetic export
+    row by row into the partitioned tables.
+    """
+
+    rows = 200
+
+    def setUp(self):
+        super().setUp()
+        # The partitions of earlier tests are dropped, so every test starts without any.
+        for table_name in ["event_action", "eventid_and_date"]:
+            for partition, in self.query("SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = %s::regclass",
+                                         (table_name,)):
+                self.execute(f"DROP TABLE {partition}")
+        self.integrator = GdeltIntegrator((2015, 1, 1), (2015, 1, 1))
+
+    def bounds(self, table_name: str):
+        return self.query("SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits h "
+                          "JOIN pg_class c ON c.oid = h.inhrelid WHERE h.inhparent = %s::regclass ORDER BY 1", (table_name,))
+
+    def test_ensure_partitions(self):
+        self.integrator.ensure_partitions("eventid_and_date", [201512, "201601", 201512])
+        self.assertEqual(self.bounds("eventid_and_date"), [
+            ("eventid_and_date_201512", "FOR VALUES FROM (201512) TO (201601)"),
+            ("eventid_and_date_201601", "FOR VALUES FROM (201601) TO (201602)")])
+
+        # Another integrator finds the partitions instead of creating them again.
+        integrator = GdeltIntegrator((2015, 1, 1), (2015, 1, 1))
+        integrator.ensure_partitions("eventid_and_date", [201601, 201602])
+        self.assertEqual(integrator.list_partitions("eventid_and_date"), [201512, 201601, 201602])
+        self.assertEqual(self.integrator.list_partitions("event_action"), [])
+
+    def test_detach_partitions(self):
+        self.integrator.ensure_partitions("eventid_and_date", [201511, 201512, 201601])
+        self.execute("INSERT INTO eventid_and_date (GlobalEventID, MonthYear) VALUES (1, 201511), (2, 201512), (3, 201601)")
+
+        self.assertEqual(self.integrator.detach_partitions("eventid_and_date", 201601),
+                         ["eventid_and_date_201511", "eventid_and_date_201512"])
+        self.assertEqual(self.integrator.list_partitions("eventid_and_date"), [201601])
+        self.assertEqual(self.query("SELECT GlobalEventID FROM eventid_and_date"), [(3,)])
+        # The detached tables keep their rows.
+        self.assertEqual(self.count("eventid_and_date_201511"), 1)
+        self.execute("DROP TABLE eventid_and_date_201511, eventid_and_date_201512")
+
+        # A detached month gets a new partition when it is loaded again.
+        self.integrator.ensure_partitions("eventid_and_date", [201512])
+        self.assertEqual(self.integrator.list_partitions("eventid_and_date"), [201512, 201601])
+
+    def test_row_path(self):
+        # The row by row path creates the partitions of the months and skips the events it loaded before.
+        with tempfile.TemporaryDirectory(prefix="batadase_test_") as tmp:
+            path, = SyntheticData().gdelt_files(tmp, date(2015, 1, 1), 1, self.rows, zip_files=False)
+            for _ in range(2):
+                self.integrator.insert_wrapper(path, self.integrator.headers, "\t", ["event_geo", "eventid_and_date"])
+
+        self.assertEqual(self.count("eventid_and_date"), self.rows)
+        months = [month for month, in self.query("SELECT DISTINCT MonthYear FROM eventid_and_date ORDER BY 1")]
+        self.assertGreater(len(months), 1)
+        self.assertEqual(self.integrator.list_partitions("eventid_and_date"), months)
+        self.assertEqual(self.query("SELECT count(*) = count(DISTINCT ADM1Code) FROM event_geo"), [(True,)])
+
+
+if __name__ == "__main__":
+    unittest.main()
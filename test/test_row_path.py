@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+
+import tempfile
+import unittest
+from datetime import date
+
+from src.GdeltIntegrator import GdeltIntegrator
+from test.Benchmark import Benchmark
+from test.DatabaseTestCase import DatabaseTestCase
+from test.SyntheticData import SyntheticData
+
+from typing import Dict, List, Tuple
+
+
+class RowPathTest(DatabaseTestCase):
+    """
+    Loads a synthetic export row by row ('insert_wrapper') and with COPY ('insert_wrapper2'), which have to store the
+    same rows in the tables of the row path.
+    """
+
+    rows = 300
+    table_names = Benchmark.row_tables
+
+    def setUp(self):
+        super().setUp()
+        self.tmp = tempfile.TemporaryDirectory(prefix="batadase_test_")
+        self.addCleanup(self.tmp.cleanup)
+        self.path, = SyntheticData().gdelt_files(self.tmp.name, date(2015, 1, 1), 1, self.rows, zip_files=False)
+
+    def stored(self, integrator: GdeltIntegrator) -> Dict[str, List[Tuple]]:
+        rows = {}
+        for table_name in self.table_names:
+            attribute_string = ','.join(integrator.tables[table_name]["attributes"])
+            rows[table_name] = self.query(f"SELECT {attribute_string} FROM {table_name} ORDER BY {attribute_string}")
+        return rows
+
+    def test_same_rows(self):
+        # The lookup tables are kept, so the codes get the same IDs. A new integrator has empty key caches.
+        integrator = GdeltIntegrator((2015, 1, 1), (2015, 1, 1))
+        integrator.insert_wrapper2(self.path, integrator.headers, "\t", self.table_names)
+        copied = self.stored(integrator)
+
+        self.execute(f"TRUNCATE {', '.join(self.table_names)}")
+        integrator = GdeltIntegrator((2015, 1, 1), (2015, 1, 1))
+        integrator.insert_wrapper(self.path, integrator.headers, "\t", self.table_names)
+        inserted = self.stored(integrator)
+
+        for table_name in self.table_names:
+            self.assertTrue(copied[table_name], table_name)
+            self.assertEqual(copied[table_name], inserted[table_name], table_name)
+
+    def test_rollup(self):
+        integrator = GdeltIntegrator((2015, 1, 1), (2015, 1, 1))
+        with self.assertRaises(ValueError):
+            integrator.insert_wrapper(self.path, integrator.headers, "\t", ["event_rollup_daily"])
+
+
+if __name__ == "__main__":
+    unittest.main()